@@ -0,0 +1,288 @@
+"""
+Asyncio serving path: the web app as an ASGI application.
+
+``--serve --asgi`` runs the app on an event loop (under uvicorn) instead of
+Werkzeug's thread-per-request server. The event loop only ever waits:
+
+* ``POST /fetch-url`` is handled natively with ``AsyncRemoteFetcher``, so
+  fetches beyond its concurrency limits wait as coroutines instead of
+  taking server threads;
+* every other request goes to the Flask app unchanged, run on a thread pool
+  (``workers`` threads) so rendering never stalls the loop. Streamed
+  responses, such as ``/export-batch``, are pulled from that pool in pieces
+  of ``STREAM_BYTES``; files sent through ``wsgi.file_wrapper`` are read
+  directly in pieces of that size.
+
+Exports therefore keep their threads no matter how many fetches are
+waiting. uvicorn is optional: ``pip install uvicorn``.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+from async_fetch import AsyncRemoteFetcher
+from http_cache import MIN_COMPRESS_BYTES, compress, negotiate_encoding
+
+DEFAULT_WORKERS = 32
+FETCH_TIMEOUT = 6.0
+# Request bodies larger than this are spooled to disk for the WSGI app.
+SPOOL_BYTES = 1024 * 1024
+MAX_FETCH_BODY = 64 * 1024
+# Streamed responses are passed on in pieces of about this size, so a file
+# or a generator of small chunks costs one thread hop per piece.
+STREAM_BYTES = 256 * 1024
+
+
+class AsgiApp:
+    """ASGI application wrapping a WSGI app, with a native ``/fetch-url``.
+
+    Args:
+        wsgi_app: The Flask app from ``create_app``.
+        fetcher: Async fetcher for ``/fetch-url``.
+        workers: Threads running the WSGI app.
+        fetch_timeout: Seconds a ``/fetch-url`` request may take.
+    """
+
+    def __init__(
+        self,
+        wsgi_app: Callable,
+        fetcher: AsyncRemoteFetcher,
+        workers: int = DEFAULT_WORKERS,
+        fetch_timeout: float = FETCH_TIMEOUT,
+    ) -> None:
+        self.wsgi_app = wsgi_app
+        self.fetcher = fetcher
+        self.fetch_timeout = fetch_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pymark-wsgi")
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            if scope["path"] == "/fetch-url" and scope["method"] == "POST":
+                await self._fetch_url(scope, receive, send)
+            else:
+                await self._wsgi(scope, receive, send)
+        # Websockets are not served.
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.fetcher.close()
+
+    # -- /fetch-url --------------------------------------------------------
+
+    async def _fetch_url(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        # Each ASGI request runs in its own task, so the timings context is
+        # this request's alone.
+        timings = metrics.start_request()
+        metrics.REQUESTS_IN_FLIGHT.inc(route="/fetch-url")
+        status = 500
+        try:
+            body = await _read_body(receive, limit=MAX_FETCH_BODY)
+            try:
+                data = json.loads(body or b"{}")
+            except ValueError:
+                data = {}
+            url = data.get("url", "") if isinstance(data, dict) else ""
+            if not isinstance(url, str) or not url.strip():
+                status, payload = 400, {"error": "url is required"}
+            else:
+                try:
+                    with metrics.stage("fetch"):
+                        content, encoding = await self.fetcher.fetch(url.strip(), self.fetch_timeout)
+                    status, payload = 200, {"markdown": content.decode(encoding or "utf-8", errors="replace")}
+                except Exception as exc:
+                    status, payload = 400, {"error": str(exc)}
+            await self._send_json(scope, send, status, payload, timings.server_timing())
+        finally:
+            seconds = metrics.finish_request(timings)
+            metrics.REQUESTS_IN_FLIGHT.dec(route="/fetch-url")
+            if metrics.enabled():
+                metrics.REQUEST_SECONDS.observe(seconds, method="POST", route="/fetch-url", status=str(status))
+
+    async def _send_json(self, scope: Dict[str, Any], send: Callable, status: int, payload: Any, timing: str) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        headers = [(b"content-type", b"application/json"), (b"server-timing", timing.encode("latin-1"))]
+        if len(body) >= MIN_COMPRESS_BYTES:
+            headers.append((b"vary", b"Accept-Encoding"))
+            encoding = negotiate_encoding(_header(scope, b"accept-encoding"))
+            if encoding is not None:
+                body = await asyncio.get_running_loop().run_in_executor(self.executor, compress, body, encoding)
+                headers.append((b"content-encoding", encoding.encode("ascii")))
+        headers.append((b"content-length", str(len(body)).encode("ascii")))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    # -- everything else: the Flask app on the thread pool --------------
+
+    async def _wsgi(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        loop = asyncio.get_running_loop()
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                return
+            body.write(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        length = body.tell()
+        body.seek(0)
+        environ = _environ(scope, body)
+        # The body is complete here, even when it was uploaded chunked.
+        environ["CONTENT_LENGTH"] = str(length)
+        environ.pop("HTTP_TRANSFER_ENCODING", None)
+        started: List[Tuple[str, List[Tuple[str, str]]]] = []
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info: Any = None) -> Callable:
+            started[:] = [(status, headers)]
+            return lambda data: None  # The legacy write() callable is not supported.
+
+        def call() -> Tuple[Any, Optional[List[bytes]]]:
+            result = self.wsgi_app(environ, start_response)
+            # Plain responses come back whole: no more thread hops for them.
+            if isinstance(result, (list, tuple)):
+                return result, list(result)
+            return result, None
+
+        result, chunks = await loop.run_in_executor(self.executor, call)
+        try:
+            first = b""
+            if chunks is None:
+                # start_response may be deferred to the first chunk.
+                read = _reader(result)
+                first = await loop.run_in_executor(self.executor, read)
+            status, headers = started[0]
+            await send({
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+            })
+            if chunks is not None:
+                await send({"type": "http.response.body", "body": b"".join(chunks)})
+                return
+            while first:
+                await send({"type": "http.response.body", "body": first, "more_body": True})
+                first = await loop.run_in_executor(self.executor, read)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                # Runs Flask's teardown; keep it off the loop too.
+                await loop.run_in_executor(self.executor, close)
+            body.close()
+
+    async def _lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+class _FileWrapper:
+    """``wsgi.file_wrapper``: lets the bridge read a sent file directly."""
+
+    def __init__(self, file: Any, block_size: int = 8192) -> None:
+        self.file = file
+        self.block_size = block_size
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            data = self.file.read(self.block_size)
+            if not data:
+                return
+            yield data
+
+    def close(self) -> None:
+        close = getattr(self.file, "close", None)
+        if close is not None:
+            close()
+
+
+def _reader(result: Iterable[bytes]) -> Callable[[], bytes]:
+    """Return a blocking function giving the next ``STREAM_BYTES`` or so of
+    ``result`` (``b""`` at the end)."""
+    if isinstance(result, _FileWrapper) and hasattr(result.file, "read"):
+        return lambda: result.file.read(STREAM_BYTES)
+    iterator = iter(result)
+
+    def read() -> bytes:
+        parts = []
+        size = 0
+        for chunk in iterator:
+            if chunk:
+                parts.append(chunk)
+                size += len(chunk)
+                if size >= STREAM_BYTES:
+                    break
+        return b"".join(parts)
+
+    return read
+
+
+def _header(scope: Dict[str, Any], name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _read_body(receive: Callable, limit: int) -> bytes:
+    chunks = []
+    total = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return b""
+        chunk = message.get("body", b"")
+        total += len(chunk)
+        if total > limit:
+            return b""  # Answered like a body without a URL.
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+def _environ(scope: Dict[str, Any], body: io.IOBase) -> Dict[str, Any]:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ: Dict[str, Any] = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        # WSGI strings are bytes decoded as latin-1.
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "wsgi.file_wrapper": _FileWrapper,
+    }
+    for raw_name, raw_value in scope.get("headers", ()):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
@@ -0,0 +1,217 @@
+"""
+URL fetcher for WeasyPrint: vendored assets, a shared cache, offline mode.
+
+WeasyPrint fetches every stylesheet, font and image a document references,
+on every render. ``AssetFetcher`` is given to all ``HTML`` and ``CSS``
+objects instead of WeasyPrint's default fetcher:
+
+* an ``http(s)`` URL whose mirror exists under a vendor directory
+  (``<dir>/<host>/<path>``, ``static/vendor`` by default) is served from
+  disk;
+* the KaTeX stylesheet linked by ``HTML_TEMPLATE`` is answered locally with
+  an empty stylesheet unless it is vendored: math in PDFs is pre-rendered
+  and styled by ``MATH_CSS``, so KaTeX's CSS (and the dozen web fonts it
+  would pull in) only matters in a browser;
+* other remote responses are kept in a size-bounded in-memory cache shared
+  by every render in the process, and failed fetches are remembered for a
+  minute so an unreachable host stalls one render rather than each one;
+* in offline mode (``PYMARK_OFFLINE=1``) nothing is ever fetched from the
+  network; such resources are reported missing, as WeasyPrint does for any
+  resource it cannot load.
+
+Local ``file:`` and ``data:`` URLs are fetched as WeasyPrint always does.
+The fetcher is shared by threads, so actual fetching goes through one plain
+``URLFetcher`` per thread: WeasyPrint's keeps per-request state while it
+follows a redirect.
+"""
+from __future__ import annotations
+
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlparse
+
+from weasyprint.urls import URLFetcher, URLFetcherResponse
+
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+DEFAULT_FAILURE_TTL = 60.0
+VENDOR_DIR = Path(__file__).resolve().parent / "static" / "vendor"
+# Referenced by HTML_TEMPLATE for browsers; irrelevant to the PDF.
+BROWSER_ONLY = {
+    "https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/katex.min.css": "text/css",
+}
+
+
+class OfflineError(ValueError):
+    """A network fetch was refused because offline mode is on."""
+
+
+@dataclass
+class _Entry:
+    url: str
+    body: bytes
+    content_type: str
+
+
+def offline_from_env() -> bool:
+    return os.environ.get("PYMARK_OFFLINE", "").lower() in ("1", "true", "yes", "on")
+
+
+def vendor_dirs_from_env() -> List[Path]:
+    """``PYMARK_VENDOR_DIR`` (``os.pathsep``-separated), then ``static/vendor``."""
+    configured = os.environ.get("PYMARK_VENDOR_DIR", "")
+    return [Path(entry) for entry in configured.split(os.pathsep) if entry] + [VENDOR_DIR]
+
+
+class AssetFetcher(URLFetcher):
+    """WeasyPrint URL fetcher with vendored assets, caching and offline mode.
+
+    Args:
+        vendor_dirs: Directories holding ``<host>/<path>`` mirrors of remote
+            assets, searched in order.
+        offline: Never fetch from the network.
+        max_cache_bytes: Budget for cached remote bodies; least recently
+            used entries are evicted first.
+        failure_ttl: Seconds a failed remote fetch is not retried.
+        **kwargs: Passed to ``weasyprint.urls.URLFetcher`` (``timeout``...).
+    """
+
+    def __init__(
+        self,
+        vendor_dirs: Sequence[Path] = (VENDOR_DIR,),
+        offline: bool = False,
+        max_cache_bytes: int = DEFAULT_CACHE_BYTES,
+        failure_ttl: float = DEFAULT_FAILURE_TTL,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self._fetcher_kwargs = kwargs
+        self._local = threading.local()
+        self.vendor_dirs = [Path(directory).resolve() for directory in vendor_dirs]
+        self.offline = offline
+        self.max_cache_bytes = max_cache_bytes
+        self.failure_ttl = failure_ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._failures: Dict[str, Tuple[float, str]] = {}
+        self._size = 0
+        self._counters = {"vendored": 0, "hits": 0, "misses": 0, "blocked": 0, "failed": 0, "evictions": 0}
+
+    def fetch(self, url: str, headers: Optional[dict] = None) -> URLFetcherResponse:
+        scheme = url.split(":", 1)[0].lower()
+        if scheme in ("file", "data"):
+            return self._delegate().fetch(url, headers)
+
+        vendored = self._vendored(url)
+        if vendored is not None:
+            self._count("vendored")
+            return URLFetcherResponse(vendored.as_uri(), vendored.read_bytes(), self._type_headers(vendored))
+        if url in BROWSER_ONLY:
+            self._count("vendored")
+            return URLFetcherResponse(url, b"", {"Content-Type": BROWSER_ONLY[url]})
+
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                self._counters["hits"] += 1
+            failure = self._failures.get(url)
+        if entry is not None:
+            return URLFetcherResponse(entry.url, entry.body, {"Content-Type": entry.content_type})
+        if self.offline:
+            self._count("blocked")
+            raise OfflineError(f"offline mode: not fetching {url}")
+        if failure is not None and failure[0] > time.monotonic():
+            raise OSError(failure[1])
+
+        self._count("misses")
+        try:
+            response = self._delegate().fetch(url, headers)
+            try:
+                body = response.read()
+            finally:
+                response.close()
+        except Exception as exc:
+            with self._lock:
+                self._counters["failed"] += 1
+                self._failures[url] = (time.monotonic() + self.failure_ttl, f"{type(exc).__name__}: {exc}")
+            raise
+        content_type = response.headers.get("Content-Type", "application/octet-stream")
+        self._store(url, _Entry(response.url, body, content_type))
+        return URLFetcherResponse(response.url, body, {"Content-Type": content_type})
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        return stats
+
+    def _delegate(self) -> URLFetcher:
+        fetcher = getattr(self._local, "fetcher", None)
+        if fetcher is None:
+            fetcher = self._local.fetcher = URLFetcher(**self._fetcher_kwargs)
+        return fetcher
+
+    def _vendored(self, url: str) -> Optional[Path]:
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            return None
+        relative = Path(parsed.hostname) / unquote(parsed.path).lstrip("/")
+        for directory in self.vendor_dirs:
+            candidate = (directory / relative).resolve()
+            # Refuse paths that climb out of the vendor directory.
+            if candidate.is_file() and candidate.is_relative_to(directory):
+                return candidate
+        return None
+
+    def _type_headers(self, path: Path) -> Dict[str, str]:
+        content_type, _ = mimetypes.guess_type(path.name)
+        return {"Content-Type": content_type or "application/octet-stream"}
+
+    def _store(self, url: str, entry: _Entry) -> None:
+        # One resource may not take more than a quarter of the budget.
+        if len(entry.body) > self.max_cache_bytes // 4:
+            return
+        with self._lock:
+            self._failures.pop(url, None)
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self._size -= len(old.body)
+            self._entries[url] = entry
+            self._size += len(entry.body)
+            while self._size > self.max_cache_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+                self._counters["evictions"] += 1
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+
+_default_fetcher: Optional[AssetFetcher] = None
+_default_fetcher_lock = threading.Lock()
+
+
+def default_asset_fetcher() -> AssetFetcher:
+    """Return the process-wide fetcher, configured from the environment.
+
+    ``PYMARK_OFFLINE``, ``PYMARK_VENDOR_DIR`` and ``PYMARK_FETCH_CACHE_MB``
+    are read when it is first created.
+    """
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            cache_mb = os.environ.get("PYMARK_FETCH_CACHE_MB")
+            _default_fetcher = AssetFetcher(
+                vendor_dirs=vendor_dirs_from_env(),
+                offline=offline_from_env(),
+                max_cache_bytes=int(float(cache_mb) * 1024 * 1024) if cache_mb else DEFAULT_CACHE_BYTES,
+            )
+        return _default_fetcher
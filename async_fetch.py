@@ -0,0 +1,137 @@
+"""
+Bounded remote Markdown fetches for the asyncio serving path.
+
+``AsyncRemoteFetcher`` runs ``RemoteFetcher.fetch`` (its pooled
+``requests`` session, HTTP cache, proxies and compression) on a thread pool,
+and lets the event loop queue the rest. Two limits keep the load on threads
+and origins bounded:
+
+* at most ``max_concurrent`` fetches are in flight at once; the rest wait
+  their turn as coroutines, holding no thread;
+* at most ``per_host`` of them go to the same host and port, so one slow or
+  popular origin cannot take every slot.
+
+The ``timeout`` covers the whole fetch, waiting for a slot included. A
+fetch that times out is answered at once, but keeps its slot until its
+thread is done, so the limits hold for threads as well as for requests.
+Fresh cache hits are answered on the loop without a thread.
+"""
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from remote_fetch import RemoteFetcher
+
+DEFAULT_MAX_CONCURRENT = 256
+DEFAULT_PER_HOST = 8
+
+
+class _HostSlot:
+    def __init__(self, limit: int) -> None:
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+
+
+class AsyncRemoteFetcher:
+    """Fetch URLs from coroutines, with global and per-host concurrency limits.
+
+    Args:
+        cache: The ``RemoteFetcher`` that performs the fetches.
+        max_concurrent: Fetches in flight at once across all hosts (and
+            threads used for them).
+        per_host: Fetches in flight at once to one host and port.
+    """
+
+    def __init__(
+        self,
+        cache: RemoteFetcher,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+        per_host: int = DEFAULT_PER_HOST,
+    ) -> None:
+        self.cache = cache
+        self.max_concurrent = max_concurrent
+        self.per_host = per_host
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="pymark-fetch")
+        self._global: Optional[asyncio.Semaphore] = None
+        self._hosts: Dict[str, _HostSlot] = {}
+        self._counters = {"fetches": 0, "waiting": 0, "in_flight": 0, "timeouts": 0, "failed": 0}
+
+    async def fetch(self, url: str, timeout: float) -> Tuple[bytes, Optional[str]]:
+        """Return ``(body, encoding)`` for ``url``, from cache when possible."""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError("Only http/https URLs are allowed")
+        entry, fresh = self.cache.lookup(url)
+        if fresh:
+            return entry.body, entry.encoding
+
+        self._counters["fetches"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            return await asyncio.wait_for(self._fetch_limited(url, parts.netloc.lower(), deadline), timeout)
+        except asyncio.TimeoutError:
+            self._counters["timeouts"] += 1
+            raise TimeoutError(f"Timed out fetching {url} after {timeout:g}s") from None
+        except Exception:
+            self._counters["failed"] += 1
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self._counters)
+        stats["hosts"] = len(self._hosts)
+        return stats
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _fetch_limited(self, url: str, host: str, deadline: float) -> Tuple[bytes, Optional[str]]:
+        loop = asyncio.get_running_loop()
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrent)
+        slot = self._hosts.get(host)
+        if slot is None:
+            slot = self._hosts[host] = _HostSlot(self.per_host)
+        slot.users += 1
+        self._counters["waiting"] += 1
+        try:
+            # Per host first, so requests queued for a busy host do not sit
+            # on global slots that other hosts could use.
+            await slot.semaphore.acquire()
+            try:
+                await self._global.acquire()
+            except BaseException:
+                slot.semaphore.release()
+                raise
+        except BaseException:
+            self._counters["waiting"] -= 1
+            self._leave(host, slot)
+            raise
+        self._counters["waiting"] -= 1
+        self._counters["in_flight"] += 1
+
+        def release(_future: object) -> None:
+            self._counters["in_flight"] -= 1
+            self._global.release()
+            slot.semaphore.release()
+            self._leave(host, slot)
+
+        # Released when the thread is done, not when the caller gives up.
+        future = self._executor.submit(self.cache.fetch, url, max(0.1, deadline - loop.time()))
+        future.add_done_callback(lambda done: _call_soon(loop, release, done))
+        return await asyncio.wrap_future(future)
+
+    def _leave(self, host: str, slot: _HostSlot) -> None:
+        slot.users -= 1
+        if not slot.users:
+            del self._hosts[host]
+
+
+def _call_soon(loop: asyncio.AbstractEventLoop, callback, *args: object) -> None:
+    try:
+        loop.call_soon_threadsafe(callback, *args)
+    except RuntimeError:  # The loop has been closed; nothing left to release.
+        pass
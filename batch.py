@@ -0,0 +1,197 @@
+"""
+Parallel batch conversion of many Markdown files to PDF.
+
+Inputs may be files, directories (searched recursively) or glob patterns.
+Documents are rendered on a process pool; every worker imports WeasyPrint
+once and keeps a warm render context for all the documents it handles.
+"""
+from __future__ import annotations
+
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MARKDOWN_SUFFIXES = {".md", ".markdown"}
+
+
+@dataclass(frozen=True)
+class BatchTask:
+    source: Path
+    output: Path
+    css_path: Optional[Path]
+    title: Optional[str]
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    task: BatchTask
+    ok: bool
+    seconds: float
+    error: Optional[str] = None
+
+
+def collect_inputs(specs: Iterable[str]) -> List[Tuple[Path, Path]]:
+    """Expand files, directories and globs into ``(source, root)`` pairs.
+
+    ``root`` is the directory the source was found under, so outputs can
+    mirror the input layout. Directories and globs yield only Markdown files
+    (``MARKDOWN_SUFFIXES``); files named explicitly are taken as they are.
+    Duplicates are dropped, order is preserved.
+    """
+    found: List[Tuple[Path, Path]] = []
+    seen = set()
+
+    def add(path: Path, root: Path) -> None:
+        key = path.resolve()
+        if key not in seen:
+            seen.add(key)
+            found.append((path, root))
+
+    for spec in specs:
+        path = Path(spec)
+        if glob.has_magic(spec):
+            root = glob_root(spec)
+            for match in sorted(glob.glob(spec, recursive=True)):
+                candidate = Path(match)
+                if candidate.suffix.lower() in MARKDOWN_SUFFIXES and candidate.is_file():
+                    add(candidate, root)
+        elif path.is_dir():
+            for candidate in sorted(path.rglob("*")):
+                if candidate.suffix.lower() in MARKDOWN_SUFFIXES and candidate.is_file():
+                    add(candidate, path)
+        else:
+            # Missing files are kept so they are reported as per-file failures.
+            add(path, path.parent)
+    return found
+
+
+def glob_root(pattern: str) -> Path:
+    """The directory part of ``pattern`` before its first wildcard.
+
+    ``docs/**/*.md`` gives ``docs``, so ``docs/a/README.md`` and
+    ``docs/b/README.md`` keep their subdirectories in the output.
+    """
+    prefix = []
+    for part in Path(pattern).parts[:-1]:
+        if glob.has_magic(part):
+            break
+        prefix.append(part)
+    return Path(*prefix) if prefix else Path(".")
+
+
+def plan_tasks(
+    inputs: Iterable[Tuple[Path, Path]],
+    output_dir: Optional[Path],
+    css_path: Optional[Path],
+    title: Optional[str],
+) -> List[BatchTask]:
+    """Pair every source with its output path.
+
+    Without ``output_dir`` each PDF is written next to its source; with it,
+    the layout below each input directory is mirrored into ``output_dir``.
+    Raises ``ValueError`` when two sources would be written to the same PDF.
+    """
+    tasks = []
+    for source, root in inputs:
+        if output_dir is None:
+            output = source.with_suffix(".pdf")
+        else:
+            try:
+                relative = source.relative_to(root)
+            except ValueError:
+                relative = Path(source.name)
+            output = (output_dir / relative).with_suffix(".pdf")
+        tasks.append(BatchTask(source=source, output=output, css_path=css_path, title=title))
+
+    claimed: Dict[Path, Path] = {}
+    collisions = []
+    for task in tasks:
+        other = claimed.setdefault(task.output.resolve(), task.source)
+        if other != task.source:
+            collisions.append(f"{other} and {task.source} both write {task.output}")
+    if collisions:
+        raise ValueError("conflicting outputs: " + "; ".join(collisions))
+    return tasks
+
+
+def _init_worker() -> None:
+    # Import WeasyPrint and build the render context once per worker process
+    # rather than once per document.
+    import main
+
+    main.default_render_context()
+
+
+def render_task(task: BatchTask, sections: Optional[bool] = None) -> BatchResult:
+    """Render one task, capturing any failure in the result."""
+    import main
+
+    start = time.perf_counter()
+    try:
+        main.render_markdown_to_pdf(
+            task.source, task.output, task.css_path, task.title or task.source.stem, sections=sections
+        )
+    except Exception as exc:
+        return BatchResult(task, ok=False, seconds=time.perf_counter() - start, error=str(exc))
+    return BatchResult(task, ok=True, seconds=time.perf_counter() - start)
+
+
+def run_batch(
+    tasks: List[BatchTask], jobs: Optional[int] = None, report=None, sections: Optional[bool] = None
+) -> List[BatchResult]:
+    """Render ``tasks`` on ``jobs`` worker processes (default: all cores).
+
+    ``report`` is called with each ``BatchResult`` as soon as it finishes.
+    A failing document never stops the rest of the batch. ``sections`` is
+    passed to every render; when it is ``None`` and several workers run,
+    documents are not split, since they already render in parallel.
+    """
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(tasks) or 1))
+    results: List[BatchResult] = []
+
+    if jobs == 1:
+        _init_worker()
+        for task in tasks:
+            result = render_task(task, sections)
+            results.append(result)
+            if report is not None:
+                report(result)
+        return results
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as executor:
+        # Documents already render in parallel; don't split them further
+        # unless asked to.
+        split = False if sections is None else sections
+        futures = {executor.submit(render_task, task, split): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as exc:  # Worker died (e.g. killed by the OOM killer).
+                task = futures[future]
+                result = BatchResult(task, ok=False, seconds=0.0, error=f"worker failed: {exc}")
+            results.append(result)
+            if report is not None:
+                report(result)
+    return results
+
+
+def format_summary(results: List[BatchResult], elapsed: float) -> str:
+    ok = sum(1 for result in results if result.ok)
+    failed = len(results) - ok
+    rate = len(results) / elapsed if elapsed > 0 else float("inf")
+    summary = f"Converted {ok}/{len(results)} documents in {elapsed:.2f}s ({rate:.1f} docs/s)"
+    if failed:
+        summary += f"; {failed} failed"
+    return summary
+
+
+def print_result(result: BatchResult) -> None:
+    if result.ok:
+        print(f"Wrote PDF to {result.task.output}")
+    else:
+        print(f"Failed {result.task.source}: {result.error}", file=sys.stderr)
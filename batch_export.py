@@ -0,0 +1,216 @@
+"""
+Export many documents in one request as a streamed ZIP archive.
+
+``POST /export-batch`` takes a list of ``{markdown, title, css}`` documents.
+They are rendered concurrently, on the render pool's worker processes when
+the server has one, and every PDF is appended to the archive as soon as it
+finishes, so the response starts before the batch is done and neither the
+archive nor a whole PDF is ever held in memory. Only a small window of
+renders runs ahead of the client. ``manifest.json``, written last, lists
+every document with its file name, size and timing, or the error that kept
+it out of the archive; one bad document never fails the batch.
+
+Identical stylesheets are shared: each distinct CSS text in a batch is kept
+once, and render contexts cache parsed stylesheets by content, so a course
+pack with one theme parses it once per render process rather than once per
+document.
+"""
+from __future__ import annotations
+
+import json
+import re
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_MAX_DOCUMENTS = 200
+MANIFEST_NAME = "manifest.json"
+CHUNK_BYTES = 256 * 1024
+
+# render(document): return a readable binary stream of the PDF; the caller
+# closes it.
+Renderer = Callable[["BatchDocument"], BinaryIO]
+
+
+@dataclass(frozen=True)
+class BatchDocument:
+    index: int
+    markdown: str
+    title: str
+    css: Optional[str]
+    error: Optional[str] = None  # Set when the entry itself is invalid.
+
+
+@dataclass(frozen=True)
+class BatchEntry:
+    index: int
+    title: str
+    file: Optional[str]
+    ok: bool
+    seconds: float
+    size: int = 0
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "title": self.title,
+            "file": self.file,
+            "ok": self.ok,
+            "seconds": round(self.seconds, 3),
+            "bytes": self.size,
+            "error": self.error,
+        }
+
+
+def parse_batch(data: Any, max_documents: int = DEFAULT_MAX_DOCUMENTS) -> List[BatchDocument]:
+    """Validate a ``{"documents": [...]}`` request body.
+
+    Raises ``ValueError`` when the request as a whole is unusable. A single
+    malformed document is returned with ``error`` set instead, to be
+    reported in the manifest.
+    """
+    items = data.get("documents") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError("documents must be a non-empty list")
+    if len(items) > max_documents:
+        raise ValueError(f"at most {max_documents} documents per batch")
+
+    stylesheets: Dict[str, str] = {}
+    documents = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            documents.append(BatchDocument(index, "", f"Document {index + 1}", None, "document must be an object"))
+            continue
+        title = item.get("title")
+        if not isinstance(title, str) or not title:
+            title = f"Document {index + 1}"
+        markdown_text = item.get("markdown", "")
+        css_text = item.get("css")
+        if not isinstance(markdown_text, str) or not markdown_text.strip():
+            documents.append(BatchDocument(index, "", title, None, "markdown is required"))
+        elif css_text is not None and not isinstance(css_text, str):
+            documents.append(BatchDocument(index, "", title, None, "css must be a string"))
+        else:
+            # One copy of each distinct stylesheet for the whole batch.
+            css_text = stylesheets.setdefault(css_text, css_text) if css_text else None
+            documents.append(BatchDocument(index, markdown_text, title, css_text))
+    return documents
+
+
+def archive_name(document: BatchDocument) -> str:
+    """``003-Week-2-Limits.pdf``: unique within a batch and safe to extract anywhere."""
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "-", document.title).strip("-.")[:80] or "document"
+    return f"{document.index + 1:03d}-{slug}.pdf"
+
+
+class _Chunks:
+    """Write-only file object that collects what ``ZipFile`` writes."""
+
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Tuple[bytes, ...]:
+        """Everything written since the last call, as zero or one chunk."""
+        if not self._parts:
+            return ()
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return (data,)
+
+
+def _close_result(future: Any) -> None:
+    stream = future.result()[0]
+    if stream is not None:
+        stream.close()
+
+
+def stream_batch_zip(
+    documents: List[BatchDocument],
+    render: Renderer,
+    workers: int = 1,
+    report: Optional[Callable[[BatchEntry], None]] = None,
+) -> Iterator[bytes]:
+    """Yield a ZIP archive of ``documents`` as its bytes become available.
+
+    Up to ``workers`` documents render at once, and at most twice that many
+    are rendered ahead of the archive. PDFs are added in the order they
+    finish; ``report`` is called with each document's manifest entry.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    def run(document: BatchDocument) -> Tuple[Optional[BinaryIO], float, Optional[str]]:
+        start = time.perf_counter()
+        try:
+            return render(document), time.perf_counter() - start, None
+        except Exception as exc:
+            return None, time.perf_counter() - start, f"{type(exc).__name__}: {exc}"
+
+    out = _Chunks()
+    entries: List[BatchEntry] = []
+    pending = iter(documents)
+    window = max(1, workers) * 2
+    # PDFs are mostly compressed already; level 1 costs little and keeps
+    # the archive readable by tools that dislike stored streamed entries.
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive, \
+            ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="pymark-batch") as executor:
+        running: Dict[Any, BatchDocument] = {}
+        try:
+            while True:
+                while len(running) < window:
+                    document = next(pending, None)
+                    if document is None:
+                        break
+                    if document.error is not None:
+                        entries.append(
+                            BatchEntry(document.index, document.title, None, False, 0.0, error=document.error)
+                        )
+                        continue
+                    running[executor.submit(run, document)] = document
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    document = running.pop(future)
+                    stream, seconds, error = future.result()
+                    if stream is None:
+                        entry = BatchEntry(document.index, document.title, None, False, seconds, error=error)
+                    else:
+                        name = archive_name(document)
+                        size = 0
+                        with stream, archive.open(name, "w") as member:
+                            while True:
+                                chunk = stream.read(CHUNK_BYTES)
+                                if not chunk:
+                                    break
+                                member.write(chunk)
+                                size += len(chunk)
+                                yield from out.drain()
+                        entry = BatchEntry(document.index, document.title, name, True, seconds, size)
+                    entries.append(entry)
+                    if report is not None:
+                        report(entry)
+                    yield from out.drain()
+        finally:
+            # Only left early when the client went away: drop queued renders
+            # and close the PDFs of those already running once they finish.
+            for future in running:
+                if not future.cancel():
+                    future.add_done_callback(_close_result)
+
+        entries.sort(key=lambda entry: entry.index)
+        manifest = {
+            "documents": [entry.to_dict() for entry in entries],
+            "ok": sum(entry.ok for entry in entries),
+            "failed": sum(not entry.ok for entry in entries),
+        }
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2))
+    yield from out.drain()
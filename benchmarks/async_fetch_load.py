@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Render latency of the ASGI app while thousands of remote fetches are pending.
+
+Slow stand-in origins (local servers that answer after --delay seconds) are
+started on the event loop, then --fetches concurrent POST /fetch-url calls
+are driven through the ASGI app in process. /render-html is timed idle and
+again while the fetches are pending; with fetches queued on the event loop,
+at most --concurrency of them on fetch threads, and renders on their own
+thread pool, the two should stay close.
+
+Usage: python benchmarks/async_fetch_load.py [--fetches 1500] [--delay 0.5] [--runs 50]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from main import create_asgi_app  # noqa: E402
+
+DOCUMENT = (
+    "# Week 3\n\nLimits and *continuity*, with $\\lim_{x \\to 0} \\frac{\\sin x}{x} = 1$.\n\n"
+    "| Topic | Hours |\n|---|---|\n| Limits | 4 |\n| Derivatives | 6 |\n\n"
+) * 20
+ORIGIN_BODY = b"# Remote notes\n\nFetched from a slow origin.\n"
+
+
+async def request(app, method: str, path: str, payload=None):
+    """Run one request through ``app``; return ``(status, body)``."""
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("ascii"))],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 5000),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = 0
+    chunks = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()  # Never disconnects.
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        else:
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+async def start_origins(count: int, delay: float):
+    async def handle(reader, writer):
+        try:
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            await asyncio.sleep(delay)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/markdown; charset=utf-8\r\n"
+                b"Cache-Control: no-store\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s"
+                % (len(ORIGIN_BODY), ORIGIN_BODY)
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    servers = [await asyncio.start_server(handle, "127.0.0.1", 0, backlog=4096) for _ in range(count)]
+    ports = [server.sockets[0].getsockname()[1] for server in servers]
+    return servers, ports
+
+
+async def time_renders(app, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        status, _ = await request(app, "POST", "/render-html", {"markdown": DOCUMENT})
+        timings.append(time.perf_counter() - start)
+        if status != 200:
+            raise RuntimeError(f"/render-html answered {status}")
+    return timings
+
+
+def report(label: str, timings: list) -> float:
+    median = statistics.median(timings)
+    p95 = sorted(timings)[int(len(timings) * 0.95) - 1]
+    print(f"{label:>14}: median {median * 1000:8.2f} ms  p95 {p95 * 1000:8.2f} ms  ({len(timings)} renders)")
+    return median
+
+
+async def run(args: argparse.Namespace) -> int:
+    app = create_asgi_app(fetch_concurrency=args.concurrency, fetch_per_host=args.per_host)
+    servers, ports = await start_origins(args.origins, args.delay)
+    try:
+        await time_renders(app, 5)  # Warm the converter and caches.
+        idle = report("idle", await time_renders(app, args.runs))
+
+        async def fetch(index: int):
+            url = f"http://127.0.0.1:{ports[index % len(ports)]}/notes.md?n={index}"
+            return await request(app, "POST", "/fetch-url", {"url": url})
+
+        start = time.perf_counter()
+        fetches = [asyncio.ensure_future(fetch(index)) for index in range(args.fetches)]
+        await asyncio.sleep(min(0.2, args.delay / 2))  # Let them reach the origins.
+        pending = app.fetcher.stats()
+        loaded = report("under load", await time_renders(app, args.runs))
+        results = await asyncio.gather(*fetches)
+        elapsed = time.perf_counter() - start
+
+        ok = sum(status == 200 for status, _ in results)
+        print(
+            f"{'fetches':>14}: {ok}/{args.fetches} ok in {elapsed:.2f} s "
+            f"(in flight {pending['in_flight']}, waiting {pending['waiting']} while rendering; "
+            f"{app.fetcher.stats()['timeouts']} timed out)"
+        )
+        print(f"{'slowdown':>14}: {loaded / idle:.2f}x")
+    finally:
+        for server in servers:
+            server.close()
+        app.close()
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fetches", type=int, default=1500)
+    parser.add_argument("--delay", type=float, default=0.5, help="Seconds each origin takes to answer")
+    parser.add_argument("--origins", type=int, default=64, help="Stand-in origin servers (one port each)")
+    parser.add_argument("--concurrency", type=int, default=256, help="Fetches in flight at once")
+    parser.add_argument("--per-host", type=int, default=16, help="Fetches in flight at once per origin")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    # Every fetch in flight holds two descriptors: the client and origin ends.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < 2 * args.concurrency + 256:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
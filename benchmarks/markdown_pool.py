@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Compare markdown.markdown() with a pooled, reset() converter.
+
+"fresh" builds a new Markdown instance with all extensions for each
+conversion (the behaviour before MarkdownPool); "pooled" reuses one.
+Small documents show the setup cost, large ones the steady state.
+
+Usage: python benchmarks/markdown_pool.py ["Study Plan.md"] [--runs 200]
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from markdown import markdown  # noqa: E402
+
+from markdown_pool import DEFAULT_EXTENSIONS, MarkdownPool  # noqa: E402
+
+SMALL = "# Heading\n\nA short paragraph with *emphasis* and a [link](https://example.com).\n"
+
+
+def measure(label: str, fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    print(f"{label:>14}: median {median * 1000:8.3f} ms  min {min(timings) * 1000:8.3f} ms  ({runs} runs)")
+    return median
+
+
+def compare(name: str, text: str, runs: int) -> None:
+    pool = MarkdownPool(DEFAULT_EXTENSIONS)
+    pool.convert(text)  # Build the pooled converter outside the timing.
+    print(f"{name} ({len(text):,} chars)")
+    fresh = measure("fresh", lambda: markdown(text, extensions=list(DEFAULT_EXTENSIONS)), runs)
+    pooled = measure("pooled", lambda: pool.convert(text), runs)
+    print(f"{'speedup':>14}: {fresh / pooled:.2f}x")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("document", type=Path, nargs="?", default=ROOT / "Study Plan.md")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    compare("small", SMALL, args.runs)
+    compare("large", args.document.read_text(encoding="utf-8"), max(5, args.runs // 20))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Show that the math tokenizer runs in linear time and flat memory.
+
+``Study Plan.md`` is repeated up to each target size and scanned with
+``iter_math_tokens``. Time per megabyte should stay constant as the document
+grows, and the peak memory allocated during the scan (measured with
+tracemalloc, excluding the document itself) should not grow with it.
+
+Usage: python benchmarks/math_tokenizer.py [--sizes 10 25 50 100] [--bytes]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from math_renderer import iter_math_tokens  # noqa: E402
+
+
+def scaled_document(seed: str, megabytes: float) -> str:
+    target = int(megabytes * 1024 * 1024)
+    copies = target // len(seed.encode("utf-8")) + 1
+    return seed * copies
+
+
+def scan(text) -> tuple[int, float]:
+    start = time.perf_counter()
+    count = 0
+    for _ in iter_math_tokens(text):
+        count += 1
+    return count, time.perf_counter() - start
+
+
+def scan_peak(text) -> int:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    for _ in iter_math_tokens(text):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--document", type=Path, default=ROOT / "Study Plan.md")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[10, 25, 50, 100], help="Sizes in MB")
+    parser.add_argument("--bytes", action="store_true", help="Scan UTF-8 bytes instead of str")
+    args = parser.parse_args(argv)
+
+    seed = args.document.read_text(encoding="utf-8")
+    print(f"{'size MB':>8} {'tokens':>10} {'seconds':>8} {'ms/MB':>8} {'peak KB':>8}")
+    for size in args.sizes:
+        text = scaled_document(seed, size)
+        if args.bytes:
+            text = text.encode("utf-8")
+        megabytes = len(text) / (1024 * 1024) if args.bytes else len(text.encode("utf-8")) / (1024 * 1024)
+        count, seconds = scan(text)
+        peak = scan_peak(text)
+        print(f"{megabytes:8.1f} {count:10d} {seconds:8.2f} {seconds * 1000 / megabytes:8.1f} {peak / 1024:8.1f}")
+        del text
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Compare per-render PDF time with and without a warm RenderContext.
+
+"cold" rebuilds the stylesheet and font configuration for every render (the
+behaviour before RenderContext existed); "warm" reuses one context.
+
+Usage: python benchmarks/render_context.py ["Study Plan.md"] [--runs 5]
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from weasyprint import CSS, HTML  # noqa: E402
+
+from main import DEFAULT_CSS, HTML_TEMPLATE, RenderContext, markdown_to_html  # noqa: E402
+
+
+def render_cold(html: str) -> None:
+    HTML(string=html).write_pdf(io.BytesIO(), stylesheets=[CSS(string=DEFAULT_CSS)])
+
+
+def render_warm(html: str, context: RenderContext) -> None:
+    context.write_pdf(html, io.BytesIO())
+
+
+def measure(label: str, fn, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    print(
+        f"{label:>5}: mean {statistics.mean(timings) * 1000:8.1f} ms  "
+        f"median {statistics.median(timings) * 1000:8.1f} ms  "
+        f"min {min(timings) * 1000:8.1f} ms  ({runs} runs)"
+    )
+    return timings
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("document", type=Path, nargs="?", default=ROOT / "Study Plan.md")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    body = markdown_to_html(args.document.read_text(encoding="utf-8"))
+    html = HTML_TEMPLATE.format(title=args.document.stem, body=body)
+    context = RenderContext()
+    render_warm(html, context)  # Prime the context; the first warm render pays the parse.
+
+    cold = measure("cold", lambda: render_cold(html), args.runs)
+    warm = measure("warm", lambda: render_warm(html, context), args.runs)
+    saved = statistics.median(cold) - statistics.median(warm)
+    print(f"saved per render: {saved * 1000:.1f} ms ({saved / statistics.median(cold):.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
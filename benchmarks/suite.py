@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""Benchmark every stage of the Markdown-to-PDF pipeline on a fixed corpus.
+
+The corpus is ``Study Plan.md``, ``math_demo.md`` and synthetic documents
+generated from a fixed seed that scale in size, table count, code-block
+count and math density. Each document goes through the pipeline stage by
+stage, and every stage is timed on its own:
+
+  math_extract   extract_math_expressions()
+  math_unicode   convert_many_latex_to_unicode() on the extracted math
+  math_render    prerender_math() with a fresh, memory-only math cache
+  markdown       markdown_to_html() on the math-protected text
+  template       restore_math() and HTML_TEMPLATE assembly
+  css            parsing the default and math stylesheets
+  layout         WeasyPrint layout (HTML.render)
+  pdf_write      Document.write_pdf
+
+Each stage records the median and fastest of ``--runs`` repetitions after a
+warm-up run; peak Python memory per stage comes from one extra run under
+tracemalloc.
+
+Usage:
+  python benchmarks/suite.py run [--runs 5] [--stages markdown,math_extract] [-o results.json]
+  python benchmarks/suite.py compare baseline.json results.json [--threshold 0.1]
+
+``compare`` checks the fastest run of each stage (the one least disturbed by
+other load) and exits with status 1 when any stage got slower, or used more
+memory, than the baseline by more than the threshold.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import importlib.metadata
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from markdown_pool import DEFAULT_EXTENSIONS, MarkdownPool  # noqa: E402
+from math_renderer import (  # noqa: E402
+    MATH_CSS,
+    MathCache,
+    convert_many_latex_to_unicode,
+    extract_math_expressions,
+    prerender_math,
+    restore_math,
+)
+
+STAGES = ["math_extract", "math_unicode", "math_render", "markdown", "template", "css", "layout", "pdf_write"]
+# Stages that need WeasyPrint (and therefore main.py).
+PDF_STAGES = {"template", "css", "layout", "pdf_write"}
+SEED = 20240601
+# Differences smaller than this are noise, whatever the ratio.
+MIN_DELTA_SECONDS = 0.002
+MIN_DELTA_BYTES = 64 * 1024
+
+_WORDS = (
+    "analysis model data result method value system process function research study "
+    "theory design sample measure error signal network feature training estimate"
+).split()
+_LATEX = [
+    r"\alpha + \beta = \gamma",
+    r"\frac{a}{b} + \sqrt{x^2 + y^2}",
+    r"\sum_{i=1}^{n} x_i^2",
+    r"\int_{0}^{\infty} e^{-t} dt",
+    r"\mathbb{R}^n \to \mathbb{R}",
+    r"\begin{pmatrix} a & b \\ c & d \end{pmatrix}",
+]
+
+
+# -- corpus -----------------------------------------------------------
+
+
+def synthetic_document(
+    sections: int,
+    tables: int = 0,
+    code_blocks: int = 0,
+    math_per_paragraph: float = 0.0,
+    seed: int = SEED,
+) -> str:
+    """Build a deterministic document with the given shape."""
+    rng = random.Random(seed)
+
+    def sentence() -> str:
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 18))]
+        return " ".join(words).capitalize() + "."
+
+    def paragraph() -> str:
+        parts = [sentence() for _ in range(rng.randint(3, 6))]
+        math = int(math_per_paragraph) + (1 if rng.random() < math_per_paragraph % 1 else 0)
+        for _ in range(math):
+            expression = rng.choice(_LATEX)
+            position = rng.randrange(len(parts) + 1)
+            parts.insert(position, f"$$\n{expression}\n$$" if rng.random() < 0.3 else f"${expression}$")
+        return " ".join(parts)
+
+    blocks = ["# Synthetic benchmark document"]
+    for index in range(sections):
+        blocks.append(f"## Section {index + 1}")
+        blocks.extend(paragraph() for _ in range(3))
+        blocks.append("\n".join(f"- {sentence()}" for _ in range(4)))
+    for index in range(tables):
+        header = "| Name | Value | Notes |\n|------|------:|-------|"
+        rows = "\n".join(f"| {rng.choice(_WORDS)} | {rng.randint(1, 999)} | {sentence()} |" for _ in range(8))
+        blocks.insert(1 + (index * 7) % len(blocks), f"{header}\n{rows}")
+    for index in range(code_blocks):
+        code = "\n".join(f"    result_{line} = compute({line}, '{rng.choice(_WORDS)}')" for line in range(10))
+        blocks.insert(1 + (index * 5) % len(blocks), f"```python\ndef block_{index}():\n{code}\n```")
+    return "\n\n".join(blocks) + "\n"
+
+
+def corpus() -> Dict[str, str]:
+    documents = {
+        "study-plan": (ROOT / "Study Plan.md").read_text(encoding="utf-8"),
+        "math-demo": (ROOT / "math_demo.md").read_text(encoding="utf-8"),
+    }
+    for sections in (10, 100, 400):
+        documents[f"synthetic-{sections}-sections"] = synthetic_document(sections)
+    documents["tables-40"] = synthetic_document(20, tables=40)
+    documents["code-blocks-60"] = synthetic_document(20, code_blocks=60)
+    documents["math-dense"] = synthetic_document(40, math_per_paragraph=3.0)
+    return documents
+
+
+# -- pipeline ---------------------------------------------------------
+
+
+class Pipeline:
+    """Runs the stages in order, each on the previous stage's output."""
+
+    def __init__(self, stages: List[str]) -> None:
+        self.stages = stages
+        self.markdown = MarkdownPool(DEFAULT_EXTENSIONS)
+        self.main: Any = None
+        if PDF_STAGES & set(stages):
+            import main
+
+            # WeasyPrint is only needed for these stages.
+            main.load_weasyprint()
+
+            self.main = main
+
+    def steps(self, text: str) -> List[Tuple[str, Callable[[Dict[str, Any]], None]]]:
+        main = self.main
+
+        def math_extract(state: Dict[str, Any]) -> None:
+            state["math"] = extract_math_expressions(text)
+
+        def math_unicode(state: Dict[str, Any]) -> None:
+            convert_many_latex_to_unicode(latex for _, latex, _ in state.get("math") or extract_math_expressions(text))
+
+        def math_render(state: Dict[str, Any]) -> None:
+            state["protected"], state["fragments"] = prerender_math(text, MathCache(None))
+
+        def markdown(state: Dict[str, Any]) -> None:
+            state["body"] = self.markdown.convert(state.get("protected", text))
+
+        def template(state: Dict[str, Any]) -> None:
+            body = restore_math(state.get("body", ""), state.get("fragments"))
+            state["html"] = main.HTML_TEMPLATE.format(title="Benchmark", body=body)
+
+        def css(state: Dict[str, Any]) -> None:
+            font_config = main.FontConfiguration()
+            state["font_config"] = font_config
+            state["stylesheets"] = [
+                main.CSS(string=main.DEFAULT_CSS, font_config=font_config),
+                main.CSS(string=MATH_CSS, font_config=font_config),
+            ]
+
+        def layout(state: Dict[str, Any]) -> None:
+            state["document"] = main.HTML(string=state["html"]).render(
+                stylesheets=state["stylesheets"], font_config=state["font_config"]
+            )
+
+        def pdf_write(state: Dict[str, Any]) -> None:
+            state["pdf_bytes"] = len(state["document"].write_pdf())
+
+        available = {
+            "math_extract": math_extract,
+            "math_unicode": math_unicode,
+            "math_render": math_render,
+            "markdown": markdown,
+            "template": template,
+            "css": css,
+            "layout": layout,
+            "pdf_write": pdf_write,
+        }
+        return [(name, available[name]) for name in STAGES if name in self.stages]
+
+    def timed(self, text: str) -> Dict[str, float]:
+        state: Dict[str, Any] = {}
+        timings = {}
+        for name, step in self.steps(text):
+            start = time.perf_counter()
+            step(state)
+            timings[name] = time.perf_counter() - start
+        return timings
+
+    def traced(self, text: str) -> Dict[str, int]:
+        state: Dict[str, Any] = {}
+        peaks = {}
+        tracemalloc.start()
+        try:
+            for name, step in self.steps(text):
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                step(state)
+                _, peak = tracemalloc.get_traced_memory()
+                peaks[name] = peak - baseline
+        finally:
+            tracemalloc.stop()
+        return peaks
+
+
+def run_suite(stages: List[str], runs: int, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    pipeline = Pipeline(stages)
+    results: Dict[str, Any] = {}
+    for name, text in corpus().items():
+        if only and name not in only:
+            continue
+        pipeline.timed(text)  # Warm-up: imports, caches, converters.
+        samples: Dict[str, List[float]] = {stage: [] for stage in stages}
+        for _ in range(runs):
+            for stage, seconds in pipeline.timed(text).items():
+                samples[stage].append(seconds)
+        peaks = pipeline.traced(text)
+        results[name] = {
+            "chars": len(text),
+            "stages": {
+                stage: {
+                    "median": statistics.median(values),
+                    "min": min(values),
+                    "runs": values,
+                    "peak_bytes": peaks.get(stage, 0),
+                }
+                for stage, values in samples.items()
+                if values
+            },
+        }
+        total = sum(stage["median"] for stage in results[name]["stages"].values())
+        print(f"{name:>26}  {len(text):>9,} chars  {total * 1000:9.1f} ms", file=sys.stderr)
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    info: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+    for package in ("markdown", "weasyprint"):
+        try:
+            info[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            info[package] = None
+    return info
+
+
+# -- reporting --------------------------------------------------------
+
+
+def print_table(results: Dict[str, Any]) -> None:
+    print(f"{'document':>26} {'stage':>13} {'median ms':>10} {'min ms':>9} {'peak KB':>9}")
+    for name, result in results.items():
+        for stage, data in result["stages"].items():
+            print(
+                f"{name:>26} {stage:>13} {data['median'] * 1000:10.2f} {data['min'] * 1000:9.2f} "
+                f"{data['peak_bytes'] / 1024:9.1f}"
+            )
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Return one line per stage that regressed beyond ``threshold``."""
+    regressions = []
+    print(f"{'document':>26} {'stage':>13} {'baseline ms':>12} {'current ms':>11} {'time':>8}  {'memory':>8}")
+    for name, result in current["results"].items():
+        base_result = baseline["results"].get(name)
+        if base_result is None:
+            continue
+        for stage, data in result["stages"].items():
+            base = base_result["stages"].get(stage)
+            if base is None:
+                continue
+            # The fastest run is the least disturbed by other load on the machine.
+            ratio = data["min"] / base["min"] if base["min"] else 1.0
+            memory_ratio = data["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] else 1.0
+            slower = ratio > 1 + threshold and data["min"] - base["min"] > MIN_DELTA_SECONDS
+            bigger = memory_ratio > 1 + threshold and data["peak_bytes"] - base["peak_bytes"] > MIN_DELTA_BYTES
+            flag = "  REGRESSION" if slower or bigger else ""
+            print(
+                f"{name:>26} {stage:>13} {base['min'] * 1000:12.2f} {data['min'] * 1000:11.2f} "
+                f"{ratio - 1:+8.1%}  {memory_ratio - 1:+8.1%}{flag}"
+            )
+            if slower:
+                regressions.append(f"{name}/{stage}: {ratio - 1:+.1%} time")
+            if bigger:
+                regressions.append(f"{name}/{stage}: {memory_ratio - 1:+.1%} peak memory")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the suite and print or save the results")
+    run.add_argument("--runs", type=int, default=5, help="Timed repetitions per document (default: 5)")
+    run.add_argument("--stages", default=",".join(STAGES), help="Comma-separated stages to run (default: all)")
+    run.add_argument("--documents", help="Comma-separated corpus documents to run (default: all)")
+    run.add_argument("-o", "--output", type=Path, help="Write results as JSON to this file")
+
+    cmp = commands.add_parser("compare", help="Flag regressions against a baseline results file")
+    cmp.add_argument("baseline", type=Path)
+    cmp.add_argument("current", type=Path)
+    cmp.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown ratio (default: 0.10)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        current = json.loads(args.current.read_text(encoding="utf-8"))
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s):")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("\nNo regressions.")
+        return 0
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}; choose from {', '.join(STAGES)}")
+    if {"layout", "pdf_write"} & set(stages) and not {"template", "css"} <= set(stages):
+        parser.error("layout and pdf_write need the template and css stages")
+    only = [name.strip() for name in args.documents.split(",")] if args.documents else None
+
+    results = run_suite(stages, args.runs, only)
+    payload = {"environment": environment(), "stages": stages, "runs": args.runs, "results": results}
+    if args.output is not None:
+        args.output.write_text(json.dumps(payload, indent=1), encoding="utf-8")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print_table(results)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
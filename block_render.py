@@ -0,0 +1,364 @@
+"""
+Block-level incremental Markdown rendering for the live HTML view.
+
+The source is split into top-level blocks (paragraphs, headings, whole lists,
+fenced code, tables, quotes) and each block is rendered on its own, with its
+HTML cached by a hash of the block text. After an edit only the blocks whose
+text changed are rendered again, so the cost of a keystroke no longer grows
+with the document.
+
+Parts of Markdown that are document-wide are handled outside the blocks:
+reference-style link definitions and abbreviations (from ``extra``) are
+collected from the whole document and appended to each block that uses
+them, and footnotes are numbered and collected into one trailing section
+exactly as a whole-document render would.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_MAX_BLOCKS = 4096
+
+_FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_LIST_ITEM = re.compile(r"^ {0,3}(?:[*+-]|\d{1,9}[.)])(?:[ \t]|$)")
+_HTML_OPEN = re.compile(r"^<([A-Za-z][A-Za-z0-9-]*)(?=[\s/>])")
+_HTML_COMMENT_OPEN = re.compile(r"^ {0,3}<!--")
+_MARKDOWN_ATTRIBUTE = re.compile(r"""\smarkdown\s*=\s*["']?(?:1|block|span)""", re.IGNORECASE)
+_REFERENCE_DEFINITION = re.compile(r"^ {0,3}\[([^\]^][^\]]*)\]:[ \t]*\S")
+_FOOTNOTE_DEFINITION = re.compile(r"^ {0,3}\[\^([^\]]+)\]:")
+_ABBREVIATION = re.compile(r"^ {0,3}\*\[([^\]]+)\]:")
+_BRACKETED = re.compile(r"\[([^\]\[]*)\]")
+_FOOTNOTE_REFERENCE = re.compile(r"\[\^([^\]]+)\]")
+_FOOTNOTE_SECTION = re.compile(r'\n?<div class="footnote">.*</div>\s*\Z', re.DOTALL)
+_FOOTNOTE_ANCHOR = re.compile(r'<sup id="fnref\d*:([^"]+)"><a class="footnote-ref" href="#fn:\1">[^<]*</a></sup>')
+_FOOTNOTE_NUMBER = re.compile(r'<a class="footnote-ref" href="#fn:([^"]+)">([^<]*)</a>')
+
+
+def _label(text: str) -> str:
+    """Normalize a link label the way Markdown matches them."""
+    return " ".join(text.split()).lower()
+
+
+def _hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def split_blocks(markdown_text: str) -> List[str]:
+    """Split Markdown into top-level blocks that render independently.
+
+    Blank lines end a block except inside fenced code, raw HTML (including
+    nested tags and ``markdown="1"`` elements) or an HTML comment, before
+    indented continuation lines, between items of the same list (so loose
+    lists stay one list) and between consecutive quote or definition lines.
+    """
+    blocks: List[str] = []
+    current: List[str] = []
+    fence: Optional[str] = None
+    html_tag: Optional[str] = None
+    html_depth = 0
+    html_markdown = False  # Markdown inside the element: fenced code still counts.
+    in_comment = False
+    blank_run = 0
+
+    def flush() -> None:
+        while current and not current[-1].strip():
+            current.pop()
+        if current:
+            blocks.append("\n".join(current))
+        current.clear()
+
+    for line in markdown_text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        if fence is not None:
+            current.append(line)
+            stripped = line.strip()
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                fence = None
+            continue
+        if in_comment:
+            current.append(line)
+            in_comment = "-->" not in line
+            continue
+        if html_tag is not None:
+            current.append(line)
+            fence_match = _FENCE.match(line) if html_markdown else None
+            if fence_match is not None:
+                fence = fence_match.group(1)
+                continue
+            html_depth += _tag_balance(html_tag, line)
+            if html_depth <= 0:
+                html_tag = None
+            continue
+        if not line.strip():
+            if current:
+                current.append(line)
+                blank_run += 1
+            continue
+
+        if blank_run and current:
+            first = current[0]
+            continues = (
+                line[:1] in (" ", "\t")
+                or (_LIST_ITEM.match(first) is not None and _LIST_ITEM.match(line) is not None)
+                or (first.lstrip().startswith(">") and line.lstrip().startswith(">"))
+                or line.startswith(":")
+            )
+            if not continues:
+                flush()
+        blank_run = 0
+
+        if not current:
+            opening = _HTML_OPEN.match(line)
+            if opening is not None:
+                html_depth = _tag_balance(opening.group(1).lower(), line)
+                if html_depth > 0:
+                    html_tag = opening.group(1).lower()
+                    html_markdown = _MARKDOWN_ATTRIBUTE.search(line) is not None
+        comment = _HTML_COMMENT_OPEN.match(line)
+        if comment is not None and html_tag is None and "-->" not in line[comment.end():]:
+            in_comment = True
+        fence_match = _FENCE.match(line)
+        if fence_match is not None:
+            fence = fence_match.group(1)
+        current.append(line)
+    flush()
+    return blocks
+
+
+def _tag_balance(tag: str, line: str) -> int:
+    """Count the ``<tag`` openings in ``line`` minus its ``</tag>`` closings."""
+    line = line.lower()
+    return len(re.findall(rf"<{tag}(?=[\s/>]|$)", line)) - len(re.findall(rf"</{tag}\s*>", line))
+
+
+def _ends_raw(block: str, html: str) -> bool:
+    """Whether ``block`` ends in raw HTML passed through unchanged.
+
+    A whole-document render keeps the blank line after such HTML. Elements
+    with a ``markdown`` attribute are parsed instead, and keep only a newline.
+    """
+    last = block.rsplit("\n", 1)[-1].strip()
+    if not last or not html.endswith(last):
+        return False
+    if last.endswith("-->"):
+        return True
+    return _HTML_OPEN.match(block) is not None and _MARKDOWN_ATTRIBUTE.search(block.split("\n", 1)[0]) is None
+
+
+@dataclass(frozen=True)
+class _Definitions:
+    references: Dict[str, str]
+    abbreviations: Dict[str, str]
+    footnotes: "OrderedDict[str, str]"
+
+
+def _extract_definitions(blocks: List[str]) -> Tuple[List[str], _Definitions]:
+    """Pull document-wide definitions out of ``blocks``.
+
+    Returns the blocks without definition lines (they render to nothing)
+    and the definitions keyed by label.
+    """
+    references: Dict[str, str] = {}
+    abbreviations: Dict[str, str] = {}
+    footnotes: "OrderedDict[str, str]" = OrderedDict()
+    stripped_blocks = []
+    for block in blocks:
+        if "]:" not in block or _FENCE.match(block):
+            stripped_blocks.append(block)
+            continue
+        kept: List[str] = []
+        lines = block.split("\n")
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            footnote = _FOOTNOTE_DEFINITION.match(line)
+            if footnote is not None:
+                # A footnote owns the indented lines (and blank lines between
+                # them) that follow it.
+                end = index + 1
+                while end < len(lines) and (lines[end][:1] in (" ", "\t") or not lines[end].strip()):
+                    end += 1
+                while end > index + 1 and not lines[end - 1].strip():
+                    end -= 1
+                footnotes.setdefault(footnote.group(1), "\n".join(lines[index:end]))
+                index = end
+                continue
+            reference = _REFERENCE_DEFINITION.match(line)
+            abbreviation = _ABBREVIATION.match(line)
+            if reference is not None:
+                references.setdefault(_label(reference.group(1)), line.strip())
+            elif abbreviation is not None:
+                abbreviations.setdefault(abbreviation.group(1), line.strip())
+            else:
+                kept.append(line)
+            index += 1
+        stripped_blocks.append("\n".join(kept).strip("\n"))
+    return stripped_blocks, _Definitions(references, abbreviations, footnotes)
+
+
+@dataclass(frozen=True)
+class Block:
+    id: str
+    html: str
+    # Raw HTML blocks are followed by a blank line in a whole-document render.
+    raw: bool = False
+
+
+@dataclass(frozen=True)
+class BlockDocument:
+    """A rendered document as an ordered list of blocks."""
+
+    blocks: List[Block]
+
+    @property
+    def html(self) -> str:
+        parts = []
+        for index, block in enumerate(self.blocks):
+            parts.append(block.html)
+            if index + 1 < len(self.blocks):
+                parts.append("\n\n" if block.raw else "\n")
+        return "".join(parts)
+
+    @property
+    def ids(self) -> List[str]:
+        return [block.id for block in self.blocks]
+
+    def patch(self, known: Iterable[str]) -> Dict[str, object]:
+        """Return the block order plus the HTML of blocks not in ``known``."""
+        known_ids = set(known)
+        return {
+            "blocks": self.ids,
+            "changed": {block.id: block.html for block in self.blocks if block.id not in known_ids},
+        }
+
+
+class BlockRenderer:
+    """Render Markdown block by block, reusing cached HTML for unchanged blocks.
+
+    Args:
+        render: Markdown-to-HTML function used for each block; it must enable
+            the same extensions as a whole-document render.
+        max_blocks: Most rendered blocks kept in the LRU cache.
+    """
+
+    def __init__(self, render: Callable[[str], str], max_blocks: int = DEFAULT_MAX_BLOCKS) -> None:
+        self._render = render
+        self.max_blocks = max_blocks
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def render(self, markdown_text: str) -> BlockDocument:
+        sources = split_blocks(markdown_text)
+        blocks, definitions = _extract_definitions(sources)
+
+        rendered: List[str] = []
+        raw: List[bool] = []
+        references: List[str] = []
+        for source, block in zip(sources, blocks):
+            if not block.strip():
+                continue
+            html = self._render_block(block, definitions)
+            if 'class="footnote-ref"' in html:
+                references.extend(match.group(1) for match in _FOOTNOTE_NUMBER.finditer(html))
+            if html.strip():
+                rendered.append(html)
+                # Judged on the source: a definition after the HTML hides the blank line.
+                raw.append(_ends_raw(source, html))
+
+        if references:
+            rendered = self._number_footnotes(rendered, references, definitions)
+            raw.append(False)
+
+        document: List[Block] = []
+        seen: Dict[str, int] = {}
+        for html, is_raw in zip(rendered, raw):
+            block_id = "b" + _hash(html)[:12]
+            count = seen.get(block_id, 0)
+            seen[block_id] = count + 1
+            document.append(Block(block_id if not count else f"{block_id}-{count}", html, is_raw))
+        return BlockDocument(document)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._cache)
+        return stats
+
+    # -- blocks ---------------------------------------------------------
+
+    def _render_block(self, block: str, definitions: _Definitions) -> str:
+        # Append only the definitions this block can use, so editing one link
+        # target does not invalidate every cached block.
+        extra: List[str] = []
+        if "[" in block:
+            labels = {_label(text) for text in _BRACKETED.findall(block)}
+            extra.extend(definitions.references[label] for label in sorted(labels & definitions.references.keys()))
+            # Footnote text is rendered in the footnote section; a stub is
+            # enough for the reference to become a link.
+            for label in dict.fromkeys(_FOOTNOTE_REFERENCE.findall(block)):
+                if label in definitions.footnotes:
+                    extra.append(f"[^{label}]: .")
+        extra.extend(text for abbr, text in definitions.abbreviations.items() if abbr in block)
+        source = block + ("\n\n" + "\n".join(extra) if extra else "")
+
+        key = _hash(source)
+        with self._lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                self._counters["hits"] += 1
+                return html
+            self._counters["misses"] += 1
+
+        html = _FOOTNOTE_SECTION.sub("", self._render(source))
+        with self._lock:
+            self._cache[key] = html
+            while len(self._cache) > self.max_blocks:
+                self._cache.popitem(last=False)
+                self._counters["evictions"] += 1
+        return html
+
+    # -- footnotes ------------------------------------------------------
+
+    def _number_footnotes(self, rendered: List[str], references: List[str], definitions: _Definitions) -> List[str]:
+        """Give footnote references document-wide numbers and ids and append
+        the footnote section, as a whole-document render would."""
+        # Render every reference, in document order, against the real
+        # definitions; that yields both the numbering and the section.
+        source = "".join(f"[^{label}]" for label in references) + "\n\n" + "\n\n".join(definitions.footnotes.values())
+        key = _hash("footnotes", source)
+        with self._lock:
+            html = self._cache.get(key)
+        if html is None:
+            html = self._render(source)
+            with self._lock:
+                self._cache[key] = html
+        numbers = dict(_FOOTNOTE_NUMBER.findall(html))
+        section = _FOOTNOTE_SECTION.search(html)
+
+        occurrences: Dict[str, int] = {}
+
+        def renumber(match: "re.Match[str]") -> str:
+            label = match.group(1)
+            count = occurrences[label] = occurrences.get(label, 0) + 1
+            ref_id = f"fnref:{label}" if count == 1 else f"fnref{count}:{label}"
+            return (f'<sup id="{ref_id}"><a class="footnote-ref" href="#fn:{label}">'
+                    f'{numbers.get(label, "")}</a></sup>')
+
+        numbered = [
+            _FOOTNOTE_ANCHOR.sub(renumber, html_block) if 'class="footnote-ref"' in html_block else html_block
+            for html_block in rendered
+        ]
+        if section is not None:
+            numbered.append(section.group().strip("\n"))
+        return numbered
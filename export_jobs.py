@@ -0,0 +1,253 @@
+"""
+In-process asynchronous export jobs.
+
+``POST /jobs`` hands a render to a bounded pool of worker threads and returns
+immediately; clients poll the job for its status and download the PDF once
+it is done. Finished PDFs are kept in a scratch directory for a retention
+period so they can be fetched (and re-fetched) later; a background thread
+removes them once it has passed, and ``close`` removes the directory. Nothing
+here needs an external broker: the queue lives in the server process.
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_DEPTH = 32
+DEFAULT_RETENTION = 15 * 60.0
+DEFAULT_MAX_RETAINED = 256
+# Most seconds between two sweeps for expired results.
+_EXPIRE_INTERVAL = 30.0
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# render(payload, target, progress): write the PDF for ``payload`` into the
+# binary file ``target``, calling ``progress(fraction, stage)`` as it goes.
+Renderer = Callable[[Dict[str, Any], BinaryIO, Callable[[float, str], None]], None]
+
+
+class JobQueueFull(Exception):
+    """Raised by ``JobQueue.submit`` when the queue is at its depth limit."""
+
+
+@dataclass
+class Job:
+    id: str
+    title: str
+    payload: Dict[str, Any]
+    status: str = QUEUED
+    stage: str = QUEUED
+    progress: float = 0.0
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    result_path: Optional[Path] = None
+    size: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public, JSON-serializable view of the job (without its payload)."""
+        now = time.time()
+        waited = (self.started or now) - self.created
+        rendered = (self.finished or now) - self.started if self.started is not None else None
+        return {
+            "id": self.id,
+            "title": self.title,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "queue_seconds": round(waited, 3),
+            "render_seconds": round(rendered, 3) if rendered is not None else None,
+            "error": self.error,
+            "size": self.size,
+        }
+
+
+class JobQueue:
+    """Bounded pool of export workers with polling and result retention.
+
+    Args:
+        render: Callable that writes one job's PDF (see ``Renderer``).
+        workers: Number of jobs rendered concurrently.
+        queue_depth: Most jobs allowed to wait for a worker; further
+            submissions raise ``JobQueueFull``.
+        retention: Seconds a finished job (and its PDF) is kept.
+        max_retained: Most finished jobs kept regardless of age; the oldest
+            are dropped first.
+        result_dir: Directory for finished PDFs (a private temporary
+            directory by default).
+    """
+
+    def __init__(
+        self,
+        render: Renderer,
+        workers: int = DEFAULT_WORKERS,
+        queue_depth: int = DEFAULT_QUEUE_DEPTH,
+        retention: float = DEFAULT_RETENTION,
+        max_retained: int = DEFAULT_MAX_RETAINED,
+        result_dir: Optional[Path] = None,
+    ) -> None:
+        self.render = render
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.retention = retention
+        self.max_retained = max_retained
+        self._owns_dir = result_dir is None
+        self.result_dir = Path(result_dir) if result_dir is not None else Path(tempfile.mkdtemp(prefix="pymark-jobs-"))
+        self.result_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._queued = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pymark-job")
+        self._counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "expired": 0}
+        # Results expire on time even when no one submits or polls.
+        self._closed = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep, name="pymark-job-expiry", daemon=True)
+        self._sweeper.start()
+
+    # -- public API -----------------------------------------------------
+
+    def submit(self, payload: Dict[str, Any], title: str = "Document") -> Job:
+        """Queue a render and return its job without waiting for it."""
+        self._expire()
+        with self._lock:
+            if self._queued >= self.queue_depth:
+                self._counters["rejected"] += 1
+                raise JobQueueFull(f"export queue is full ({self.queue_depth} jobs waiting)")
+            job = Job(id=uuid.uuid4().hex, title=title, payload=payload)
+            self._jobs[job.id] = job
+            self._queued += 1
+            self._counters["submitted"] += 1
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return the job with ``job_id`` unless it is unknown or expired."""
+        self._expire()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def open_result(self, job: Job) -> Optional[BinaryIO]:
+        """Open a finished job's PDF for reading, or ``None`` if not available."""
+        if job.status != DONE or job.result_path is None:
+            return None
+        try:
+            return job.result_path.open("rb")
+        except OSError:
+            return None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["queued"] = self._queued
+            stats["running"] = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+            stats["retained"] = sum(1 for job in self._jobs.values() if job.status in (DONE, FAILED))
+            stats["workers"] = self.workers
+            stats["queue_depth"] = self.queue_depth
+        return stats
+
+    def close(self, wait: bool = True) -> None:
+        """Stop accepting work and remove retained results and their directory.
+
+        With ``wait=False``, queued jobs are cancelled and running ones are
+        not waited for.
+        """
+        self._closed.set()
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            self._discard(job)
+        if self._owns_dir:
+            shutil.rmtree(self.result_dir, ignore_errors=True)
+
+    # -- workers --------------------------------------------------------
+
+    def _run(self, job: Job) -> None:
+        with self._lock:
+            self._queued -= 1
+            job.status = job.stage = RUNNING
+            job.started = time.time()
+        # Drop the payload as soon as it is no longer needed; a queue of large
+        # documents should not keep every source text alive until expiry.
+        payload, job.payload = job.payload, {}
+
+        def progress(fraction: float, stage: str) -> None:
+            job.progress = max(job.progress, min(fraction, 0.99))
+            job.stage = stage
+
+        path = self.result_dir / f"{job.id}.pdf"
+        try:
+            with path.open("wb") as target:
+                self.render(payload, target, progress)
+            size = path.stat().st_size
+        except Exception as exc:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            with self._lock:
+                job.status = job.stage = FAILED
+                job.error = str(exc)
+                job.finished = time.time()
+                self._counters["failed"] += 1
+            return
+
+        with self._lock:
+            job.result_path = path
+            job.size = size
+            job.progress = 1.0
+            job.status = job.stage = DONE
+            job.finished = time.time()
+            self._counters["done"] += 1
+
+    # -- retention ------------------------------------------------------
+
+    def _sweep(self) -> None:
+        interval = max(1.0, min(self.retention, _EXPIRE_INTERVAL))
+        while not self._closed.wait(interval):
+            self._expire()
+
+    def _expire(self) -> None:
+        now = time.time()
+        with self._lock:
+            finished = sorted(
+                (job for job in self._jobs.values() if job.finished is not None),
+                key=lambda job: job.finished or 0.0,
+            )
+            excess = len(finished) - self.max_retained
+            expired = [
+                job
+                for index, job in enumerate(finished)
+                if index < excess or now - (job.finished or now) > self.retention
+            ]
+            for job in expired:
+                del self._jobs[job.id]
+            self._counters["expired"] += len(expired)
+        for job in expired:
+            self._discard(job)
+
+    @staticmethod
+    def _discard(job: Job) -> None:
+        if job.result_path is not None:
+            try:
+                os.unlink(job.result_path)
+            except OSError:
+                pass
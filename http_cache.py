@@ -0,0 +1,255 @@
+"""
+HTTP validators, compression and cache policy for the web app.
+
+* ``content_etag`` derives a strong ETag from everything a response depends
+  on, so ``/render-html`` and ``/export`` can answer ``If-None-Match`` with
+  ``304 Not Modified`` before doing any work.
+* ``Compressor`` negotiates ``br`` or ``gzip`` for text responses (HTML,
+  JSON, CSS, JavaScript) and keeps the compressed bodies of responses with
+  an ETag, so a preview that is polled unchanged is compressed once.
+* ``StaticFingerprints`` adds a content hash to the URLs of files under
+  ``static/`` (``app.js?v=3f2a9c01b4de``). Fingerprinted requests can be
+  cached by browsers for a year; the page that links them is revalidated.
+
+Brotli is used when the ``brotli`` module is installed (fontTools brings it
+in with WeasyPrint); otherwise responses are gzipped.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+try:  # Optional: installed alongside WeasyPrint.
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None  # type: ignore
+
+COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+    "text/css",
+    "text/html",
+    "text/javascript",
+    "text/markdown",
+    "text/plain",
+}
+# Below this a compressed body saves less than the headers cost.
+MIN_COMPRESS_BYTES = 1024
+DEFAULT_CACHE_BYTES = 8 * 1024 * 1024
+STATIC_MAX_AGE = 365 * 24 * 3600
+IMMUTABLE = f"public, max-age={STATIC_MAX_AGE}, immutable"
+REVALIDATE = "no-cache"
+PRIVATE_REVALIDATE = "private, no-cache"
+
+_ENCODING_SUFFIX = re.compile(r'-(?:br|gzip)"$')
+
+
+def content_etag(*parts: Optional[str]) -> str:
+    """Strong ETag value (unquoted) over ``parts``; ``None`` and ``""`` differ."""
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = b"\x00" if part is None else b"\x01" + part.encode("utf-8")
+        digest.update(len(encoded).to_bytes(8, "big") + encoded)
+    return digest.hexdigest()[:32]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an ``If-None-Match`` header matches the unquoted ``etag``.
+
+    Uses the weak comparison RFC 9110 prescribes for ``If-None-Match``, and
+    accepts the tags of the compressed variants ``Compressor`` sends.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if _ENCODING_SUFFIX.sub('"', candidate) == f'"{etag}"':
+            return True
+    return False
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick ``br`` or ``gzip`` from an ``Accept-Encoding`` header (``None`` for identity)."""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        weight = 1.0
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        if match:
+            try:
+                weight = float(match.group(1))
+            except ValueError:
+                weight = 0.0
+        weights[name.strip()] = weight
+    star = weights.get("*", 0.0)
+    offered = [("br", brotli is not None), ("gzip", True)]
+    best = None
+    best_weight = 0.0
+    for name, available in offered:
+        weight = weights.get(name, star)
+        if available and weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        # Quality 5 is several times faster than the default 11 and within a
+        # few percent of its size on HTML.
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+class Compressor:
+    """Compress text responses, caching the bodies of responses with an ETag.
+
+    Args:
+        max_cache_bytes: Budget for cached compressed bodies; least recently
+            used entries are evicted first.
+    """
+
+    def __init__(self, max_cache_bytes: int = DEFAULT_CACHE_BYTES) -> None:
+        self.max_cache_bytes = max_cache_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._size = 0
+        self._counters = {"compressed": 0, "hits": 0, "bytes_in": 0, "bytes_out": 0, "evictions": 0}
+
+    def apply(self, response, accept_encoding: Optional[str], if_none_match: Optional[str] = None):
+        """Compress a Werkzeug ``response`` in place when worthwhile; return it.
+
+        With ``if_none_match`` (pass it for ``GET`` and ``HEAD`` only), a
+        response whose ETag matches is turned into ``304 Not Modified``.
+        """
+        if response.status_code != 200 or "Content-Encoding" in response.headers:
+            return response
+        compressible = (
+            response.mimetype in COMPRESSIBLE_TYPES
+            and not (response.is_streamed and not response.direct_passthrough)
+            and "Content-Range" not in response.headers
+        )
+        encoding = None
+        if compressible:
+            response.vary.add("Accept-Encoding")
+            length = response.content_length
+            if length is None or length >= MIN_COMPRESS_BYTES:
+                encoding = negotiate_encoding(accept_encoding)
+
+        etag, weak = response.get_etag()
+        if etag and etag_matches(if_none_match, etag):
+            if encoding is not None:
+                response.set_etag(f"{etag}-{encoding}", weak=weak)
+            response.status_code = 304  # Werkzeug drops the body and its headers.
+            return response
+        if encoding is None:
+            return response
+
+        key = (etag, encoding) if etag else None
+        body = self._get(key)
+        if body is None:
+            # Static files are passed through as file wrappers; read them.
+            response.direct_passthrough = False
+            data = response.get_data()
+            if len(data) < MIN_COMPRESS_BYTES:
+                return response
+            body = compress(data, encoding)
+            self._put(key, body, len(data))
+        if hasattr(response.response, "close"):
+            response.response.close()  # The file of a static response.
+        response.direct_passthrough = False
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        if etag:
+            # Each encoding is a different representation with its own tag.
+            response.set_etag(f"{etag}-{encoding}", weak=weak)
+        return response
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        return stats
+
+    def _get(self, key: Optional[Tuple[str, str]]) -> Optional[bytes]:
+        if key is None:
+            return None
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+        return body
+
+    def _put(self, key: Optional[Tuple[str, str]], body: bytes, original: int) -> None:
+        with self._lock:
+            self._counters["compressed"] += 1
+            self._counters["bytes_in"] += original
+            self._counters["bytes_out"] += len(body)
+            if key is None or len(body) > self.max_cache_bytes // 4:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_cache_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._counters["evictions"] += 1
+
+
+class StaticFingerprints:
+    """Content hashes of static files, refreshed when a file changes."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root).resolve()
+        self._lock = threading.Lock()
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+
+    def fingerprint(self, name: str) -> Optional[str]:
+        """12 hex digits identifying the current content of ``static/<name>``."""
+        path = (self.root / name).resolve()
+        if not path.is_relative_to(self.root):
+            return None
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        with self._lock:
+            known = self._hashes.get(name)
+        if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+            return known[2]
+        fingerprint = hashlib.sha256(path.read_bytes()).hexdigest()[:12]
+        with self._lock:
+            self._hashes[name] = (stat.st_mtime_ns, stat.st_size, fingerprint)
+        return fingerprint
+
+    def url(self, name: str) -> str:
+        fingerprint = self.fingerprint(name)
+        return name if fingerprint is None else f"{name}?v={fingerprint}"
+
+    def is_current(self, name: str, version: Optional[str]) -> bool:
+        return bool(version) and version == self.fingerprint(name)
+
+    def rewrite(self, html: str, names: Iterable[str]) -> str:
+        """Point ``href``/``src`` attributes naming any of ``names`` at fingerprinted URLs."""
+        for name in names:
+            html = re.sub(
+                r'((?:href|src)=")' + re.escape(name) + '"',
+                lambda match, name=name: f'{match.group(1)}{self.url(name)}"',
+                html,
+            )
+        return html
@@ -0,0 +1,335 @@
+"""
+Downscaled, cached copies of the images a document embeds.
+
+WeasyPrint decodes every image at full resolution and embeds it at full
+size, so a report with a few camera photos is slow to render and produces a
+huge PDF. Before layout, each local ``<img>`` in the rendered HTML is
+checked against the page: an image with more pixels than the page can show
+at the target resolution (150 dpi by default) is downscaled and
+recompressed, and the ``<img>`` is pointed at the smaller copy.
+
+Copies are stored under a hash of the source bytes and the settings, so
+repeat renders (and other documents using the same picture) reuse them.
+Images are decoded in parallel threads; Pillow releases the GIL while it
+decodes and resamples. The copy keeps the original's layout size through
+``image-resolution``, so only the pixel count changes, not the page.
+
+Pillow is installed with WeasyPrint; without it images are left untouched.
+It is slow to import, so it is only imported for documents with images.
+"""
+from __future__ import annotations
+
+import hashlib
+import html
+import importlib.util
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+DEFAULT_DPI = 150
+DEFAULT_JPEG_QUALITY = 85
+# Smaller savings are not worth a lossy re-encode.
+MIN_SCALE_GAIN = 0.9
+ASSET_VERSION = "1"
+_MAX_KNOWN = 4096
+# CSS pixels per inch: the resolution WeasyPrint assumes for images.
+_CSS_DPI = 96.0
+
+_IMG_TAG = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
+_SRC_ATTR = re.compile(r"""(\bsrc\s*=\s*)(?:"([^"]*)"|'([^']*)')""", re.IGNORECASE)
+_STYLE_ATTR = re.compile(r"""(\bstyle\s*=\s*)(?:"([^"]*)"|'([^']*)')""", re.IGNORECASE)
+_PAGE_RULE = re.compile(r"@page\s*(?::[a-z-]+\s*)?\{([^}]*)\}", re.IGNORECASE)
+_PAGE_SIZE = re.compile(r"(?:^|;|\s)size\s*:\s*([^;}]+)", re.IGNORECASE)
+_LENGTH = re.compile(r"^([0-9.]+)(in|cm|mm|pt|pc|px)$")
+
+# Width and height in inches, portrait.
+PAGE_SIZES: Dict[str, Tuple[float, float]] = {
+    "a3": (11.69, 16.54),
+    "a4": (8.27, 11.69),
+    "a5": (5.83, 8.27),
+    "b4": (9.84, 13.90),
+    "b5": (6.93, 9.84),
+    "letter": (8.5, 11.0),
+    "legal": (8.5, 14.0),
+    "ledger": (11.0, 17.0),
+}
+_UNITS = {"in": 1.0, "cm": 1 / 2.54, "mm": 1 / 25.4, "pt": 1 / 72, "pc": 1 / 6, "px": 1 / 96}
+_RASTER_FORMATS = {"JPEG", "PNG", "WEBP", "BMP", "TIFF", "GIF"}
+
+
+def _default_cache_dir() -> Optional[Path]:
+    configured = os.environ.get("PYMARK_IMAGE_CACHE")
+    if configured is not None:
+        return Path(configured) if configured else None
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "pymark" / "images"
+
+
+def _default_dpi() -> int:
+    value = os.environ.get("PYMARK_IMAGE_DPI")
+    return int(value) if value else DEFAULT_DPI
+
+
+def pillow_available() -> bool:
+    # Optional (installed alongside WeasyPrint); only look for it here.
+    return importlib.util.find_spec("PIL") is not None
+
+
+def page_size_inches(css_text: str) -> Tuple[float, float]:
+    """Page width and height from the stylesheet's ``@page { size }`` (A4 if unset)."""
+    width, height = PAGE_SIZES["a4"]
+    for rule in _PAGE_RULE.finditer(css_text):
+        declared = _PAGE_SIZE.search(rule.group(1))
+        if declared is None:
+            continue
+        words = declared.group(1).replace("!important", "").lower().split()
+        lengths = [match for match in (_LENGTH.match(word) for word in words) if match is not None]
+        named = [PAGE_SIZES[word] for word in words if word in PAGE_SIZES]
+        if lengths:
+            sizes = [float(match.group(1)) * _UNITS[match.group(2)] for match in lengths]
+            width, height = sizes[0], sizes[-1]
+        elif named:
+            width, height = named[0]
+        if "landscape" in words:
+            width, height = max(width, height), min(width, height)
+        elif "portrait" in words:
+            width, height = min(width, height), max(width, height)
+    return width, height
+
+
+@dataclass(frozen=True)
+class _Asset:
+    path: Path
+    # Resolution in dpi that keeps the original's layout size.
+    dpi: float
+
+
+class ImageAssets:
+    """Downscale and cache the local images of rendered HTML.
+
+    Args:
+        cache_dir: Directory for the downscaled copies.
+        dpi: Target resolution on the page; images are never scaled below
+            the page size at this resolution.
+        jpeg_quality: Quality for recompressed JPEG copies.
+        max_workers: Threads decoding images (defaults to the CPU count).
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        dpi: int = DEFAULT_DPI,
+        jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.dpi = dpi
+        self.jpeg_quality = jpeg_quality
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        # (path, mtime, size, box) -> asset, so unchanged files are not re-read.
+        self._known: Dict[Tuple[str, int, int, Tuple[int, int]], Optional[_Asset]] = {}
+        self._counters = {"downscaled": 0, "cached": 0, "kept": 0, "failed": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def rewrite_html(self, html_text: str, base_dir: Optional[Path], css_text: str = "") -> str:
+        """Point every oversized local ``<img>`` in ``html_text`` at a downscaled copy.
+
+        Relative sources are resolved against ``base_dir`` (the ``base_url``
+        given to WeasyPrint); remote and data URLs are left alone.
+        """
+        if self.dpi <= 0 or "<img" not in html_text.lower() or not pillow_available():
+            return html_text
+        width_in, height_in = page_size_inches(css_text)
+        box = (round(width_in * self.dpi), round(height_in * self.dpi))
+
+        tags = list(_IMG_TAG.finditer(html_text))
+        sources: Dict[str, Path] = {}
+        for tag in tags:
+            path = _local_path(_src(tag.group()), base_dir)
+            if path is not None:
+                sources.setdefault(str(path), path)
+        if not sources:
+            return html_text
+
+        paths = list(sources.values())
+        if len(paths) == 1 or self.max_workers == 1:
+            assets = [self._asset(path, box) for path in paths]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(paths))) as executor:
+                assets = list(executor.map(lambda path: self._asset(path, box), paths))
+        by_source = dict(zip(sources, assets))
+
+        parts: List[str] = []
+        last = 0
+        for tag in tags:
+            path = _local_path(_src(tag.group()), base_dir)
+            asset = by_source.get(str(path)) if path is not None else None
+            if asset is None:
+                continue
+            parts.append(html_text[last:tag.start()])
+            parts.append(_retarget(tag.group(), asset))
+            last = tag.end()
+        parts.append(html_text[last:])
+        return "".join(parts)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    # -- assets ---------------------------------------------------------
+
+    def _asset(self, path: Path, box: Tuple[int, int]) -> Optional[_Asset]:
+        from PIL import Image
+
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        memo = (str(path), stat.st_mtime_ns, stat.st_size, box)
+        with self._lock:
+            known = memo in self._known
+            asset = self._known.get(memo)
+        # A copy removed from the cache since (by hand or by a cache cleaner)
+        # is built again.
+        if known and (asset is None or asset.path.exists()):
+            return asset
+        try:
+            asset = self._build(path, box)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # Leave the reference alone; WeasyPrint reports what it cannot load.
+            asset = None
+            with self._lock:
+                self._counters["failed"] += 1
+        with self._lock:
+            if len(self._known) >= _MAX_KNOWN:
+                self._known.clear()
+            self._known[memo] = asset
+        return asset
+
+    def _build(self, path: Path, box: Tuple[int, int]) -> Optional[_Asset]:
+        from PIL import Image, ImageOps
+
+        data = path.read_bytes()
+        with Image.open(path) as image:
+            if image.format not in _RASTER_FORMATS or getattr(image, "n_frames", 1) > 1:
+                return self._keep()
+            width, height = image.size
+            # EXIF orientations 5-8 turn the picture a quarter turn.
+            rotated = image.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+            if rotated:
+                width, height = height, width
+            scale = min(box[0] / width, box[1] / height, 1.0)
+            if scale > MIN_SCALE_GAIN:
+                return self._keep()
+            target = (max(1, round(width * scale)), max(1, round(height * scale)))
+            dpi = _CSS_DPI * target[0] / width
+
+            alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+            photo = image.format == "JPEG" or (image.format in ("WEBP", "TIFF", "BMP") and not alpha)
+            suffix = ".jpg" if photo else ".png"
+            digest = hashlib.sha256(data)
+            digest.update(f"|{target[0]}x{target[1]}|{self.jpeg_quality}|{ASSET_VERSION}".encode("ascii"))
+            key = digest.hexdigest()
+            cached = self.cache_dir / key[:2] / f"{key}{suffix}"
+            if cached.exists():
+                with self._lock:
+                    self._counters["cached"] += 1
+                return _Asset(cached, dpi)
+
+            if image.format == "JPEG":
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 scale: far less work.
+                image.draft("RGB", target[::-1] if rotated else target)
+            upright = ImageOps.exif_transpose(image)
+            if photo:
+                upright = upright.convert("RGB")
+            elif upright.mode not in ("RGB", "RGBA", "L", "LA"):
+                upright = upright.convert("RGBA" if alpha else "RGB")
+            resized = upright.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cached.parent, suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                if photo:
+                    resized.save(fh, "JPEG", quality=self.jpeg_quality, optimize=True)
+                else:
+                    resized.save(fh, "PNG", optimize=False)
+            os.replace(tmp, cached)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._counters["downscaled"] += 1
+            self._counters["bytes_in"] += len(data)
+            self._counters["bytes_out"] += cached.stat().st_size
+        return _Asset(cached, dpi)
+
+    def _keep(self) -> None:
+        with self._lock:
+            self._counters["kept"] += 1
+        return None
+
+
+def _src(tag: str) -> Optional[str]:
+    match = _SRC_ATTR.search(tag)
+    if match is None:
+        return None
+    value = match.group(2) if match.group(2) is not None else match.group(3)
+    return html.unescape(value)
+
+
+def _local_path(src: Optional[str], base_dir: Optional[Path]) -> Optional[Path]:
+    if not src:
+        return None
+    parsed = urlparse(src)
+    if parsed.scheme == "file":
+        return Path(unquote(parsed.path))
+    if parsed.scheme or parsed.netloc or not parsed.path:
+        return None
+    path = Path(unquote(parsed.path))
+    if path.is_absolute():
+        return path
+    return base_dir / path if base_dir is not None else None
+
+
+def _retarget(tag: str, asset: _Asset) -> str:
+    """Swap the tag's ``src`` for the copy and keep its layout size."""
+    tag = _SRC_ATTR.sub(lambda match: f'{match.group(1)}"{html.escape(asset.path.as_uri())}"', tag, count=1)
+    declaration = f"image-resolution: {asset.dpi:.4f}dpi"
+    style = _STYLE_ATTR.search(tag)
+    if style is None:
+        end = -2 if tag.endswith("/>") else -1
+        return f'{tag[:end].rstrip()} style="{declaration}"{tag[end:]}'
+    quote = '"' if style.group(2) is not None else "'"
+    existing = style.group(2) if style.group(2) is not None else style.group(3)
+    merged = f"{existing.rstrip().rstrip(';')}; {declaration}" if existing.strip() else declaration
+    return tag[:style.start()] + f"{style.group(1)}{quote}{merged}{quote}" + tag[style.end():]
+
+
+_default_assets: Optional[ImageAssets] = None
+_default_assets_lock = threading.Lock()
+
+
+def default_image_assets() -> Optional[ImageAssets]:
+    """Return the process-wide pipeline, or ``None`` when it is disabled.
+
+    ``PYMARK_IMAGE_CACHE`` sets the cache directory (empty disables the
+    pipeline) and ``PYMARK_IMAGE_DPI`` the target resolution (0 disables).
+    """
+    global _default_assets
+    with _default_assets_lock:
+        if _default_assets is None:
+            cache_dir = _default_cache_dir()
+            if cache_dir is None or not pillow_available():
+                return None
+            _default_assets = ImageAssets(cache_dir, dpi=_default_dpi())
+        return _default_assets
@@ -0,0 +1,357 @@
+"""
+Incremental builds and watch mode for batch conversion.
+
+A JSON manifest records, for every output PDF, content hashes of everything
+that went into it: the Markdown source, the CSS file, the title, the local
+images it references and the renderer version. Only outputs whose inputs
+changed are rendered again. Watch mode re-runs the incremental build when
+the filesystem changes, debouncing bursts of events into a single rebuild.
+"""
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlparse
+
+from batch import BatchResult, BatchTask, collect_inputs, plan_tasks, run_batch
+
+try:  # Optional: native filesystem notifications.
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # pragma: no cover
+    FileSystemEventHandler = object  # type: ignore
+    Observer = None
+
+MANIFEST_NAME = ".pymark-manifest.json"
+MANIFEST_FORMAT = 1
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".bmp", ".tif", ".tiff"}
+
+_INLINE_IMAGE = re.compile(r"!\[[^\]]*\]\(\s*<?([^)\s>]+)>?")
+_HTML_IMAGE = re.compile(r"<img\b[^>]*?\bsrc\s*=\s*[\"']([^\"']+)[\"']", re.IGNORECASE)
+_REFERENCE_DEFINITION = re.compile(r"^ {0,3}\[[^\]]+\]:\s*<?([^\s>]+)>?", re.MULTILINE)
+
+
+def _hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hash_file(path: Path) -> Optional[str]:
+    try:
+        return _hash_bytes(path.read_bytes())
+    except OSError:
+        return None
+
+
+def local_images(markdown_text: str, base_dir: Path) -> List[Path]:
+    """Return local image files referenced by ``markdown_text``.
+
+    References are resolved against ``base_dir``, the same ``base_url`` that
+    ``render_markdown_to_pdf`` gives WeasyPrint. Remote and data URLs are
+    ignored. Reference-style definitions count when they point at an image.
+    """
+    targets = _INLINE_IMAGE.findall(markdown_text) + _HTML_IMAGE.findall(markdown_text)
+    targets += [
+        target
+        for target in _REFERENCE_DEFINITION.findall(markdown_text)
+        if Path(urlparse(target).path).suffix.lower() in IMAGE_SUFFIXES
+    ]
+
+    images: List[Path] = []
+    for target in targets:
+        parsed = urlparse(target)
+        if parsed.scheme and parsed.scheme != "file":
+            continue
+        if not parsed.path:
+            continue
+        path = Path(unquote(parsed.path))
+        resolved = path if path.is_absolute() else base_dir / path
+        if resolved not in images:
+            images.append(resolved)
+    return images
+
+
+def fingerprint(task: BatchTask, version: str) -> Dict[str, object]:
+    """Hash every input of ``task`` (missing files hash to ``None``)."""
+    try:
+        markdown_bytes = task.source.read_bytes()
+    except OSError:
+        markdown_bytes = None
+    images: Dict[str, Optional[str]] = {}
+    if markdown_bytes is not None:
+        text = markdown_bytes.decode("utf-8", errors="replace")
+        for image in local_images(text, task.source.parent):
+            images[str(image)] = _hash_file(image)
+    return {
+        "markdown": _hash_bytes(markdown_bytes) if markdown_bytes is not None else None,
+        "css": _hash_file(task.css_path) if task.css_path is not None else None,
+        "css_path": str(task.css_path) if task.css_path is not None else None,
+        "title": task.title or task.source.stem,
+        "images": images,
+        "version": version,
+    }
+
+
+class BuildManifest:
+    """Input fingerprints of the outputs produced by previous builds."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: Dict[str, Dict[str, object]] = {}
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            data = {}
+        if data.get("format") == MANIFEST_FORMAT:
+            self.entries = data.get("outputs", {})
+
+    @staticmethod
+    def _key(task: BatchTask) -> str:
+        return str(task.output.resolve())
+
+    def is_current(self, task: BatchTask, inputs: Dict[str, object]) -> bool:
+        entry = self.entries.get(self._key(task))
+        return (
+            entry is not None
+            and not entry.get("failed")
+            and entry.get("inputs") == inputs
+            and task.output.is_file()
+        )
+
+    def failed_with(self, task: BatchTask, inputs: Dict[str, object]) -> bool:
+        """Whether ``task`` last failed to render from exactly these ``inputs``."""
+        entry = self.entries.get(self._key(task))
+        return entry is not None and bool(entry.get("failed")) and entry.get("inputs") == inputs
+
+    def record(self, task: BatchTask, inputs: Dict[str, object], failed: bool = False) -> None:
+        entry: Dict[str, object] = {"source": str(task.source.resolve()), "inputs": inputs}
+        if failed:
+            entry["failed"] = True
+        self.entries[self._key(task)] = entry
+
+    def dependencies(self, task: BatchTask) -> Set[Path]:
+        """Return the files ``task`` depended on when it was last built."""
+        entry = self.entries.get(self._key(task))
+        if entry is None:
+            return set()
+        inputs = entry["inputs"]
+        deps = {Path(str(entry["source"]))}
+        if inputs.get("css_path"):
+            deps.add(Path(str(inputs["css_path"])).resolve())
+        deps.update(Path(image).resolve() for image in inputs.get("images", {}))
+        return deps
+
+    def save(self) -> None:
+        payload = json.dumps({"format": MANIFEST_FORMAT, "outputs": self.entries}, indent=1, sort_keys=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(payload)
+        os.replace(tmp_name, self.path)
+
+
+def incremental_build(
+    tasks: List[BatchTask],
+    manifest: BuildManifest,
+    version: str,
+    jobs: Optional[int] = None,
+    changed: Optional[Set[Path]] = None,
+    report: Optional[Callable[[BatchResult], None]] = None,
+) -> Tuple[List[BatchResult], int]:
+    """Render the tasks whose inputs changed since the manifest was written.
+
+    With ``changed`` (resolved paths from a filesystem event), only tasks that
+    are new or depend on one of those paths are re-fingerprinted at all, and
+    a task that failed is retried only once its own inputs differ from those
+    of the failed render; a build without ``changed`` retries every failure.
+    Returns the render results and the number of tasks skipped as current.
+    """
+    candidates = tasks
+    if changed is not None:
+        candidates = []
+        for task in tasks:
+            deps = manifest.dependencies(task)
+            if not deps or deps & changed or task.source.resolve() in changed:
+                candidates.append(task)
+
+    stale: List[Tuple[BatchTask, Dict[str, object]]] = []
+    for task in candidates:
+        inputs = fingerprint(task, version)
+        if manifest.is_current(task, inputs):
+            continue
+        if changed is not None and manifest.failed_with(task, inputs):
+            continue
+        stale.append((task, inputs))
+
+    inputs_by_task = dict(stale)
+    results = run_batch([task for task, _ in stale], jobs=jobs, report=report) if stale else []
+    for result in results:
+        # Failures are recorded too, so that their dependencies are known and
+        # watch mode does not retry them on every unrelated change.
+        manifest.record(result.task, inputs_by_task[result.task], failed=not result.ok)
+    if results:
+        manifest.save()
+    return results, len(tasks) - len(stale)
+
+
+def watch_roots(specs: Iterable[str], extra: Iterable[Path] = ()) -> Dict[Path, bool]:
+    """Map each directory to watch to whether it must be watched recursively."""
+    roots: Dict[Path, bool] = {}
+
+    def add(path: Path, recursive: bool) -> None:
+        path = path.resolve()
+        roots[path] = roots.get(path, False) or recursive
+
+    for spec in specs:
+        if glob.has_magic(spec):
+            prefix = []
+            for part in Path(spec).parts:
+                if glob.has_magic(part):
+                    break
+                prefix.append(part)
+            add(Path(*prefix) if prefix else Path("."), True)
+        elif Path(spec).is_dir():
+            add(Path(spec), True)
+        else:
+            add(Path(spec).parent, False)
+    for path in extra:
+        add(path.parent, False)
+    return roots
+
+
+class _ChangeCollector(FileSystemEventHandler):  # type: ignore[misc]
+    """Accumulates changed paths until the filesystem has been quiet for a while."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        self._changed: Set[Path] = set()
+        self._last_event = 0.0
+        self._pending = threading.Event()
+
+    def add(self, path: str) -> None:
+        with self._lock:
+            self._changed.add(Path(path).resolve())
+            self._last_event = time.monotonic()
+        self._pending.set()
+
+    def on_any_event(self, event) -> None:  # type: ignore[override]
+        if event.is_directory:
+            return
+        self.add(event.src_path)
+        dest = getattr(event, "dest_path", None)
+        if dest:
+            self.add(dest)
+
+    def wait(self, debounce: float) -> Set[Path]:
+        """Block until changes arrive and ``debounce`` seconds pass without new ones."""
+        self._pending.wait()
+        while True:
+            with self._lock:
+                quiet_for = time.monotonic() - self._last_event
+                if quiet_for >= debounce:
+                    changed, self._changed = self._changed, set()
+                    self._pending.clear()
+                    return changed
+            time.sleep(debounce - quiet_for)
+
+
+def _poll(roots: Dict[Path, bool], collector: _ChangeCollector, interval: float, stop: threading.Event) -> None:
+    """Fallback watcher that compares mtimes when watchdog is not installed."""
+
+    def snapshot() -> Dict[str, Tuple[int, int]]:
+        state = {}
+        for root, recursive in roots.items():
+            entries = root.rglob("*") if recursive else root.glob("*")
+            for path in entries:
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                if not path.is_dir():
+                    state[str(path)] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    previous = snapshot()
+    while not stop.wait(interval):
+        current = snapshot()
+        for path in previous.keys() | current.keys():
+            if previous.get(path) != current.get(path):
+                collector.add(path)
+        previous = current
+
+
+def watch(
+    specs: List[str],
+    output_dir: Optional[Path],
+    css_path: Optional[Path],
+    title: Optional[str],
+    manifest: BuildManifest,
+    version: str,
+    jobs: Optional[int] = None,
+    debounce: float = 0.3,
+    report: Optional[Callable[[BatchResult], None]] = None,
+    on_build: Optional[Callable[[List[BatchResult], int, float], None]] = None,
+) -> None:
+    """Build incrementally, then rebuild on every (debounced) change until interrupted."""
+
+    def build(changed: Optional[Set[Path]]) -> None:
+        start = time.perf_counter()
+        try:
+            tasks = plan_tasks(collect_inputs(specs), output_dir, css_path, title)
+        except ValueError as exc:  # A new file collides; wait for the next change.
+            print(f"error: {exc}", file=sys.stderr)
+            return
+        results, skipped = incremental_build(tasks, manifest, version, jobs=jobs, changed=changed, report=report)
+        if on_build is not None and (results or changed is None):
+            on_build(results, skipped, time.perf_counter() - start)
+
+    build(None)
+
+    extra = [css_path] if css_path is not None else []
+    try:
+        for task in plan_tasks(collect_inputs(specs), output_dir, css_path, title):
+            extra.extend(manifest.dependencies(task))
+    except ValueError:
+        pass  # Reported by build(); the inputs are watched all the same.
+    roots = watch_roots(specs, extra)
+    if output_dir is not None:
+        # Never react to our own output.
+        roots.pop(output_dir.resolve(), None)
+    collector = _ChangeCollector()
+    stop = threading.Event()
+
+    if Observer is not None:
+        observer = Observer()
+        for root, recursive in roots.items():
+            if root.is_dir():
+                observer.schedule(collector, str(root), recursive=recursive)
+        observer.start()
+    else:
+        observer = None
+        threading.Thread(target=_poll, args=(roots, collector, 1.0, stop), daemon=True).start()
+
+    try:
+        while True:
+            changed = collector.wait(debounce)
+            # Skip our own writes: the manifest, its temp files and the PDFs.
+            changed = {
+                path
+                for path in changed
+                if path != manifest.path.resolve() and path.suffix.lower() not in {".pdf", ".tmp"}
+            }
+            if changed:
+                build(changed)
+    finally:
+        stop.set()
+        if observer is not None:
+            observer.stop()
+            observer.join()
@@ -0,0 +1,387 @@
+"""
+LaTeX lint with positions, and incremental re-linting for editors.
+
+``lint_latex(text)`` reports unmatched math delimiters (``$``, ``$$``,
+``\\(``, ``\\[``), commands the PDF math renderer does not know and
+unbalanced braces inside math, each with a line/column range.
+
+``LintDocument`` keeps a document between edits. It remembers the scanner
+state at the start of every line (in fenced code, in an open display
+expression, open braces...). An edit re-scans from the first edited line
+and stops as soon as the state at a line boundary matches the cached state
+again, so a keystroke costs the lines it touched, not the document.
+
+Delimiters are recognized by the same rules as ``iter_math_tokens``; the
+one difference is that an opener without a closer is reported and the rest
+of the document is not linted as math.
+
+Lines and columns are 0-based; columns count Unicode code points.
+"""
+from __future__ import annotations
+
+import functools
+import itertools
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from math_renderer import SUPPORTED_COMMANDS
+
+DEFAULT_MAX_DOCUMENTS = 256
+
+_TEXT_TOKEN = re.compile(r"\\[$\[(]|\$\$?|`+|~{3,}")
+_MATH_TOKEN = re.compile(r"\\([A-Za-z]+|.)|[{}]")
+_INLINE_STOP = re.compile(r"[$`]")
+_INLINE_CLOSE_OK = re.compile(r"(?<=[^\s\\])\$(?![$\d])")
+_CLOSERS = {"$$": "$$", "\\[": "\\]", "\\(": "\\)"}
+
+
+@dataclass(frozen=True)
+class Diagnostic:
+    code: str  # "unmatched-delimiter", "unknown-command" or "unbalanced-brace"
+    message: str
+    severity: str  # "error" or "warning"
+    line: int
+    column: int
+    end_line: int
+    end_column: int
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "code": self.code,
+            "message": self.message,
+            "severity": self.severity,
+            "start": {"line": self.line, "column": self.column},
+            "end": {"line": self.end_line, "column": self.end_column},
+        }
+
+    def shifted(self, first_line: int, delta: int) -> "Diagnostic":
+        if self.line < first_line:
+            return self
+        return Diagnostic(self.code, self.message, self.severity, self.line + delta, self.column,
+                          self.end_line + delta, self.end_column)
+
+
+class _State(NamedTuple):
+    """Scanner state at a line boundary."""
+
+    mode: str  # "text", "fence" or "math"
+    delimiter: str = ""  # Fence run or math opener.
+    line: int = -1  # Where the fence or math opener is.
+    column: int = -1
+    braces: Tuple[Tuple[int, int], ...] = ()  # Open "{" in the current math.
+
+    def shifted(self, first_line: int, delta: int) -> "_State":
+        # The opener and each open brace move on their own: math opened before
+        # the edit can still hold braces opened after it.
+        line = self.line + delta if self.line >= first_line else self.line
+        braces = tuple((brace + delta if brace >= first_line else brace, column) for brace, column in self.braces)
+        if line == self.line and braces == self.braces:
+            return self
+        return _State(self.mode, self.delimiter, line, self.column, braces)
+
+
+_TEXT = _State("text")
+
+
+class _Found(NamedTuple):
+    diagnostic: Diagnostic
+    # The opener of the multi-line math the diagnostic was found in; the
+    # diagnostic is dropped if that opener turns out to be unmatched.
+    opener: Optional[Tuple[int, int]]
+
+
+def _scan_line(text: str, number: int, state: _State) -> Tuple[_State, List[_Found]]:
+    found: List[_Found] = []
+    pos = 0
+    length = len(text)
+    while pos <= length:
+        if state.mode == "fence":
+            if _fence_closer(state.delimiter).match(text):
+                state = _TEXT
+            break
+
+        if state.mode == "math":
+            closer = _CLOSERS[state.delimiter]
+            close = text.find(closer, pos)
+            end = length if close < 0 else close
+            braces = _lint_math(text, number, pos, end, list(state.braces), found, (state.line, state.column))
+            if close < 0:
+                state = state._replace(braces=tuple(braces))
+                break
+            _unclosed(braces, found, (state.line, state.column))
+            state = _TEXT
+            pos = close + len(closer)
+            continue
+
+        match = _TEXT_TOKEN.search(text, pos)
+        if match is None:
+            break
+        start, end = match.span()
+        token = match.group()
+        if token == "\\$":
+            pos = end
+        elif token[0] in "`~" and len(token) >= 3 and not text[:start].strip() and len(text[:start]) <= 3:
+            state = _State("fence", token[0] * len(token), number, start)
+            break
+        elif token[0] == "~":
+            pos = end
+        elif token[0] == "`":
+            close = _closing_ticks(text, token, end)
+            pos = end if close < 0 else close + len(token)
+        elif token == "$":
+            if end >= length or text[end].isspace():
+                pos = end  # "$ " never opens math.
+                continue
+            stop = _INLINE_STOP.search(text, end)
+            if stop is not None and stop.group() == "$" and _INLINE_CLOSE_OK.match(text, stop.start()):
+                braces = _lint_math(text, number, end, stop.start(), [], found, None)
+                _unclosed(braces, found, None)
+                pos = stop.end()
+            else:
+                if not text[end].isdigit():  # "$5" is a price.
+                    found.append(_Found(Diagnostic(
+                        "unmatched-delimiter", "Unmatched $: inline math is not closed on this line",
+                        "warning", number, start, number, end,
+                    ), None))
+                pos = end
+        else:
+            state = _State("math", token, number, start)
+            pos = end
+    return state, found
+
+
+@functools.lru_cache(maxsize=None)
+def _fence_closer(fence: str) -> "re.Pattern":
+    return re.compile(r" {0,3}" + re.escape(fence[0]) + "{%d,}[ \t]*$" % len(fence))
+
+
+def _closing_ticks(text: str, run: str, start: int) -> int:
+    search_from = start
+    while True:
+        close = text.find(run, search_from)
+        if close < 0:
+            return -1
+        after = close + len(run)
+        if text[after:after + 1] != "`" and text[close - 1:close] != "`":
+            return close
+        while after < len(text) and text[after] == "`":
+            after += 1
+        search_from = after
+
+
+def _lint_math(text: str, number: int, start: int, end: int, braces: List[Tuple[int, int]],
+               found: List[_Found], opener: Optional[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    for match in _MATH_TOKEN.finditer(text, start, end):
+        name = match.group(1)
+        if name is not None:
+            if name not in SUPPORTED_COMMANDS:
+                found.append(_Found(Diagnostic(
+                    "unknown-command", f"Unknown command \\{name}: it is shown as an error in PDFs",
+                    "warning", number, match.start(), number, match.end(),
+                ), opener))
+        elif match.group() == "{":
+            braces.append((number, match.start()))
+        elif braces:
+            braces.pop()
+        else:
+            found.append(_Found(Diagnostic(
+                "unbalanced-brace", "Unbalanced }: no matching {", "error",
+                number, match.start(), number, match.end(),
+            ), opener))
+    return braces
+
+
+def _unclosed(braces: Sequence[Tuple[int, int]], found: List[_Found], opener: Optional[Tuple[int, int]]) -> None:
+    for line, column in braces:
+        found.append(_Found(Diagnostic(
+            "unbalanced-brace", "Unbalanced {: not closed before the end of the math", "error",
+            line, column, line, column + 1,
+        ), opener))
+
+
+class LintDocument:
+    """A document linted line by line, re-linted incrementally after edits."""
+
+    def __init__(self, text: str = "") -> None:
+        self.version = 0
+        self._lines = _split_lines(text)
+        self._states: List[_State] = [_TEXT]  # State at the start of each line, then at the end.
+        self._found: List[List[_Found]] = []
+        self._scan_from(0)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self._lines)
+
+    def edit(self, start: Tuple[int, int], end: Tuple[int, int], text: str) -> int:
+        """Replace the text between two ``(line, column)`` positions.
+
+        Replacing whole lines is ``edit((first, 0), (last + 1, 0), new_lines)``
+        with ``new_lines`` ending in a newline. Returns the number of lines
+        that were scanned again.
+        """
+        (start_line, start_column), (end_line, end_column) = start, end
+        if not (0 <= start_line <= end_line < len(self._lines)) or (start_line, start_column) > (end_line, end_column):
+            raise ValueError(f"edit range {start}-{end} is outside the document")
+        prefix = self._lines[start_line][:start_column]
+        suffix = self._lines[end_line][end_column:]
+        replacement = _split_lines(prefix + text + suffix)
+        self._lines[start_line:end_line + 1] = replacement
+        self.version += 1
+        return self._rescan(start_line, end_line + 1, len(replacement))
+
+    def diagnostics(self) -> List[Diagnostic]:
+        final = self._states[-1]
+        dropped = (final.line, final.column) if final.mode == "math" else None
+        diagnostics = [
+            found.diagnostic
+            for found in itertools.chain.from_iterable(self._found)
+            if dropped is None or found.opener != dropped
+        ]
+        if dropped is not None:
+            end = final.column + len(final.delimiter)
+            diagnostics.append(Diagnostic(
+                "unmatched-delimiter", f"Unmatched {final.delimiter}: math is never closed", "error",
+                final.line, final.column, final.line, end,
+            ))
+            diagnostics.sort(key=lambda diagnostic: (diagnostic.line, diagnostic.column))
+        return diagnostics
+
+    def _scan_from(self, index: int) -> None:
+        state = self._states[index]
+        for number in range(index, len(self._lines)):
+            state, found = _scan_line(self._lines[number], number, state)
+            self._found.append(found)
+            self._states.append(state)
+
+    def _rescan(self, first: int, old_end: int, new_count: int) -> int:
+        """Re-scan after old lines ``[first, old_end)`` became ``new_count`` lines."""
+        delta = new_count - (old_end - first)
+        old_states, old_found = self._states, self._found
+        self._states = old_states[:first + 1]
+        self._found = old_found[:first]
+        state = self._states[first]
+        scanned = 0
+        for number in range(first, len(self._lines)):
+            old_number = number - delta
+            if number >= first + new_count and old_states[old_number].shifted(old_end, delta) == state:
+                # Back in step with the previous scan: reuse the rest of it.
+                if delta:
+                    self._states.extend(old.shifted(old_end, delta) for old in old_states[old_number + 1:])
+                    self._found.extend(
+                        [_Found(item.diagnostic.shifted(old_end, delta),
+                                item.opener if item.opener is None or item.opener[0] < old_end
+                                else (item.opener[0] + delta, item.opener[1])) for item in found]
+                        for found in old_found[old_number:]
+                    )
+                else:
+                    self._states.extend(old_states[old_number + 1:])
+                    self._found.extend(old_found[old_number:])
+                return scanned
+            state, found = _scan_line(self._lines[number], number, state)
+            self._found.append(found)
+            self._states.append(state)
+            scanned += 1
+        return scanned
+
+
+def _split_lines(text: str) -> List[str]:
+    return text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+
+
+def lint_latex(text: str) -> List[Diagnostic]:
+    """Lint a whole Markdown document; see the module docstring."""
+    return LintDocument(text).diagnostics()
+
+
+class VersionConflict(ValueError):
+    """An edit was made against a different version than the server's; send the text again."""
+
+
+@dataclass(frozen=True)
+class LintResult:
+    document: str
+    version: int
+    diagnostics: Tuple[Diagnostic, ...]
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "document": self.document,
+            "version": self.version,
+            "diagnostics": [diagnostic.to_dict() for diagnostic in self.diagnostics],
+        }
+
+
+class LintSessions:
+    """Documents kept for incremental ``/lint`` requests, least recently used dropped first."""
+
+    def __init__(self, max_documents: int = DEFAULT_MAX_DOCUMENTS) -> None:
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+        self._documents: "OrderedDict[str, Tuple[LintDocument, threading.Lock]]" = OrderedDict()
+        self._counters = {"opened": 0, "edits": 0, "lines_scanned": 0, "evictions": 0}
+
+    def open(self, text: str) -> LintResult:
+        document = LintDocument(text)
+        document_id = uuid.uuid4().hex
+        result = LintResult(document_id, document.version, tuple(document.diagnostics()))
+        with self._lock:
+            self._documents[document_id] = (document, threading.Lock())
+            self._counters["opened"] += 1
+            self._counters["lines_scanned"] += len(document._lines)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+                self._counters["evictions"] += 1
+        return result
+
+    def edit(self, document_id: str, edits: Sequence[Dict], version: Optional[int] = None) -> Optional[LintResult]:
+        """Apply ``edits`` (``{"start", "end", "text"}``, in order) to a document.
+
+        Returns ``None`` if the document is not known (any more). Raises
+        ``VersionConflict`` when ``version`` is given and differs from the
+        document's, and ``ValueError`` for a malformed edit.
+        """
+        with self._lock:
+            entry = self._documents.get(document_id)
+            if entry is None:
+                return None
+            self._documents.move_to_end(document_id)
+        document, document_lock = entry
+        with document_lock:
+            if version is not None and version != document.version:
+                raise VersionConflict(f"document is at version {document.version}, not {version}")
+            scanned = 0
+            for change in edits:
+                scanned += document.edit(_position(change, "start"), _position(change, "end"), _edit_text(change))
+            result = LintResult(document_id, document.version, tuple(document.diagnostics()))
+        with self._lock:
+            self._counters["edits"] += len(edits)
+            self._counters["lines_scanned"] += scanned
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["documents"] = len(self._documents)
+        return stats
+
+
+def _position(change: Dict, key: str) -> Tuple[int, int]:
+    position = change.get(key) if isinstance(change, dict) else None
+    if not isinstance(position, dict):
+        raise ValueError(f"edit {key} must be an object with line and column")
+    line, column = position.get("line"), position.get("column", 0)
+    if not isinstance(line, int) or not isinstance(column, int) or line < 0 or column < 0:
+        raise ValueError(f"edit {key} needs a non-negative integer line and column")
+    return line, column
+
+
+def _edit_text(change: Dict) -> str:
+    text = change.get("text", "")
+    if not isinstance(text, str):
+        raise ValueError("edit text must be a string")
+    return text
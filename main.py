@@ -5,37 +5,98 @@ Includes a small Flask-powered web UI for live preview and PDF export.
 """
 from __future__ import annotations
 
+import glob
+import hashlib
 import io
+import json
 import argparse
+import atexit
+import functools
+import importlib.util
+import os
+import shutil
 import sys
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable
 from urllib.parse import urlparse
 
-try:
-    from markdown import markdown
-except ImportError:  # pragma: no cover
+if importlib.util.find_spec("markdown") is None:  # pragma: no cover
     print("Missing dependency: markdown. Install with `pip install -r requirements.txt`.")
     sys.exit(1)
 
-try:
-    from weasyprint import CSS, HTML
-except ImportError:  # pragma: no cover
-    print("Missing dependency: WeasyPrint. Install with `pip install -r requirements.txt`.")
-    sys.exit(1)
+import metrics
+from markdown_pool import DEFAULT_EXTENSIONS, MarkdownPool
+from metrics import SlowRequestProfiler, observe_document, observe_pages, stage
+
+if TYPE_CHECKING:
+    from math_renderer import MathCache
+    from memory_budget import MemoryGuard
+    from render_cache import RenderCache
+    from render_pool import RenderPool
 
-try:  # Imported lazily to keep CLI fast even if Flask is absent.
-    from flask import Flask, jsonify, request, send_file
-except ImportError:  # pragma: no cover
-    Flask = None  # type: ignore
-    jsonify = request = send_file = None  # type: ignore
+# WeasyPrint, Flask and requests take most of the startup time, so they are
+# imported on first use: WeasyPrint by load_weasyprint(), Flask by create_app()
+# and requests by remote_fetcher(). So are the feature modules (batch builds,
+# watch, lint, jobs, the render pool and cache, math and images), by the code
+# paths that use them. A CLI run handed to a render daemon imports none of them.
+CSS: Any = None
+HTML: Any = None
+FontConfiguration: Any = None
+_weasyprint_lock = threading.Lock()
 
-try:
-    import requests
-except ImportError:  # pragma: no cover
-    requests = None
+PYMARK_VERSION = "1.5.0"
 
 MAX_FETCH_BYTES = 1_000_000  # 1 MB guardrail for remote fetch
+# --asgi serving; the modules behind it import requests, so they load lazily.
+DEFAULT_FETCH_CONCURRENCY = 256
+DEFAULT_FETCH_PER_HOST = 8
+DEFAULT_ASGI_THREADS = 32
+
+# Environment variables that change how a document renders. A daemon reads
+# them once at startup, so a client only uses one started with the same values.
+DAEMON_ENVIRONMENT = (
+    "PYMARK_OFFLINE",
+    "PYMARK_VENDOR_DIR",
+    "PYMARK_FETCH_CACHE_MB",
+    "PYMARK_IMAGE_CACHE",
+    "PYMARK_IMAGE_DPI",
+    "PYMARK_MATH_CACHE",
+    "PYMARK_SECTION_THRESHOLD",
+)
+
+
+def load_weasyprint() -> Any:
+    """Import WeasyPrint and bind ``CSS``, ``HTML`` and ``FontConfiguration``."""
+    global CSS, HTML, FontConfiguration
+    with _weasyprint_lock:
+        if HTML is None:
+            try:
+                import weasyprint
+                from weasyprint.text.fonts import FontConfiguration as font_configuration
+            except ImportError:  # pragma: no cover
+                raise RuntimeError(
+                    "Missing dependency: WeasyPrint. Install with `pip install -r requirements.txt`."
+                ) from None
+            CSS, HTML, FontConfiguration = weasyprint.CSS, weasyprint.HTML, font_configuration
+        return sys.modules["weasyprint"]
+
+
+@functools.lru_cache(maxsize=None)
+def renderer_version() -> str:
+    """Part of every render cache key: bump PYMARK_VERSION whenever the
+    template or default stylesheet changes so stale PDFs are not served."""
+    # Read from the package metadata so that checking an incremental build
+    # does not import WeasyPrint.
+    import importlib.metadata
+
+    try:
+        weasyprint_version = importlib.metadata.version("weasyprint")
+    except importlib.metadata.PackageNotFoundError:  # pragma: no cover
+        weasyprint_version = load_weasyprint().__version__
+    return f"pymark/{PYMARK_VERSION} weasyprint/{weasyprint_version}"
 
 DEFAULT_CSS = """
 @page {
@@ -146,53 +207,269 @@ HTML_TEMPLATE = """<!doctype html>
 """
 
 
+# Shared by the CLI, /export and /render-html so converters are built once.
+markdown_pool = MarkdownPool(DEFAULT_EXTENSIONS)
+
+
 def markdown_to_html(markdown_text: str) -> str:
-    return markdown(markdown_text, extensions=["extra", "tables", "fenced_code"])
+    with stage("markdown"):
+        return markdown_pool.convert(markdown_text)
+
+
+def markdown_to_print_html(markdown_text: str, math_cache: MathCache | None = None) -> str:
+    """Convert markdown to HTML for PDF layout, with math pre-rendered server-side.
+
+    WeasyPrint cannot run KaTeX, so LaTeX expressions are rendered to HTML
+    before layout. Rendered expressions are memoized in ``math_cache`` (the
+    persistent default cache if omitted).
+    """
+    from math_renderer import prerender_math, restore_math
+
+    with stage("math"):
+        protected, fragments = prerender_math(markdown_text, math_cache)
+    html_body = markdown_to_html(protected)
+    del protected
+    return restore_math(html_body, fragments)
+
 
+class RenderContext:
+    """Long-lived WeasyPrint state shared between renders.
 
-def markdown_to_pdf_bytes(markdown_text: str, css_text: str | None, title: str) -> bytes:
+    Parsing a stylesheet and building a font configuration are a large part of
+    each render, so a context keeps one ``FontConfiguration`` and the parsed
+    built-in stylesheets (the default, math and section CSS), keyed by text.
+
+    A user stylesheet may register fonts with ``@font-face``, and a font
+    configuration keeps every font registered with it. So a render with any
+    CSS other than the default gets a font configuration of its own and
+    parses that CSS for it, and one user's fonts never reach another's PDF.
+
+    WeasyPrint's font configuration is not safe to use from several layouts at
+    once, so renders through one context are serialized. Use one context per
+    worker process for parallelism.
+    """
+
+    def __init__(self, max_stylesheets: int = 32) -> None:
+        load_weasyprint()
+        from asset_fetcher import default_asset_fetcher
+
+        self.max_stylesheets = max_stylesheets
+        self.font_config = FontConfiguration()
+        # Serves vendored and cached assets; see asset_fetcher.
+        self.url_fetcher = default_asset_fetcher()
+        self._stylesheets: OrderedDict[str, CSS] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def stylesheet(self, css_text: str | None = None) -> CSS:
+        """Return a built-in stylesheet (the default CSS if omitted), parsed
+        once with the shared font configuration.
+
+        Only for CSS without ``@font-face`` rules; user CSS goes through
+        ``render_document``.
+        """
+        with self._lock:
+            text = css_text or DEFAULT_CSS
+            key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            stylesheet = self._stylesheets.get(key)
+            if stylesheet is not None:
+                self._stylesheets.move_to_end(key)
+                return stylesheet
+
+            with stage("css"):
+                stylesheet = CSS(string=text, font_config=self.font_config, url_fetcher=self.url_fetcher)
+            self._stylesheets[key] = stylesheet
+            while len(self._stylesheets) > self.max_stylesheets:
+                self._stylesheets.popitem(last=False)
+            return stylesheet
+
+    def render_document(
+        self,
+        html: str,
+        css_text: str | None = None,
+        css_path: Path | None = None,
+        base_url: str | None = None,
+        extra_css: str | None = None,
+    ) -> Any:
+        """Lay out ``html`` and return the WeasyPrint ``Document``.
+
+        The page is styled by ``css_path`` or ``css_text`` (the default CSS if
+        neither); ``extra_css`` is applied after it and the math stylesheet.
+        """
+        from math_renderer import MATH_CSS
+
+        with self._lock:
+            if css_path is None and (not css_text or css_text == DEFAULT_CSS):
+                font_config = self.font_config
+                page_css = self.stylesheet()
+            else:
+                font_config = FontConfiguration()
+                with stage("css"):
+                    if css_path is not None:
+                        page_css = CSS(filename=str(css_path), font_config=font_config, url_fetcher=self.url_fetcher)
+                    else:
+                        page_css = CSS(string=css_text, font_config=font_config, url_fetcher=self.url_fetcher)
+            stylesheets = [page_css, self.stylesheet(css_text=MATH_CSS)]
+            if extra_css:
+                stylesheets.append(self.stylesheet(css_text=extra_css))
+            with stage("layout"):
+                return HTML(string=html, base_url=base_url, url_fetcher=self.url_fetcher).render(
+                    stylesheets=stylesheets, font_config=font_config
+                )
+
+    def write_pdf(
+        self,
+        html: str,
+        target: Any,
+        css_text: str | None = None,
+        css_path: Path | None = None,
+        base_url: str | None = None,
+    ) -> None:
+        """Lay out ``html`` and write the PDF to ``target`` (a path or file object)."""
+        with self._lock:
+            document = self.render_document(html, css_text=css_text, css_path=css_path, base_url=base_url)
+            with stage("pdf"):
+                document.write_pdf(target)
+            observe_pages(len(document.pages))
+
+
+_default_context: RenderContext | None = None
+_default_context_lock = threading.Lock()
+
+
+def default_render_context() -> RenderContext:
+    """Return the process-wide render context, creating it on first use."""
+    global _default_context
+    with _default_context_lock:
+        if _default_context is None:
+            _default_context = RenderContext()
+        return _default_context
+
+
+def warm_render_context(context: RenderContext | None = None) -> RenderContext:
+    """Parse the default stylesheets and load the Markdown and math code
+    paths once, so the first real render is as fast as the next ones."""
+    from math_renderer import MATH_CSS
+
+    context = context or default_render_context()
+    context.stylesheet()
+    context.stylesheet(css_text=MATH_CSS)
+    markdown_to_print_html("# warm-up\n\n$x$\n")
+    return context
+
+
+def markdown_to_pdf_bytes(
+    markdown_text: str,
+    css_text: str | None,
+    title: str,
+    cache: RenderCache | None = None,
+    context: RenderContext | None = None,
+    sections: bool | None = None,
+) -> bytes:
     """Convert markdown to PDF with math rendering support.
     
-    Note: WeasyPrint doesn't support JavaScript, so KaTeX won't render in PDFs.
-    For proper math rendering in PDFs, consider using a headless browser approach.
-    This implementation includes KaTeX for the HTML preview but PDFs will show
-    LaTeX source code. For production use, integrate Selenium/Playwright for
-    JavaScript-rendered PDFs.
+    Note: WeasyPrint doesn't support JavaScript, so KaTeX can't run in PDFs.
+    Math is instead pre-rendered to HTML/CSS on the server (see
+    ``markdown_to_print_html``); the KaTeX tags in the template only matter
+    when the same HTML is opened in a browser.
+
+    When a ``cache`` is given, identical (markdown, css, title) requests are
+    served from it and concurrent identical renders are collapsed into one.
+    Stylesheets and fonts come from ``context`` (the shared default if omitted).
+    ``sections`` selects parallel section layout (see ``write_markdown_pdf``).
     """
-    html_body = markdown_to_html(markdown_text)
-    html = HTML_TEMPLATE.format(title=title, body=html_body)
-    stylesheets = [CSS(string=css_text or DEFAULT_CSS)]
+    if cache is not None:
+        from render_cache import render_key
+
+        key = render_key(markdown_text, css_text or DEFAULT_CSS, title, renderer_version())
+        return cache.get_or_render(
+            key, lambda: markdown_to_pdf_bytes(markdown_text, css_text, title, context=context, sections=sections)
+        )
+
     buffer = io.BytesIO()
-    HTML(string=html).write_pdf(buffer, stylesheets=stylesheets)
+    write_markdown_pdf(markdown_text, css_text, title, buffer, context=context, sections=sections)
     return buffer.getvalue()
 
 
-def fetch_remote_markdown(url: str, timeout: float = 6.0) -> str:
-    if requests is None:  # pragma: no cover
-        raise RuntimeError("requests is not installed. Install with `pip install -r requirements.txt`.")
+def write_markdown_pdf(
+    markdown_text: str,
+    css_text: str | None,
+    title: str,
+    target: Any,
+    context: RenderContext | None = None,
+    progress: Callable[[float, str], None] | None = None,
+    sections: bool | None = None,
+) -> None:
+    """Render markdown straight into ``target`` (a path or writable binary file).
+
+    ``progress(fraction, stage)`` is called as the render moves from Markdown
+    conversion to PDF layout. ``sections`` lays the document out in parallel
+    sections (``None`` decides by size, see ``section_render``).
+    """
+    from section_render import render_sections, should_split
+
+    context = context or default_render_context()
+    if progress is not None:
+        progress(0.05, "converting")
+    html_body = markdown_to_print_html(markdown_text)
+    if progress is not None:
+        progress(0.3, "laying out")
+    if sections if sections is not None else should_split(markdown_text):
+        with stage("sections"):
+            render_sections(
+                html_body,
+                lambda body: HTML_TEMPLATE.format(title=title, body=body),
+                target,
+                context,
+                title,
+                css_text=css_text,
+            )
+        return
+    html = HTML_TEMPLATE.format(title=title, body=html_body)
+    del html_body  # The template copy is all layout needs.
+    context.write_pdf(html, target, css_text=css_text)
 
+
+_remote_fetcher: Any = None
+_remote_fetcher_lock = threading.Lock()
+
+
+def remote_fetcher() -> Any:
+    """Return the process-wide ``RemoteFetcher`` (pooled session plus HTTP cache)."""
+    global _remote_fetcher
+    with _remote_fetcher_lock:
+        if _remote_fetcher is None:
+            try:
+                from remote_fetch import RemoteFetcher
+            except ImportError:  # pragma: no cover
+                raise RuntimeError(
+                    "requests is not installed. Install with `pip install -r requirements.txt`."
+                ) from None
+
+            _remote_fetcher = RemoteFetcher(max_fetch_bytes=MAX_FETCH_BYTES)
+        return _remote_fetcher
+
+
+def fetch_remote_markdown(url: str, timeout: float = 6.0) -> str:
     parsed = urlparse(url)
     if parsed.scheme not in {"http", "https"}:
         raise ValueError("Only http/https URLs are allowed")
 
-    resp = requests.get(url, stream=True, timeout=timeout)
-    resp.raise_for_status()
-
-    total = 0
-    chunks: list[bytes] = []
-    for chunk in resp.iter_content(chunk_size=8192):
-        if chunk:
-            total += len(chunk)
-            if total > MAX_FETCH_BYTES:
-                raise ValueError("Remote file is too large (limit 1 MB)")
-            chunks.append(chunk)
+    with stage("fetch"):
+        content_bytes, encoding = remote_fetcher().fetch(url, timeout)
+    return content_bytes.decode(encoding or "utf-8", errors="replace")
 
-    content_bytes = b"".join(chunks)
-    encoding = resp.encoding or "utf-8"
-    return content_bytes.decode(encoding, errors="replace")
 
+def render_markdown_to_pdf(
+    md_path: Path,
+    pdf_path: Path,
+    css_path: Path | None,
+    title: str,
+    context: RenderContext | None = None,
+    sections: bool | None = None,
+) -> None:
+    from image_assets import default_image_assets
+    from section_render import render_sections, should_split
 
-def render_markdown_to_pdf(md_path: Path, pdf_path: Path, css_path: Path | None, title: str) -> None:
     if not md_path.is_file():
         raise FileNotFoundError(f"Markdown file not found: {md_path}")
 
@@ -200,48 +477,368 @@ def render_markdown_to_pdf(md_path: Path, pdf_path: Path, css_path: Path | None,
         raise FileNotFoundError(f"CSS file not found: {css_path}")
 
     markdown_text = md_path.read_text(encoding="utf-8")
-    html_body = markdown_to_html(markdown_text)
+    html_body = markdown_to_print_html(markdown_text)
+    image_assets = default_image_assets()
+    if image_assets is not None:
+        with stage("images"):
+            page_css = css_path.read_text(encoding="utf-8") if css_path is not None else DEFAULT_CSS
+            html_body = image_assets.rewrite_html(html_body, md_path.parent, page_css)
+
+    context = context or default_render_context()
+    pdf_path.parent.mkdir(parents=True, exist_ok=True)
+    if sections if sections is not None else should_split(markdown_text):
+        with stage("sections"):
+            render_sections(
+                html_body,
+                lambda body: HTML_TEMPLATE.format(title=title, body=body),
+                str(pdf_path),
+                context,
+                title,
+                css_path=css_path,
+                base_url=str(md_path.parent),
+            )
+        return
     html = HTML_TEMPLATE.format(title=title, body=html_body)
+    context.write_pdf(html, str(pdf_path), css_path=css_path, base_url=str(md_path.parent))
 
-    stylesheets = [CSS(filename=str(css_path))] if css_path else [CSS(string=DEFAULT_CSS)]
 
-    pdf_path.parent.mkdir(parents=True, exist_ok=True)
-    HTML(string=html, base_url=str(md_path.parent)).write_pdf(str(pdf_path), stylesheets=stylesheets)
+def cache_from_env() -> RenderCache:
+    """Build the server's render cache from ``PYMARK_CACHE_*`` variables."""
+    from render_cache import DEFAULT_MEMORY_BYTES, RenderCache
 
+    memory_mb = os.environ.get("PYMARK_CACHE_MB")
+    disk_dir = os.environ.get("PYMARK_CACHE_DIR")
+    disk_mb = os.environ.get("PYMARK_CACHE_DISK_MB")
+    return RenderCache(
+        max_bytes=int(float(memory_mb) * 1024 * 1024) if memory_mb else DEFAULT_MEMORY_BYTES,
+        disk_dir=Path(disk_dir) if disk_dir else None,
+        max_disk_bytes=int(float(disk_mb) * 1024 * 1024) if disk_mb else None,
+    )
 
-def create_app() -> Any:
-    if Flask is None:  # pragma: no cover
-        raise RuntimeError("Flask is not installed. Install with `pip install -r requirements.txt`.")
+
+def create_app(
+    cache: RenderCache | None = None,
+    context: RenderContext | None = None,
+    job_workers: int | None = None,
+    job_queue_depth: int | None = None,
+    job_retention: float | None = None,
+    pool: RenderPool | None = None,
+    profiler: SlowRequestProfiler | None = None,
+    memory_guard: MemoryGuard | None = None,
+    async_fetcher: Any = None,
+) -> Any:
+    """Build the web app.
+
+    With a ``pool``, PDF layout runs on its warm worker processes instead of
+    in the request thread, and requests it cannot queue get a 429. Every
+    response carries a ``Server-Timing`` header with its rendering stages;
+    a ``profiler`` keeps stack samples of requests slower than its threshold.
+    A ``memory_guard`` refuses exports that would not fit its budget with a
+    413 and records render peaks; renders that outgrow it are stopped only on
+    a ``pool`` created with the same ``memory_budget``.
+    ``async_fetcher`` is the ``AsyncRemoteFetcher`` of an ASGI server, whose
+    statistics are then exported on ``/metrics``. The ``job_*`` options
+    configure the ``/jobs`` queue (``export_jobs`` defaults if omitted).
+    """
+    try:
+        from flask import Flask, Response, g, jsonify, request, send_file
+    except ImportError:  # pragma: no cover
+        raise RuntimeError("Flask is not installed. Install with `pip install -r requirements.txt`.") from None
+    from block_render import BlockRenderer
+    from export_jobs import DEFAULT_QUEUE_DEPTH, DEFAULT_RETENTION, DEFAULT_WORKERS, JobQueue, JobQueueFull
+    from http_cache import IMMUTABLE, PRIVATE_REVALIDATE, REVALIDATE, Compressor, StaticFingerprints
+    from http_cache import content_etag, etag_matches
+    from latex_lint import LintSessions, VersionConflict
+    from memory_budget import MemoryBudgetExceeded
+    from render_cache import render_key
+    from render_pool import PoolBusy
 
     app = Flask(__name__, static_folder="static", static_url_path="")
+    compressor = Compressor()
+    fingerprints = StaticFingerprints(Path(app.static_folder))
+    render_cache = cache if cache is not None else cache_from_env()
+    render_context = context or default_render_context()
+
+    def export_stream(markdown_text: str, css_text: str | None, title: str, progress=None) -> Any:
+        # Stream the PDF from the cache or from a spooled temporary file that
+        # WeasyPrint writes into directly, so at most one copy is held.
+        key = render_key(markdown_text, css_text or DEFAULT_CSS, title, renderer_version())
+        if pool is not None:
+
+            def render_on_pool(target: Any) -> None:
+                try:
+                    with stage("pool"):
+                        peak = pool.render_to(markdown_text, css_text, title, target)
+                except MemoryBudgetExceeded:
+                    if memory_guard is not None:
+                        memory_guard.record(0, f"render {title!r}", aborted=True)
+                    raise
+                if memory_guard is not None:
+                    memory_guard.record(peak, f"render {title!r}")
+
+            return render_cache.open_or_render(key, render_on_pool)
+        if memory_guard is None:
+            return render_cache.open_or_render(
+                key,
+                lambda target: write_markdown_pdf(
+                    markdown_text, css_text, title, target, context=render_context, progress=progress
+                ),
+            )
+
+        def render_guarded(target: Any) -> None:
+            # Only observed here; the budget is enforced on pool workers.
+            # Section workers are separate processes the guard cannot see.
+            with memory_guard.track(f"render {title!r}"):
+                write_markdown_pdf(
+                    markdown_text, css_text, title, target, context=render_context, progress=progress, sections=False
+                )
+
+        return render_cache.open_or_render(key, render_guarded)
+
+    def render_job(payload: dict, target: Any, progress: Callable[[float, str], None]) -> None:
+        with export_stream(payload["markdown"], payload["css"], payload["title"], progress) as stream:
+            shutil.copyfileobj(stream, target)
+
+    block_renderer = BlockRenderer(markdown_to_html)
+    lint_sessions = LintSessions()
+    job_queue = JobQueue(
+        render_job,
+        workers=DEFAULT_WORKERS if job_workers is None else job_workers,
+        queue_depth=DEFAULT_QUEUE_DEPTH if job_queue_depth is None else job_queue_depth,
+        retention=DEFAULT_RETENTION if job_retention is None else job_retention,
+    )
+    # Removes finished PDFs and the queue's scratch directory.
+    atexit.register(job_queue.close, wait=False)
+
+    def parse_export_request() -> tuple[dict | None, Any]:
+        if memory_guard is not None:
+            memory_guard.check_body(request.content_length)
+        # Not cached on the request: the raw body is dropped once parsed.
+        data = request.get_json(silent=True, cache=False) or {}
+        markdown_text = data.get("markdown", "")
+        if not isinstance(markdown_text, str) or not markdown_text.strip():
+            return None, (jsonify({"error": "markdown is required"}), 400)
+        if memory_guard is not None:
+            memory_guard.check(markdown_text)
+        observe_document("markdown", len(markdown_text.encode("utf-8")))
+        return {"markdown": markdown_text, "css": data.get("css"), "title": data.get("title") or "Document"}, None
+
+    @app.before_request
+    def start_timing():  # type: ignore
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        g.pymark_route = route
+        g.pymark_timings = metrics.start_request()
+        metrics.REQUESTS_IN_FLIGHT.inc(route=route)
+        if profiler is not None:
+            profiler.start()
+
+    @app.after_request
+    def add_server_timing(response: Any):  # type: ignore
+        timings = g.get("pymark_timings")
+        if timings is not None:
+            response.headers["Server-Timing"] = timings.server_timing()
+            g.pymark_status = str(response.status_code)
+        return response
+
+    @app.after_request
+    def cache_and_compress(response: Any):  # type: ignore
+        if request.endpoint == "static":
+            # Pages link static files with ?v=<content hash>; only those URLs
+            # are safe to cache without asking again.
+            current = fingerprints.is_current(request.view_args.get("filename", ""), request.args.get("v"))
+            response.headers["Cache-Control"] = IMMUTABLE if current else REVALIDATE
+        conditional = request.method in ("GET", "HEAD")
+        return compressor.apply(
+            response,
+            request.headers.get("Accept-Encoding"),
+            request.headers.get("If-None-Match") if conditional else None,
+        )
+
+    def validated(response: Any, etag: str) -> Any:
+        # Rendered responses may be stored, but must be revalidated each time.
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = PRIVATE_REVALIDATE
+        return response
+
+    def not_modified(etag: str) -> Any:
+        return validated(Response(status=304), etag)
+
+    @app.teardown_request
+    def finish_timing(exc: BaseException | None):  # type: ignore
+        timings = g.pop("pymark_timings", None)
+        if timings is None:
+            return
+        route = g.pymark_route
+        seconds = metrics.finish_request(timings)
+        metrics.REQUESTS_IN_FLIGHT.dec(route=route)
+        status = g.get("pymark_status", "500")
+        if metrics.enabled():
+            metrics.REQUEST_SECONDS.observe(seconds, method=request.method, route=route, status=status)
+        if profiler is not None:
+            profiler.stop(seconds, f"{request.method} {route}")
+
+    @app.errorhandler(MemoryBudgetExceeded)
+    def over_memory_budget(exc: MemoryBudgetExceeded):  # type: ignore
+        return jsonify({"error": str(exc)}), 413
+
+    @app.errorhandler(PoolBusy)
+    def pool_busy(exc: PoolBusy):  # type: ignore
+        return jsonify({"error": str(exc)}), 429, {"Retry-After": str(exc.retry_after)}
 
     @app.get("/")
     def index():  # type: ignore
-        return app.send_static_file("index.html")
+        static = Path(app.static_folder)
+        page = fingerprints.rewrite(
+            (static / "index.html").read_text(encoding="utf-8"),
+            [path.name for path in static.iterdir() if path.is_file() and path.name != "index.html"],
+        )
+        response = Response(page, mimetype="text/html")
+        response.set_etag(content_etag(page))
+        response.headers["Cache-Control"] = REVALIDATE
+        return response
 
     @app.get("/health")
     def health():  # type: ignore
         return {"status": "ok"}
 
+    @app.get("/cache/stats")
+    def cache_stats():  # type: ignore
+        return jsonify(render_cache.stats())
+
+    @app.get("/metrics")
+    def prometheus_metrics():  # type: ignore
+        body = metrics.REGISTRY.render()
+        body += metrics.render_stats("pymark_render_cache", "PDF render cache statistics.", render_cache.stats())
+        body += metrics.render_stats("pymark_jobs", "Export job queue statistics.", job_queue.stats())
+        body += metrics.render_stats("pymark_blocks", "Incremental block cache statistics.", block_renderer.stats())
+        body += metrics.render_stats("pymark_compression", "Response compression statistics.", compressor.stats())
+        body += metrics.render_stats("pymark_lint", "Incremental LaTeX lint statistics.", lint_sessions.stats())
+        body += metrics.render_stats("pymark_markdown_pool", "Markdown converter pool statistics.", markdown_pool.stats())
+        if memory_guard is not None:
+            body += metrics.render_stats("pymark_memory", "Per-render memory budget statistics.", memory_guard.stats())
+        if pool is not None:
+            body += metrics.render_stats("pymark_render_pool", "Render worker pool statistics.", pool.stats())
+        if async_fetcher is not None:
+            body += metrics.render_stats(
+                "pymark_async_fetch", "Asynchronous /fetch-url statistics.", async_fetcher.stats()
+            )
+        if HTML is not None:  # Renders ran in this process.
+            from asset_fetcher import default_asset_fetcher
+
+            body += metrics.render_stats(
+                "pymark_asset_fetcher", "WeasyPrint asset fetcher statistics.", default_asset_fetcher().stats()
+            )
+        return Response(body, mimetype="text/plain; version=0.0.4")
+
+    @app.get("/pool/stats")
+    def pool_stats():  # type: ignore
+        if pool is None:
+            return jsonify({"error": "rendering in-process (start with --render-workers)"}), 404
+        return jsonify(pool.stats())
+
     @app.post("/export")
     def export_pdf():  # type: ignore
-        data = request.get_json(silent=True) or {}
-        markdown_text = data.get("markdown", "")
-        title = data.get("title") or "Document"
-        css_text = data.get("css")
+        payload, error = parse_export_request()
+        if payload is None:
+            return error
+        title = payload["title"]
+        # The render cache key covers everything the PDF depends on.
+        etag = render_key(payload["markdown"], payload["css"] or DEFAULT_CSS, title, renderer_version())
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return not_modified(etag)
+        stream = export_stream(payload["markdown"], payload["css"], title)
+        stream.seek(0, io.SEEK_END)
+        observe_document("pdf", stream.tell())
+        stream.seek(0)
+
+        response = send_file(
+            stream,
+            mimetype="application/pdf",
+            as_attachment=True,
+            download_name=f"{title or 'document'}.pdf",
+        )
+        return validated(response, etag)
 
-        if not isinstance(markdown_text, str) or not markdown_text.strip():
-            return jsonify({"error": "markdown is required"}), 400
+    @app.post("/export-batch")
+    def export_batch():  # type: ignore
+        from batch_export import parse_batch, stream_batch_zip
 
-        pdf_bytes = markdown_to_pdf_bytes(markdown_text, css_text, title)
-        buffer = io.BytesIO(pdf_bytes)
-        buffer.seek(0)
+        if memory_guard is not None:
+            memory_guard.check_body(request.content_length)
+        try:
+            documents = parse_batch(request.get_json(silent=True, cache=False))
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        for document in documents:
+            if document.error is None:
+                observe_document("markdown", len(document.markdown.encode("utf-8")))
+
+        def report(entry: Any) -> None:
+            if entry.ok:
+                observe_document("pdf", entry.size)
+
+        # In-process renders share one serialized context, so only the pool
+        # renders a batch on several cores.
+        def render(document: Any) -> Any:
+            if memory_guard is not None:
+                memory_guard.check(document.markdown)  # Refused documents go into the manifest.
+            return export_stream(document.markdown, document.css, document.title)
+
+        chunks = stream_batch_zip(
+            documents,
+            render,
+            workers=pool.size if pool is not None else 1,
+            report=report,
+        )
+        return Response(
+            chunks,
+            mimetype="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="documents.zip"'},
+        )
 
+    @app.post("/jobs")
+    def submit_job():  # type: ignore
+        payload, error = parse_export_request()
+        if payload is None:
+            return error
+        try:
+            job = job_queue.submit(payload, title=payload["title"])
+        except JobQueueFull as exc:
+            return jsonify({"error": str(exc)}), 429, {"Retry-After": "5"}
+        body = job.to_dict()
+        body["status_url"] = f"/jobs/{job.id}"
+        body["result_url"] = f"/jobs/{job.id}/result"
+        return jsonify(body), 202, {"Location": body["status_url"]}
+
+    @app.get("/jobs/stats")
+    def job_stats():  # type: ignore
+        return jsonify(job_queue.stats())
+
+    @app.get("/jobs/<job_id>")
+    def job_status(job_id: str):  # type: ignore
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "unknown or expired job"}), 404
+        body = job.to_dict()
+        body["result_url"] = f"/jobs/{job.id}/result"
+        return jsonify(body)
+
+    @app.get("/jobs/<job_id>/result")
+    def job_result(job_id: str):  # type: ignore
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "unknown or expired job"}), 404
+        if job.status == "failed":
+            # The render failed, not this request: there is no PDF to send.
+            return jsonify({"error": job.error, "status": job.status}), 409
+        stream = job_queue.open_result(job)
+        if stream is None:
+            return jsonify({"error": "job is not finished", "status": job.status}), 409, {"Retry-After": "1"}
         return send_file(
-            buffer,
+            stream,
             mimetype="application/pdf",
             as_attachment=True,
-            download_name=f"{title or 'document'}.pdf",
+            download_name=f"{job.title or 'document'}.pdf",
         )
 
     @app.post("/fetch-url")
@@ -268,8 +865,26 @@ def create_app() -> Any:
 
         if not isinstance(markdown_text, str) or not markdown_text.strip():
             return jsonify({"error": "markdown is required"}), 400
-
-        html_body = markdown_to_html(markdown_text)
+        # The response is a function of the request body alone, so a client
+        # polling an unchanged preview gets a 304 before anything is rendered.
+        etag = content_etag(renderer_version(), json.dumps(data, sort_keys=True))
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return not_modified(etag)
+        observe_document("markdown", len(markdown_text.encode("utf-8")))
+
+        # Incremental mode re-renders only the blocks that changed since the
+        # last call; "patch" returns just those instead of the whole page.
+        incremental = bool(data.get("incremental") or data.get("patch"))
+        if incremental:
+            document = block_renderer.render(markdown_text)
+            if data.get("patch"):
+                known = data.get("known") or []
+                if not isinstance(known, list):
+                    return jsonify({"error": "known must be a list of block ids"}), 400
+                return validated(jsonify(document.patch(str(block_id) for block_id in known)), etag)
+            html_body = document.html
+        else:
+            html_body = markdown_to_html(markdown_text)
         css_for_html = css_text or DEFAULT_CSS
         
         # Create standalone HTML with embedded styles
@@ -288,19 +903,80 @@ def create_app() -> Any:
 </body>
 </html>"""
 
-        return jsonify({"html": full_html})
+        if incremental:
+            return validated(jsonify({"html": full_html, "blocks": document.ids}), etag)
+        return validated(jsonify({"html": full_html}), etag)
+
+    @app.post("/lint")
+    def lint():  # type: ignore
+        data = request.get_json(silent=True) or {}
+        # A full text opens a document; later requests send only their edits
+        # against it and the linter re-scans just the lines they touch.
+        if "document" not in data:
+            markdown_text = data.get("markdown", "")
+            if not isinstance(markdown_text, str):
+                return jsonify({"error": "markdown is required"}), 400
+            return jsonify(lint_sessions.open(markdown_text).to_dict())
+        edits = data.get("edits") or []
+        version = data.get("version")
+        if not isinstance(edits, list) or not (version is None or isinstance(version, int)):
+            return jsonify({"error": "edits must be a list and version an integer"}), 400
+        try:
+            result = lint_sessions.edit(str(data["document"]), edits, version)
+        except VersionConflict as exc:
+            return jsonify({"error": str(exc)}), 409
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        if result is None:
+            return jsonify({"error": "unknown or expired document; send the markdown again"}), 404
+        return jsonify(result.to_dict())
 
     return app
 
 
+def create_asgi_app(
+    fetch_concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+    fetch_per_host: int = DEFAULT_FETCH_PER_HOST,
+    threads: int = DEFAULT_ASGI_THREADS,
+    **kwargs: Any,
+) -> Any:
+    """Build the web app as an ASGI application (``uvicorn --factory main:create_asgi_app``).
+
+    ``/fetch-url`` waits on the event loop, at most ``fetch_concurrency``
+    fetches at once and ``fetch_per_host`` per host; every other route runs
+    the app from ``create_app(**kwargs)`` on ``threads`` threads.
+    """
+    from asgi_app import AsgiApp
+    from async_fetch import AsyncRemoteFetcher
+
+    fetcher = AsyncRemoteFetcher(remote_fetcher(), max_concurrent=fetch_concurrency, per_host=fetch_per_host)
+    return AsgiApp(create_app(async_fetcher=fetcher, **kwargs), fetcher, workers=threads)
+
+
 def build_parser() -> argparse.ArgumentParser:
-    parser = argparse.ArgumentParser(description="Render a Markdown file to PDF using WeasyPrint.")
-    parser.add_argument("input", type=Path, nargs="?", help="Path to the source Markdown file")
+    parser = argparse.ArgumentParser(description="Render Markdown files to PDF using WeasyPrint.")
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        metavar="input",
+        help=(
+            "Markdown files, directories or glob patterns to convert. A single file may be "
+            "followed by an output PDF path (defaults to input basename with .pdf)"
+        ),
+    )
     parser.add_argument(
-        "output",
+        "-o",
+        "--output-dir",
+        dest="output_dir",
         type=Path,
-        nargs="?",
-        help="Optional output PDF path (defaults to input basename with .pdf)",
+        help="Directory for batch output (defaults to writing each PDF next to its source)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        help="Number of worker processes for batch conversion (defaults to the CPU count)",
     )
     parser.add_argument(
         "--css",
@@ -313,36 +989,492 @@ def build_parser() -> argparse.ArgumentParser:
         dest="title",
         help="Document title (defaults to the Markdown filename)",
     )
+    parser.add_argument(
+        "--sections",
+        dest="sections",
+        choices=["auto", "always", "never"],
+        default="auto",
+        help=(
+            "Lay out large documents as parallel sections merged into one PDF; 'auto' does so "
+            "above PYMARK_SECTION_THRESHOLD characters when pypdf is installed (default: auto)"
+        ),
+    )
+    parser.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        help="Only re-render outputs whose Markdown, CSS, title, images or renderer version changed",
+    )
+    parser.add_argument(
+        "--watch",
+        dest="watch",
+        action="store_true",
+        help="Build incrementally, then keep watching the inputs and re-render on change",
+    )
+    parser.add_argument(
+        "--normalize-math",
+        dest="normalize_math",
+        action="store_true",
+        help="Repair mojibake and Unicode math notation in the Markdown inputs in place instead of converting",
+    )
+    parser.add_argument(
+        "--rules",
+        dest="rules",
+        help=(
+            "Rule groups for --normalize-math, comma-separated: encoding, symbols, notation "
+            "(default: encoding,symbols)"
+        ),
+    )
+    parser.add_argument(
+        "--check",
+        dest="check",
+        action="store_true",
+        help="With --normalize-math, only report the files that would change (exit status 1 if any)",
+    )
+    parser.add_argument(
+        "--manifest",
+        dest="manifest",
+        type=Path,
+        help="Build manifest for --incremental/--watch (default: .pymark-manifest.json in the output directory)",
+    )
     parser.add_argument(
         "--serve",
         dest="serve",
         action="store_true",
         help="Launch the web interface instead of running the CLI",
     )
+    parser.add_argument(
+        "--daemon",
+        dest="daemon",
+        action="store_true",
+        help="Keep a warm renderer listening on a Unix socket; single-file conversions are sent to it",
+    )
+    parser.add_argument(
+        "--socket",
+        dest="socket",
+        type=Path,
+        help="Socket for --daemon and for reaching it (default: PYMARK_SOCKET or a per-user path)",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        dest="use_daemon",
+        action="store_false",
+        help="Render in this process even when a render daemon is running",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Never fetch remote stylesheets, fonts or images while rendering; also PYMARK_OFFLINE=1",
+    )
+    parser.add_argument(
+        "--asgi",
+        action="store_true",
+        help="With --serve, run on an asyncio event loop under uvicorn (pip install uvicorn)",
+    )
+    parser.add_argument(
+        "--fetch-concurrency",
+        dest="fetch_concurrency",
+        type=int,
+        default=DEFAULT_FETCH_CONCURRENCY,
+        help=f"With --asgi, remote fetches in flight at once (default: {DEFAULT_FETCH_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--fetch-per-host",
+        dest="fetch_per_host",
+        type=int,
+        default=DEFAULT_FETCH_PER_HOST,
+        help=f"With --asgi, remote fetches in flight at once to one host (default: {DEFAULT_FETCH_PER_HOST})",
+    )
+    parser.add_argument(
+        "--asgi-threads",
+        dest="asgi_threads",
+        type=int,
+        default=DEFAULT_ASGI_THREADS,
+        help=f"With --asgi, threads running renders and other blocking routes (default: {DEFAULT_ASGI_THREADS})",
+    )
     parser.add_argument("--host", default="127.0.0.1", help="Host for --serve (default: 127.0.0.1)")
     parser.add_argument("--port", type=int, default=5000, help="Port for --serve (default: 5000)")
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        type=Path,
+        help="Directory for the persistent PDF cache used by --serve (shared across processes)",
+    )
+    parser.add_argument(
+        "--cache-size-mb",
+        dest="cache_size_mb",
+        type=float,
+        help="In-memory PDF cache budget for --serve in megabytes (default: 64)",
+    )
+    parser.add_argument(
+        "--render-workers",
+        dest="render_workers",
+        type=int,
+        default=0,
+        help="Pre-forked render worker processes for --serve (0 renders in the server process; default: 0)",
+    )
+    parser.add_argument(
+        "--render-queue-depth",
+        dest="render_queue_depth",
+        type=int,
+        help="Requests allowed to wait for a render worker before answering 429 (default: 64)",
+    )
+    parser.add_argument(
+        "--worker-max-renders",
+        dest="worker_max_renders",
+        type=int,
+        help="Replace a render worker after this many renders (default: 200)",
+    )
+    parser.add_argument(
+        "--worker-max-rss-mb",
+        dest="worker_max_rss_mb",
+        type=float,
+        help="Replace a render worker whose resident memory exceeds this (default: 1024)",
+    )
+    parser.add_argument(
+        "--memory-budget-mb",
+        dest="memory_budget_mb",
+        type=float,
+        help=(
+            "Memory one --serve render may use: larger exports are refused with 413 and renders that "
+            "outgrow it fail on their render worker, at least one of which is started "
+            "(default: PYMARK_MEMORY_BUDGET_MB, unlimited)"
+        ),
+    )
+    parser.add_argument(
+        "--job-workers",
+        dest="job_workers",
+        type=int,
+        help="Concurrent renders for the /jobs export queue (default: 2)",
+    )
+    parser.add_argument(
+        "--job-queue-depth",
+        dest="job_queue_depth",
+        type=int,
+        help="Jobs allowed to wait before POST /jobs answers 429 (default: 32)",
+    )
+    parser.add_argument(
+        "--job-retention",
+        dest="job_retention",
+        type=float,
+        help="Seconds finished job results are kept for download (default: 900)",
+    )
+    parser.add_argument(
+        "--no-metrics",
+        dest="metrics",
+        action="store_false",
+        help="Disable stage timing (Server-Timing values and /metrics histograms); also PYMARK_METRICS=0",
+    )
+    parser.add_argument(
+        "--profile-slow-ms",
+        dest="profile_slow_ms",
+        type=float,
+        help="Sample the stacks of --serve requests and keep profiles of those slower than this",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        dest="profile_dir",
+        type=Path,
+        default=Path("profiles"),
+        help="Directory for slow-request profiles as collapsed stacks (default: ./profiles)",
+    )
     return parser
 
 
+def is_legacy_output(spec: str) -> bool:
+    """Whether a second positional argument is an old-style output path
+    rather than another input (a Markdown file, directory or glob)."""
+    from batch import MARKDOWN_SUFFIXES
+
+    path = Path(spec)
+    return not glob.has_magic(spec) and not path.is_dir() and path.suffix.lower() not in MARKDOWN_SUFFIXES
+
+
+def run_batch_cli(args: argparse.Namespace) -> int:
+    from batch import collect_inputs, format_summary, plan_tasks, print_result, run_batch
+
+    try:
+        tasks = plan_tasks(collect_inputs(args.inputs), args.output_dir, args.css, args.title)
+    except ValueError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+    if not tasks:
+        print("No Markdown files found.", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    sections = {"auto": None, "always": True, "never": False}[args.sections]
+    results = run_batch(tasks, jobs=args.jobs, report=print_result, sections=sections)
+    print(format_summary(results, time.perf_counter() - start))
+    return 0 if all(result.ok for result in results) else 1
+
+
+def run_normalize_cli(args: argparse.Namespace) -> int:
+    from batch import collect_inputs
+    from math_normalize import DEFAULT_RULE_GROUPS, format_normalize_summary, print_normalize_result, run_normalize
+
+    groups = DEFAULT_RULE_GROUPS
+    if args.rules is not None:
+        groups = tuple(group.strip() for group in args.rules.split(",") if group.strip())
+    paths = [source for source, _ in collect_inputs(args.inputs)]
+    if not paths:
+        print("No Markdown files found.", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    results = run_normalize(paths, groups, check=args.check, jobs=args.jobs, report=print_normalize_result)
+    print(format_normalize_summary(results, time.perf_counter() - start, check=args.check))
+    if not all(result.ok for result in results):
+        return 1
+    return 1 if args.check and any(result.changed for result in results) else 0
+
+
+def run_incremental_cli(args: argparse.Namespace) -> int:
+    from batch import collect_inputs, format_summary, plan_tasks, print_result
+    from incremental import MANIFEST_NAME, BuildManifest, incremental_build, watch
+
+    inputs: list[str] = args.inputs
+    output_dir: Path | None = args.output_dir
+    try:
+        tasks = plan_tasks(collect_inputs(inputs), output_dir, args.css, args.title)
+    except ValueError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+
+    manifest = BuildManifest(args.manifest or (output_dir or Path.cwd()) / MANIFEST_NAME)
+
+    def summarize(results: list, skipped: int, elapsed: float) -> None:
+        if results:
+            print(f"{format_summary(results, elapsed)}; {skipped} up to date")
+        else:
+            print(f"All {skipped} documents up to date")
+
+    if args.watch:
+        print("Watching for changes (Ctrl+C to stop)...")
+        try:
+            watch(
+                inputs,
+                output_dir,
+                args.css,
+                args.title,
+                manifest,
+                renderer_version(),
+                jobs=args.jobs,
+                report=print_result,
+                on_build=summarize,
+            )
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    start = time.perf_counter()
+    results, skipped = incremental_build(tasks, manifest, renderer_version(), jobs=args.jobs, report=print_result)
+    summarize(results, skipped, time.perf_counter() - start)
+    return 0 if all(result.ok for result in results) else 1
+
+
+def daemon_version() -> str:
+    """Identifies the code and settings a daemon runs; clients only use a daemon that matches.
+
+    The code is identified by the names and modification times of all the
+    modules next to this one, so editing any of them retires a running daemon.
+    The ``DAEMON_ENVIRONMENT`` variables are part of it, so for example an
+    ``--offline`` conversion is never handed to a daemon that may use the
+    network, nor one with another image resolution to a daemon using the first.
+    """
+    modules = hashlib.sha256()
+    for module in sorted(Path(__file__).resolve().parent.glob("*.py")):
+        modules.update(f"{module.name}:{module.stat().st_mtime_ns}\n".encode("utf-8"))
+    for name in DAEMON_ENVIRONMENT:
+        modules.update(f"{name}={os.environ.get(name)!r}\n".encode("utf-8"))
+    return f"{PYMARK_VERSION}+{modules.hexdigest()[:16]}"
+
+
+def run_daemon(args: argparse.Namespace) -> int:
+    from render_daemon import RenderDaemon, default_socket_path
+
+    context = warm_render_context()
+
+    def render(job: dict) -> None:
+        render_markdown_to_pdf(
+            Path(job["markdown"]),
+            Path(job["pdf"]),
+            Path(job["css"]) if job.get("css") else None,
+            job["title"],
+            context=context,
+            sections=job.get("sections"),
+        )
+
+    daemon = RenderDaemon(args.socket or default_socket_path(), render, daemon_version())
+    print(f"Render daemon listening on {daemon.socket_path} (Ctrl+C to stop)")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
 def main(argv: list[str] | None = None) -> int:
     parser = build_parser()
     args = parser.parse_args(argv)
+    if args.offline:
+        # Through the environment so render workers and daemons inherit it.
+        os.environ["PYMARK_OFFLINE"] = "1"
+
+    if args.daemon:
+        try:
+            return run_daemon(args)
+        except RuntimeError as exc:
+            parser.error(str(exc))
 
     if args.serve:
-        app = create_app()
-        app.run(host=args.host, port=args.port, debug=False)
+        from export_jobs import DEFAULT_QUEUE_DEPTH, DEFAULT_RETENTION, DEFAULT_WORKERS
+        from memory_budget import MemoryGuard, budget_from_env
+        from render_cache import RenderCache
+        from render_pool import DEFAULT_MAX_RENDERS, DEFAULT_MAX_RSS_BYTES, RenderPool
+        from render_pool import DEFAULT_QUEUE_DEPTH as RENDER_QUEUE_DEPTH
+
+        # The parser leaves these unset so that it need not import the modules.
+        for name, default in (
+            ("render_queue_depth", RENDER_QUEUE_DEPTH),
+            ("worker_max_renders", DEFAULT_MAX_RENDERS),
+            ("worker_max_rss_mb", DEFAULT_MAX_RSS_BYTES / (1024 * 1024)),
+            ("job_workers", DEFAULT_WORKERS),
+            ("job_queue_depth", DEFAULT_QUEUE_DEPTH),
+            ("job_retention", DEFAULT_RETENTION),
+        ):
+            if getattr(args, name) is None:
+                setattr(args, name, default)
+        cache = cache_from_env()
+        if args.cache_dir is not None or args.cache_size_mb is not None:
+            cache = RenderCache(
+                max_bytes=int(args.cache_size_mb * 1024 * 1024) if args.cache_size_mb else cache.max_bytes,
+                disk_dir=args.cache_dir or cache.disk_dir,
+                max_disk_bytes=cache.max_disk_bytes,
+            )
+        if args.job_workers < 1 or args.job_queue_depth < 0:
+            parser.error("--job-workers must be at least 1 and --job-queue-depth at least 0")
+        if args.render_workers < 0 or args.worker_max_renders < 1:
+            parser.error("--render-workers must be at least 0 and --worker-max-renders at least 1")
+        memory_budget = (
+            int(args.memory_budget_mb * 1024 * 1024) if args.memory_budget_mb else budget_from_env()
+        )
+        pool = None
+        if args.render_workers or memory_budget:
+            # A budget is enforced by the address-space limit of a worker
+            # process, so it always renders on at least one.
+            pool = RenderPool(
+                size=args.render_workers or 1,
+                max_renders=args.worker_max_renders,
+                max_rss_bytes=int(args.worker_max_rss_mb * 1024 * 1024) if args.worker_max_rss_mb else None,
+                queue_depth=args.render_queue_depth,
+                memory_budget=memory_budget,
+            )
+            atexit.register(pool.close)
+        if not args.metrics:
+            metrics.set_enabled(False)
+        profiler = None
+        if args.profile_slow_ms is not None:
+            profiler = SlowRequestProfiler(args.profile_slow_ms / 1000, args.profile_dir)
+        options = dict(
+            pool=pool,
+            profiler=profiler,
+            cache=cache,
+            job_workers=args.job_workers,
+            job_queue_depth=args.job_queue_depth,
+            job_retention=args.job_retention,
+            memory_guard=MemoryGuard(memory_budget) if memory_budget else None,
+        )
+        if args.asgi:
+            if args.fetch_concurrency < 1 or args.fetch_per_host < 1 or args.asgi_threads < 1:
+                parser.error("--fetch-concurrency, --fetch-per-host and --asgi-threads must be at least 1")
+            try:
+                import uvicorn
+            except ImportError:
+                parser.error("--asgi needs uvicorn. Install with `pip install uvicorn`.")
+            app = create_asgi_app(
+                fetch_concurrency=args.fetch_concurrency,
+                fetch_per_host=args.fetch_per_host,
+                threads=args.asgi_threads,
+                **options,
+            )
+        else:
+            app = create_app(**options)
+        if memory_budget:
+            # Log every render's peak next to the request log.
+            import logging
+
+            memory_logger = logging.getLogger("pymark.memory")
+            memory_logger.setLevel(logging.INFO)
+            memory_logger.addHandler(logging.StreamHandler())
+        if args.asgi:
+            uvicorn.run(app, host=args.host, port=args.port, lifespan="on")
+        else:
+            app.run(host=args.host, port=args.port, debug=False)
         return 0
 
-    if args.input is None:
+    if not args.inputs:
         parser.error("input is required unless --serve is provided")
 
-    md_path: Path = args.input
-    output_path: Path = args.output if args.output else md_path.with_suffix(".pdf")
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    if args.normalize_math:
+        from math_normalize import RULE_GROUPS
+
+        unknown = {group.strip() for group in (args.rules or "").split(",")} - set(RULE_GROUPS) - {""}
+        if unknown:
+            parser.error(f"unknown --rules group(s): {', '.join(sorted(unknown))}")
+        return run_normalize_cli(args)
+
+    first = args.inputs[0]
+    single_file = args.output_dir is None and not glob.has_magic(first) and not Path(first).is_dir()
+    if args.incremental or args.watch:
+        if any(spec.lower().endswith(".pdf") for spec in args.inputs):
+            parser.error("--incremental/--watch take Markdown inputs only; use --output-dir for outputs")
+        return run_incremental_cli(args)
+    if single_file and len(args.inputs) == 2 and args.inputs[1].lower().endswith(".pdf"):
+        md_path, output_path = Path(args.inputs[0]), Path(args.inputs[1])
+    elif single_file and len(args.inputs) == 2 and is_legacy_output(args.inputs[1]):
+        # `pymark in.md out` named the output before batch inputs existed.
+        md_path, output_path = Path(args.inputs[0]), Path(args.inputs[1])
+        print(
+            f"warning: treating {output_path} as the output path is deprecated; "
+            "give it a .pdf suffix (or use --output-dir)",
+            file=sys.stderr,
+        )
+    elif single_file and len(args.inputs) == 1:
+        md_path = Path(args.inputs[0])
+        output_path = md_path.with_suffix(".pdf")
+    else:
+        return run_batch_cli(args)
+
     css_path: Path | None = args.css
     title = args.title or md_path.stem
 
+    sections = {"auto": None, "always": True, "never": False}[args.sections]
+    if args.use_daemon:
+        from render_daemon import default_socket_path, request_render
+
+        reply = request_render(
+            args.socket or default_socket_path(),
+            {
+                "markdown": str(md_path.resolve()),
+                "pdf": str(output_path.resolve()),
+                "css": str(css_path.resolve()) if css_path is not None else None,
+                "title": title,
+                "sections": sections,
+            },
+            daemon_version(),
+        )
+        if reply is not None:
+            if not reply["ok"]:
+                parser.error(reply["error"])
+            print(f"Wrote PDF to {output_path}")
+            return 0
+
     try:
-        render_markdown_to_pdf(md_path, output_path, css_path, title)
+        render_markdown_to_pdf(md_path, output_path, css_path, title, sections=sections)
     except Exception as exc:  # pragma: no cover - simple CLI surface
         parser.error(str(exc))
         return 1
@@ -0,0 +1,80 @@
+"""
+Pooled, reusable Markdown converters.
+
+``markdown.markdown()`` builds a new ``Markdown`` instance and loads every
+extension on each call, which is most of the cost of converting a short
+document. A ``MarkdownPool`` keeps preconfigured converters and ``reset()``s
+them between uses. Converters are not thread-safe, so each one is lent to a
+single caller at a time; concurrent callers get their own.
+"""
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence
+
+if TYPE_CHECKING:  # pragma: no cover
+    from markdown import Markdown
+
+DEFAULT_EXTENSIONS = ("extra", "tables", "fenced_code")
+DEFAULT_MAX_IDLE = 8
+
+
+class MarkdownPool:
+    """Lend out preconfigured ``Markdown`` converters.
+
+    Args:
+        extensions: Extensions every converter in this pool loads.
+        extension_configs: Per-extension settings, as for ``Markdown``.
+        max_idle: Most idle converters kept; extra ones returned by a
+            burst of concurrent callers are discarded.
+    """
+
+    def __init__(
+        self,
+        extensions: Sequence[Any] = DEFAULT_EXTENSIONS,
+        extension_configs: Optional[Dict[str, Dict[str, Any]]] = None,
+        max_idle: int = DEFAULT_MAX_IDLE,
+    ) -> None:
+        self.extensions = list(extensions)
+        self.extension_configs = dict(extension_configs or {})
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle: List[Markdown] = []
+        self._counters = {"created": 0, "reused": 0, "discarded": 0}
+
+    @contextmanager
+    def converter(self) -> Iterator[Markdown]:
+        """Borrow a converter for the duration of the ``with`` block."""
+        with self._lock:
+            md = self._idle.pop() if self._idle else None
+            self._counters["reused" if md is not None else "created"] += 1
+        if md is None:
+            # Imported here so that creating a pool costs nothing at startup.
+            from markdown import Markdown
+
+            md = Markdown(extensions=self.extensions, extension_configs=self.extension_configs)
+        try:
+            yield md
+        finally:
+            try:
+                md.reset()
+            except Exception:
+                # A converter that cannot be reset is not safe to lend again.
+                md = None
+            with self._lock:
+                if md is not None and len(self._idle) < self.max_idle:
+                    self._idle.append(md)
+                else:
+                    self._counters["discarded"] += 1
+
+    def convert(self, text: str) -> str:
+        """Convert ``text`` to HTML with a pooled converter."""
+        with self.converter() as md:
+            return md.convert(text)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["idle"] = len(self._idle)
+        return stats
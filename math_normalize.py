@@ -0,0 +1,451 @@
+"""
+Rule-based clean-up of mojibake and math notation in Markdown files.
+
+Documents pasted through the wrong encoding end up with mojibake such as
+``â‰¥`` for ``≥``, and notes typed in a word processor use Unicode symbols
+(``α``, ``≤``, ``x²``) where the math renderer expects LaTeX. The rules
+below repair both:
+
+* ``encoding``: UTF-8 text that was decoded as Windows-1252 is decoded
+  again (``â‰¥`` -> ``≥``, ``Î·Â²`` -> ``η²``), everywhere but in code;
+* ``symbols``: outside math, runs of Unicode math symbols become inline
+  math (``a × b ≥ 5`` -> ``$a \\times b \\geq 5$``); inside math they become
+  the LaTeX command, and ``\\\\alpha`` doubled by earlier tools is undone;
+* ``notation`` (opt-in): statistics and Greek letter names written as
+  prose (``p < .05``, ``n = 24``, ``alpha``) become inline math.
+
+Rules are declarative (``Rule``); a ``RuleSet`` compiles them into one
+alternation per pass and region instead of one pattern per rule. Files are
+scanned through ``mmap`` with ``iter_math_tokens`` so code and existing
+math are recognized without reading the file into memory, and are
+rewritten line by line through a temporary file. Files that need no change
+are left untouched (their mtime too), and normalizing twice changes
+nothing the second time.
+"""
+from __future__ import annotations
+
+import functools
+import io
+import mmap
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from math_renderer import LATEX_TO_UNICODE, iter_math_tokens
+
+RULE_GROUPS = ("encoding", "symbols", "notation")
+DEFAULT_RULE_GROUPS = ("encoding", "symbols")
+_COPY_CHUNK = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Rule:
+    """One normalization rule.
+
+    Args:
+        name: Reported in change counts.
+        group: ``"encoding"``, ``"symbols"`` or ``"notation"``.
+        where: ``"text"`` (outside math and code), ``"math"`` (between math
+            delimiters) or ``"any"``.
+        pattern: Regular expression for the text to replace. It may use
+            groups but not named ones, and no backreferences.
+        replace: ``str.format`` template applied to the matched text, or a
+            function of it.
+        wrap: Put the result in ``$...$`` (text rules only).
+        trigger: A bytes pattern found in every line the rule can change;
+            lines without any rule's trigger are copied without decoding.
+            Empty means every line is checked.
+    """
+
+    name: str
+    group: str
+    where: str
+    pattern: str
+    replace: Union[str, Callable[[str], str]]
+    wrap: bool = False
+    trigger: bytes = b""
+
+    def apply(self, text: str) -> str:
+        return self.replace.format(text) if isinstance(self.replace, str) else self.replace(text)
+
+
+# -- encoding ---------------------------------------------------------
+
+
+def _cp1252_char(byte: int) -> str:
+    # Bytes cp1252 leaves undefined (0x81, 0x8D...) come through as the
+    # Latin-1 control character of the same value.
+    try:
+        return bytes([byte]).decode("cp1252")
+    except UnicodeDecodeError:
+        return chr(byte)
+
+
+_CP1252_BYTES = {_cp1252_char(byte): byte for byte in range(0x80, 0x100)}
+
+
+def _char_class(first: int, last: int) -> str:
+    return "[" + "".join(re.escape(_cp1252_char(byte)) for byte in range(first, last + 1)) + "]"
+
+
+_CONTINUATION = _char_class(0x80, 0xBF)
+# Two-byte sequences are limited to Latin, Greek and Cyrillic (lead bytes
+# C2-D3): with DF, German "ß“" would read as an N'Ko letter.
+_MOJIBAKE = "(?:{}{c}|{}{c}{{2}}|{}{c}{{3}})+".format(
+    _char_class(0xC2, 0xD3), _char_class(0xE0, 0xEF), _char_class(0xF0, 0xF4), c=_CONTINUATION
+)
+
+@functools.lru_cache(maxsize=None)
+def _mojibake_re() -> "re.Pattern[str]":
+    return re.compile(_MOJIBAKE)
+
+
+def repair_mojibake(text: str) -> str:
+    """Decode ``text`` as the UTF-8 bytes it was mistaken for, repeatedly
+    (text can be mangled more than once). Text that does not decode is
+    returned unchanged."""
+    while True:
+        try:
+            repaired = bytes(_CP1252_BYTES[char] for char in text).decode("utf-8")
+        except (KeyError, UnicodeDecodeError):
+            return text
+        if any(unicodedata.category(char) in ("Cc", "Co", "Cn") for char in repaired):
+            return text  # Not text: the original was probably right.
+        if not _mojibake_re().fullmatch(repaired):
+            return repaired
+        text = repaired
+
+
+# -- symbols ----------------------------------------------------------
+
+SYMBOL_COMMANDS: Dict[str, str] = {}
+for _command, _char in LATEX_TO_UNICODE.items():
+    SYMBOL_COMMANDS.setdefault(_char, _command)  # \to rather than \rightarrow
+SYMBOL_COMMANDS.update({
+    "ζ": r"\zeta", "κ": r"\kappa", "ν": r"\nu", "ξ": r"\xi", "ψ": r"\psi",
+    "Γ": r"\Gamma", "Θ": r"\Theta", "Λ": r"\Lambda", "Π": r"\Pi", "Σ": r"\Sigma",
+    "Φ": r"\Phi", "Ψ": r"\Psi", "Ω": r"\Omega",
+    "≡": r"\equiv", "∝": r"\propto", "∓": r"\mp", "∉": r"\notin", "∀": r"\forall",
+    "∃": r"\exists", "⇒": r"\Rightarrow", "⇔": r"\Leftrightarrow", "↔": r"\leftrightarrow",
+    "↑": r"\uparrow", "↓": r"\downarrow", "√": r"\surd",
+})
+SUPERSCRIPTS = dict(zip("⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻", "0123456789+-"))
+SUBSCRIPTS = dict(zip("₀₁₂₃₄₅₆₇₈₉₊₋", "0123456789+-"))
+
+_SYMBOL = "[" + "".join(re.escape(char) for char in [*SYMBOL_COMMANDS, *SUPERSCRIPTS, *SUBSCRIPTS]) + "]"
+# A run is symbols with the lone letters before and after them and the
+# numbers after them ("x² ≥ 0.5"). Letters followed by "(" or "_" start a
+# name and numbers in ranges ("13-14") stay out.
+_LETTER = r"(?<![A-Za-z0-9_.])[A-Za-z](?![A-Za-z0-9_(])"
+_NUMBER_AFTER = r"(?<![A-Za-z0-9_.\-–])\d+(?:\.\d+)?(?![A-Za-z0-9_.\-–])"
+_SYMBOL_RUN = rf"(?:(?:{_SYMBOL}|{_LETTER})[ \t]?){{0,2}}{_SYMBOL}(?:[ \t]?(?:{_SYMBOL}|{_LETTER}|{_NUMBER_AFTER}))*"
+_SCRIPT_RUN = re.compile("([{}]+)|([{}]+)".format("".join(SUPERSCRIPTS), "".join(SUBSCRIPTS)))
+_LATEX_WORDS = sorted({command[1:] for command in SYMBOL_COMMANDS.values()}, key=len, reverse=True)
+_ENDS_IN_COMMAND = re.compile(r"\\[A-Za-z]+$")
+
+
+def symbols_to_latex(text: str) -> str:
+    """Spell the Unicode math symbols of ``text`` as LaTeX (``x²≥α`` -> ``x^2\\geq\\alpha``)."""
+    parts: List[str] = []
+    pos = 0
+    for match in _SCRIPT_RUN.finditer(text):
+        parts.append(_commands(text[pos:match.start()]))
+        if match.group(1):
+            digits = "".join(SUPERSCRIPTS[char] for char in match.group(1))
+            parts.append("^" + (digits if len(digits) == 1 else "{" + digits + "}"))
+        else:
+            digits = "".join(SUBSCRIPTS[char] for char in match.group(2))
+            parts.append("_" + (digits if len(digits) == 1 else "{" + digits + "}"))
+        pos = match.end()
+    parts.append(_commands(text[pos:]))
+    return "".join(parts)
+
+
+def _commands(text: str) -> str:
+    out: List[str] = []
+    for char in text:
+        if out and _ENDS_IN_COMMAND.search(out[-1]) and char.isascii() and char.isalnum():
+            out.append(" ")
+        out.append(SYMBOL_COMMANDS.get(char, char))
+    return "".join(out)
+
+
+# -- rules ------------------------------------------------------------
+
+_NON_ASCII = rb"[\x80-\xff]"
+_NUMBER = r"-?(?:\d+(?:\.\d+)?|\.\d+)"
+_GREEK_WORDS = ("alpha", "beta", "gamma", "delta", "Delta", "epsilon", "eta", "theta", "lambda", "sigma", "chi", "omega")
+
+RULES: Tuple[Rule, ...] = (
+    Rule("mojibake", "encoding", "any", _MOJIBAKE, repair_mojibake, trigger=_NON_ASCII),
+    Rule("symbol-run", "symbols", "text", _SYMBOL_RUN, symbols_to_latex, wrap=True, trigger=_NON_ASCII),
+    Rule("symbol", "symbols", "math", _SYMBOL + "+", symbols_to_latex, trigger=_NON_ASCII),
+    Rule(
+        "doubled-backslash", "symbols", "math",
+        r"(?<!\\)\\\\(?=(?:{})(?![A-Za-z]))".format("|".join(_LATEX_WORDS)), "\\", trigger=rb"\\\\",
+    ),
+    Rule("sample-size", "notation", "text", r"\bn = \d+(?:[-–]\d+)?(?![\w.])", "{0}", wrap=True),
+    Rule("time", "notation", "text", rf"(?<![=:])\bt = {_NUMBER}(?:[-–]\d+(?:\.\d+)?)?(?![\w])", "{0}", wrap=True),
+    Rule("statistic", "notation", "text", rf"\b[rpd] (?:[<>=]|[≤≥]) {_NUMBER}(?![\w])", symbols_to_latex, wrap=True),
+    Rule("test-statistic", "notation", "text", rf"\b(?:t\(\d+\)|F\(\d+, ?\d+\)) = {_NUMBER}(?![\w])", "{0}", wrap=True),
+    Rule("coordinate", "notation", "text", rf"\b[xyz]=[±]?{_NUMBER}(?![\w])", symbols_to_latex, wrap=True),
+    Rule("greek-name", "notation", "text", r"(?<![\\\w])(?:{})(?!\w)".format("|".join(_GREEK_WORDS)), "\\{0}", wrap=True),
+)
+
+
+class _Pass:
+    """The rules of one pass and region, combined into a single pattern."""
+
+    def __init__(self, rules: Sequence[Rule]) -> None:
+        self.rules = {f"r{index}": rule for index, rule in enumerate(rules)}
+        self.pattern = re.compile("|".join(f"(?P<{name}>{rule.pattern})" for name, rule in self.rules.items()))
+
+    def sub(self, line: str, before: str, after: str, counts: Dict[str, int]) -> str:
+        last_wrap_end = -1
+
+        def replace(match: "re.Match[str]") -> str:
+            nonlocal last_wrap_end
+            rule = self.rules[match.lastgroup]
+            text = match.group()
+            result = rule.apply(text)
+            following = line[match.end():match.end() + 1] or after
+            if rule.wrap:
+                preceding = line[match.start() - 1:match.start()] if match.start() else before
+                result = "$" + result.strip() + "$"
+                # Keep "$x$" from touching other math ("$$" opens display
+                # math) and from being closed right before a digit.
+                if preceding == "$" or match.start() == last_wrap_end:
+                    result = " " + result
+                if following == "$" or following.isdigit():
+                    result += " "
+                last_wrap_end = match.end()
+            elif _ENDS_IN_COMMAND.search(result) and following.isascii() and following.isalpha():
+                result += " "
+            if result != text:
+                counts[rule.name] = counts.get(rule.name, 0) + 1
+            return result
+
+        return self.pattern.sub(replace, line)
+
+
+class RuleSet:
+    """Compiled rules: an encoding pass, then a text or math pass."""
+
+    def __init__(self, rules: Iterable[Rule]) -> None:
+        rules = list(rules)
+        self.rules = rules
+        first = [rule for rule in rules if rule.group == "encoding"]
+        rest = [rule for rule in rules if rule.group != "encoding"]
+        self._passes: Dict[str, List[_Pass]] = {}
+        self._triggers: Dict[str, Optional["re.Pattern[bytes]"]] = {}
+        for region in ("text", "math"):
+            triggers = [rule.trigger for rule in rules if rule.where in (region, "any")]
+            if not triggers:
+                self._triggers[region] = re.compile(rb"(?!)")  # Nothing to do here.
+            else:
+                self._triggers[region] = re.compile(b"|".join(triggers)) if all(triggers) else None
+            passes = []
+            for selected in (first, rest):
+                matching = [rule for rule in selected if rule.where in (region, "any")]
+                if matching:
+                    passes.append(_Pass(matching))
+            self._passes[region] = passes
+
+    def trigger(self, region: str) -> Optional["re.Pattern[bytes]"]:
+        """A bytes pattern that lines ``normalize`` can change contain, or None."""
+        return self._triggers[region]
+
+    def normalize(self, line: str, region: str, before: str = "\n", after: str = "\n",
+                  counts: Optional[Dict[str, int]] = None) -> str:
+        """Apply the rules for ``region`` (``"text"`` or ``"math"``) to one line.
+
+        ``before`` and ``after`` are the characters around the line, which
+        decide the spacing of inserted math.
+        """
+        counts = {} if counts is None else counts
+        for rule_pass in self._passes[region]:
+            line = rule_pass.sub(line, before, after, counts)
+        return line
+
+
+@functools.lru_cache(maxsize=None)
+def rule_set(groups: Tuple[str, ...] = DEFAULT_RULE_GROUPS) -> RuleSet:
+    """The compiled rules of ``groups`` (compiled once per process)."""
+    unknown = set(groups) - set(RULE_GROUPS)
+    if unknown:
+        raise ValueError(f"unknown rule group(s): {', '.join(sorted(unknown))}")
+    return RuleSet(rule for rule in RULES if rule.group in groups)
+
+
+def normalize_text(text: str, groups: Tuple[str, ...] = DEFAULT_RULE_GROUPS) -> str:
+    """Normalize a Markdown string (see ``normalize_file`` for files)."""
+    out = io.BytesIO()
+    _normalize(text.encode("utf-8"), out, rule_set(groups), {})
+    return out.getvalue().decode("utf-8")
+
+
+# -- files ------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class NormalizeResult:
+    path: Path
+    ok: bool
+    seconds: float
+    changes: Dict[str, int] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.changes)
+
+
+def normalize_file(path: Path, groups: Tuple[str, ...] = DEFAULT_RULE_GROUPS, check: bool = False) -> NormalizeResult:
+    """Normalize one file in place, or only count the changes with ``check``.
+
+    Failures (unreadable file, text that is not UTF-8) are captured in the
+    result; the file is then left as it was.
+    """
+    start = time.perf_counter()
+    path = Path(path)
+    counts: Dict[str, int] = {}
+    temp_path: Optional[Path] = None
+    try:
+        rules = rule_set(groups)
+        with open(path, "rb") as source:
+            if os.fstat(source.fileno()).st_size == 0:
+                return NormalizeResult(path, ok=True, seconds=time.perf_counter() - start)
+            with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if check:
+                    _normalize(data, None, rules, counts)
+                else:
+                    with tempfile.NamedTemporaryFile(
+                        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False
+                    ) as target:
+                        temp_path = Path(target.name)
+                        _normalize(data, target, rules, counts)
+        if temp_path is not None:
+            if counts:
+                shutil.copymode(path, temp_path)
+                os.replace(temp_path, path)
+            else:
+                temp_path.unlink()
+            temp_path = None
+    except UnicodeDecodeError as exc:
+        return NormalizeResult(path, ok=False, seconds=time.perf_counter() - start, error=f"not UTF-8 ({exc.reason} at byte {exc.start})")
+    except Exception as exc:
+        return NormalizeResult(path, ok=False, seconds=time.perf_counter() - start, error=str(exc))
+    finally:
+        if temp_path is not None:
+            temp_path.unlink(missing_ok=True)
+    return NormalizeResult(path, ok=True, seconds=time.perf_counter() - start, changes=counts)
+
+
+def _normalize(data, target: Optional[IO[bytes]], rules: RuleSet, counts: Dict[str, int]) -> None:
+    """Stream ``data`` (bytes or mmap) to ``target`` with code copied verbatim,
+    math content normalized as math and everything else as text."""
+    length = len(data)
+
+    def copy(start: int, end: int) -> None:
+        if target is not None:
+            for chunk_start in range(start, end, _COPY_CHUNK):
+                target.write(data[chunk_start:min(end, chunk_start + _COPY_CHUNK)])
+
+    def lines(start: int, end: int, region: str) -> None:
+        trigger = rules.trigger(region)
+        while start < end:
+            if trigger is not None:
+                # Copy everything up to the next line that may change.
+                hit = trigger.search(data, start, end)
+                if hit is None:
+                    copy(start, end)
+                    return
+                line_start = max(start, data.rfind(b"\n", start, hit.start()) + 1)
+                copy(start, line_start)
+                start = line_start
+            newline = data.find(b"\n", start, end)
+            stop = end if newline < 0 else newline + 1
+            raw = data[start:stop]
+            line = raw.decode("utf-8")
+            before = data[start - 1:start].decode("latin-1") or "\n"
+            after = data[stop:stop + 1].decode("latin-1") or "\n"
+            fixed = rules.normalize(line, region, before, after, counts)
+            if target is not None:
+                target.write(fixed.encode("utf-8") if fixed != line else raw)
+            start = stop
+
+    pos = 0
+    for token in iter_math_tokens(data):
+        if token.kind == "code":
+            lines(pos, token.start, "text")
+            copy(token.start, token.end)
+            pos = token.end
+        elif token.kind in ("inline", "display"):
+            lines(pos, token.start, "text")
+            copy(token.start, token.content_start)
+            lines(token.content_start, token.content_end, "math")
+            copy(token.content_end, token.end)
+            pos = token.end
+    lines(pos, length, "text")
+
+
+def run_normalize(
+    paths: List[Path],
+    groups: Tuple[str, ...] = DEFAULT_RULE_GROUPS,
+    check: bool = False,
+    jobs: Optional[int] = None,
+    report=None,
+) -> List[NormalizeResult]:
+    """Normalize ``paths`` on ``jobs`` worker processes (default: all cores).
+
+    ``report`` is called with each ``NormalizeResult`` as soon as it finishes.
+    """
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(paths) or 1))
+    results: List[NormalizeResult] = []
+    if jobs == 1:
+        for path in paths:
+            result = normalize_file(path, groups, check)
+            results.append(result)
+            if report is not None:
+                report(result)
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(normalize_file, path, groups, check): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as exc:  # Worker died.
+                result = NormalizeResult(futures[future], ok=False, seconds=0.0, error=f"worker failed: {exc}")
+            results.append(result)
+            if report is not None:
+                report(result)
+    return results
+
+
+def format_normalize_summary(results: List[NormalizeResult], elapsed: float, check: bool = False) -> str:
+    changed = sum(1 for result in results if result.changed)
+    failed = sum(1 for result in results if not result.ok)
+    changes = sum(sum(result.changes.values()) for result in results)
+    verb = "would change" if check else "changed"
+    summary = f"Normalized {len(results)} files in {elapsed:.2f}s: {changed} {verb} ({changes} fixes)"
+    if failed:
+        summary += f"; {failed} failed"
+    return summary
+
+
+def print_normalize_result(result: NormalizeResult) -> None:
+    if not result.ok:
+        print(f"Failed {result.path}: {result.error}", file=sys.stderr)
+    elif result.changed:
+        fixes = ", ".join(f"{count} {name}" for name, count in sorted(result.changes.items()))
+        print(f"{result.path}: {fixes}")
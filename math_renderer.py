@@ -3,93 +3,302 @@ Mathematical equation rendering utilities for Pymark.
 Provides LaTeX math rendering support for both web preview and PDF export.
 """
 
+import functools
+import html
+import os
 import re
-from typing import List, Tuple
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+
+LATEX_TO_UNICODE = {
+    r'\alpha': 'α',
+    r'\beta': 'β',
+    r'\gamma': 'γ',
+    r'\delta': 'δ',
+    r'\Delta': 'Δ',
+    r'\epsilon': 'ε',
+    r'\eta': 'η',
+    r'\theta': 'θ',
+    r'\lambda': 'λ',
+    r'\mu': 'μ',
+    r'\pi': 'π',
+    r'\rho': 'ρ',
+    r'\sigma': 'σ',
+    r'\tau': 'τ',
+    r'\phi': 'φ',
+    r'\chi': 'χ',
+    r'\omega': 'ω',
+    r'\geq': '≥',
+    r'\leq': '≤',
+    r'\neq': '≠',
+    r'\approx': '≈',
+    r'\pm': '±',
+    r'\times': '×',
+    r'\div': '÷',
+    r'\cdot': '·',
+    r'\to': '→',
+    r'\rightarrow': '→',
+    r'\leftarrow': '←',
+    r'\in': '∈',
+    r'\subset': '⊂',
+    r'\subseteq': '⊆',
+    r'\cup': '∪',
+    r'\cap': '∩',
+    r'\infty': '∞',
+    r'\partial': '∂',
+    r'\nabla': '∇',
+    r'\int': '∫',
+    r'\sum': '∑',
+    r'\prod': '∏',
+}
+
+
+class MathToken(NamedTuple):
+    """
+    A typed span found by ``iter_math_tokens``.
+
+    ``start``/``end`` cover the whole span including delimiters and
+    ``content_start``/``content_end`` the text between them. Offsets index the
+    object that was scanned: character offsets for ``str`` input, byte offsets
+    for ``bytes``/``mmap`` input.
+    """
+    kind: str  # "display", "inline", "code", "escaped_dollar" or "unmatched"
+    delimiter: str  # "$$", "$", "\\[", "\\(", "`", "```" or "~~~"
+    start: int
+    end: int
+    content_start: int
+    content_end: int
+
+
+class _Patterns:
+    """The tokenizer's compiled patterns for one text type (str or bytes)."""
+
+    def __init__(self, cast) -> None:
+        self.cast = cast
+        # One pattern finds every position where the state can change. It is
+        # written to start with a single character class, which lets the
+        # regex engine skip plain text at memchr-like speed (named groups or
+        # an alternation of literals would defeat that). Matches are
+        # classified by their first character afterwards.
+        self.token = re.compile(cast(r"[\\$`~](?:(?<=\\)[$\[(]|(?<=\$)\$?|(?<=`)`*|(?<=~)~~+)"))
+        self.backslash = cast("\\")
+        # Inline ``$`` math stops at the first ``$``, backtick or newline; it
+        # only closes on a ``$`` that follows a non-space and is not followed
+        # by a digit, so "costs $5 or $10" stays text.
+        self.inline_stop = re.compile(cast(r"[$`\n]"))
+        self.inline_close_ok = re.compile(cast(r"(?<=[^\s\\])\$(?![$\d])"))
+        self.space = re.compile(cast(r"\s"))
+        self.fence_close: Dict[Tuple[str, int], "re.Pattern"] = {}
+        self.dollar = cast("$")
+        self.newline = cast("\n")
+        self.tick = cast("`")
+        self.closers = {cast("$$"): cast("$$"), cast("\\["): cast("\\]"), cast("\\("): cast("\\)")}
+
+    def fence_closer(self, char: str, length: int) -> "re.Pattern":
+        key = (char, length)
+        pattern = self.fence_close.get(key)
+        if pattern is None:
+            pattern = self.fence_close[key] = re.compile(
+                self.cast(r"^ {0,3}" + re.escape(char) + "{%d,}[ \t]*$" % length), re.MULTILINE
+            )
+        return pattern
+
+
+_STR_PATTERNS = _Patterns(lambda value: value)
+_BYTES_PATTERNS = _Patterns(lambda value: value.encode("ascii"))
+
+
+def iter_math_tokens(text) -> Iterator[MathToken]:
+    """
+    Scan ``text`` once and yield math, code and escaped-dollar spans in order.
+
+    Recognizes ``$$...$$`` and ``\\[...\\]`` (display), ``$...$`` and
+    ``\\(...\\)`` (inline), ``\\$``, fenced code blocks and inline code.
+    Math inside code is not reported. Openers without a closer are yielded
+    as ``"unmatched"`` and scanning resumes right after them.
+
+    The scan jumps between delimiter candidates with precompiled patterns
+    and never backtracks over text it has already classified, so time is
+    linear in the input and memory does not grow with it. ``text`` may be a
+    ``str``, ``bytes`` or an ``mmap`` (offsets are then byte offsets).
+    """
+    patterns = _STR_PATTERNS if isinstance(text, str) else _BYTES_PATTERNS
+    cast = patterns.cast
+    length = len(text)
+    # Once a closer search fails it would fail again from any later opener,
+    # so remember that instead of rescanning (this keeps the scan linear).
+    no_closer_after: Dict[object, int] = {}
+    # Bounds of the line holding the current tick run, found once per line:
+    # searching from every run would rescan long lines.
+    line_start, line_end = 0, -1
+    pos = 0
+
+    while True:
+        match = patterns.token.search(text, pos)
+        if match is None:
+            return
+        start, end = match.span()
+        first = text[start:start + 1]
+        if first == patterns.backslash:
+            kind = "escaped" if text[end - 1:end] == patterns.dollar else "open"
+        elif first == patterns.dollar:
+            kind = "open"
+        else:
+            kind = "ticks"
+
+        if kind == "escaped":
+            yield MathToken("escaped_dollar", "\\$", start, end, end, end)
+            pos = end
+            continue
+
+        if kind == "ticks" and start > line_end:
+            newline = text.find(patterns.newline, end)
+            line_end = length if newline < 0 else newline
+            line_start = text.rfind(patterns.newline, 0, start) + 1
+
+        if kind == "ticks" and end - start >= 3:
+            indent = text[line_start:start]
+            if len(indent) <= 3 and indent.strip() == indent[:0]:
+                kind = "fence"
+
+        if kind == "fence":
+            run = match.group()
+            start = line_start
+            char_str = chr(run[0]) if isinstance(run, bytes) else run[0]
+            closer = patterns.fence_closer(char_str, len(run)).search(text, end)
+            content_start = min(line_end + 1, length)
+            if closer is None:
+                yield MathToken("code", char_str * 3, start, length, content_start, length)
+                return
+            yield MathToken("code", char_str * 3, start, closer.end(), content_start, closer.start())
+            pos = closer.end()
+            continue
+
+        if kind == "ticks":
+            if text[start:start + 1] != patterns.tick:
+                pos = end  # A tilde run that does not start a fence.
+                continue
+            run_length = end - start
+            limit = line_end
+            key = ("ticks", run_length)
+            close = -1
+            if no_closer_after.get(key, -1) < end:
+                search_from = end
+                while True:
+                    close = text.find(match.group(), search_from, limit)
+                    if close < 0:
+                        break
+                    after = close + run_length
+                    if (after >= length or text[after:after + 1] != patterns.tick) and \
+                            text[close - 1:close] != patterns.tick:
+                        break
+                    # Longer run: skip all of it.
+                    while after < length and text[after:after + 1] == patterns.tick:
+                        after += 1
+                    search_from = after
+            if close < 0:
+                no_closer_after[key] = limit
+                pos = end
+                continue
+            yield MathToken("code", "`", start, close + run_length, end, close)
+            pos = close + run_length
+            continue
+
+        opener = match.group()
+        if opener == patterns.dollar:
+            after = text[end:end + 1]
+            if not after or patterns.space.match(after):
+                pos = end  # "$ " never opens math.
+                continue
+            stop = patterns.inline_stop.search(text, end)
+            if stop is not None and text[stop.start():stop.start() + 1] == patterns.dollar \
+                    and patterns.inline_close_ok.match(text, stop.start()):
+                close = stop.start()
+                yield MathToken("inline", "$", start, close + 1, end, close)
+                pos = close + 1
+            else:
+                yield MathToken("unmatched", "$", start, end, end, end)
+                pos = end
+            continue
+
+        closer_text = patterns.closers[opener]
+        delimiter = opener if isinstance(opener, str) else opener.decode("ascii")
+        close = -1
+        if no_closer_after.get(opener, -1) < end:
+            close = text.find(closer_text, end)
+        if close < 0:
+            no_closer_after[opener] = length
+            yield MathToken("unmatched", delimiter, start, end, end, end)
+            pos = end
+            continue
+        kind = "display" if delimiter in ("$$", "\\[") else "inline"
+        yield MathToken(kind, delimiter, start, close + len(closer_text), end, close)
+        pos = close + len(closer_text)
+
+
+def tokenize_math(text) -> List[MathToken]:
+    """Return all tokens from ``iter_math_tokens`` as a list."""
+    return list(iter_math_tokens(text))
+
+
+def iter_math_spans(text) -> Iterator[MathToken]:
+    """Yield only the display and inline math tokens of ``text``."""
+    for token in iter_math_tokens(text):
+        if token.kind == "display" or token.kind == "inline":
+            yield token
 
 
 def extract_math_expressions(text: str) -> List[Tuple[str, str, bool]]:
     """
     Extract LaTeX math expressions from markdown text.
-    
+
+    Recognizes ``$$...$$`` and ``\\[...\\]`` (display) and ``$...$`` and
+    ``\\(...\\)`` (inline). Expressions inside code spans or fences are
+    skipped.
+
     Returns:
-        List of tuples: (original, latex_content, is_display)
-        where is_display=True for display math ($$...$$), False for inline ($...$)
+        List of tuples in document order: (original, latex_content, is_display)
+        where is_display=True for display math, False for inline
     """
-    expressions = []
-    
-    # Display math ($$...$$)
-    display_pattern = r'\$\$(.*?)\$\$'
-    for match in re.finditer(display_pattern, text, re.DOTALL):
-        expressions.append((match.group(0), match.group(1).strip(), True))
-    
-    # Inline math ($...$) - but not $$
-    inline_pattern = r'(?<!\$)\$(?!\$)(.*?)(?<!\$)\$(?!\$)'
-    for match in re.finditer(inline_pattern, text):
-        expressions.append((match.group(0), match.group(1).strip(), False))
-    
-    return expressions
+    return [
+        (text[token.start:token.end], text[token.content_start:token.content_end].strip(), token.kind == "display")
+        for token in iter_math_spans(text)
+    ]
 
 
 def convert_latex_to_unicode(latex: str) -> str:
     """
     Convert simple LaTeX expressions to Unicode for plain text display.
     This is a fallback for environments without proper math rendering.
+
+    Commands are looked up by their full name in one pass, so ``\\infty``
+    is never mistaken for ``\\in`` followed by "fty". Scripts made only of
+    characters with Unicode sub/superscript forms use them (``x^2`` -> x²);
+    others keep a ``^``/``_`` marker. Results are memoized. An expression
+    nested too deeply to translate is returned unchanged.
     """
-    replacements = {
-        r'\alpha': 'α',
-        r'\beta': 'β',
-        r'\gamma': 'γ',
-        r'\delta': 'δ',
-        r'\Delta': 'Δ',
-        r'\epsilon': 'ε',
-        r'\eta': 'η',
-        r'\theta': 'θ',
-        r'\lambda': 'λ',
-        r'\mu': 'μ',
-        r'\pi': 'π',
-        r'\rho': 'ρ',
-        r'\sigma': 'σ',
-        r'\tau': 'τ',
-        r'\phi': 'φ',
-        r'\chi': 'χ',
-        r'\omega': 'ω',
-        r'\geq': '≥',
-        r'\leq': '≤',
-        r'\neq': '≠',
-        r'\approx': '≈',
-        r'\pm': '±',
-        r'\times': '×',
-        r'\div': '÷',
-        r'\cdot': '·',
-        r'\to': '→',
-        r'\rightarrow': '→',
-        r'\leftarrow': '←',
-        r'\in': '∈',
-        r'\subset': '⊂',
-        r'\subseteq': '⊆',
-        r'\cup': '∪',
-        r'\cap': '∩',
-        r'\infty': '∞',
-        r'\partial': '∂',
-        r'\nabla': '∇',
-        r'\int': '∫',
-        r'\sum': '∑',
-        r'\prod': '∏',
-    }
-    
-    result = latex
-    for latex_cmd, unicode_char in replacements.items():
-        result = result.replace(latex_cmd, unicode_char)
-    
-    # Handle subscripts and superscripts (simplified)
-    result = re.sub(r'_\{([^}]+)\}', r'_\1', result)
-    result = re.sub(r'\^\{([^}]+)\}', r'^\1', result)
-    
-    # Clean up remaining LaTeX commands
-    result = re.sub(r'\\text\{([^}]+)\}', r'\1', result)
-    result = result.replace('{', '').replace('}', '')
-    
-    return result
+    return _latex_to_unicode_cached(latex)
+
+
+def convert_many_latex_to_unicode(expressions: Iterable[str]) -> List[str]:
+    """
+    Convert a batch of LaTeX expressions to Unicode, in order.
+
+    Each distinct expression is translated once, however often it repeats.
+    """
+    converted: Dict[str, str] = {}
+    results = []
+    for latex in expressions:
+        text = converted.get(latex)
+        if text is None:
+            text = converted[latex] = _latex_to_unicode_cached(latex)
+        results.append(text)
+    return results
 
 
 def enhance_markdown_with_math_hints(markdown_text: str) -> str:
@@ -97,50 +306,790 @@ def enhance_markdown_with_math_hints(markdown_text: str) -> str:
     Add HTML comments to help identify math regions for PDF processors.
     This can help external tools understand where math is located.
     """
-    # Add markers around display math
-    markdown_text = re.sub(
-        r'\$\$(.*?)\$\$',
-        r'<!-- MATH:DISPLAY:START -->\n$$\1$$\n<!-- MATH:DISPLAY:END -->',
-        markdown_text,
-        flags=re.DOTALL
-    )
-    
-    # Add markers around inline math
-    markdown_text = re.sub(
-        r'(?<!\$)\$(?!\$)(.*?)(?<!\$)\$(?!\$)',
-        r'<!-- MATH:INLINE:START -->$\1$<!-- MATH:INLINE:END -->',
-        markdown_text
-    )
-    
-    return markdown_text
+    parts = []
+    pos = 0
+    for token in iter_math_spans(markdown_text):
+        parts.append(markdown_text[pos:token.start])
+        original = markdown_text[token.start:token.end]
+        if token.kind == "display":
+            parts.append(f"<!-- MATH:DISPLAY:START -->\n{original}\n<!-- MATH:DISPLAY:END -->")
+        else:
+            parts.append(f"<!-- MATH:INLINE:START -->{original}<!-- MATH:INLINE:END -->")
+        pos = token.end
+    parts.append(markdown_text[pos:])
+    return "".join(parts)
+
+
+_INCOMPLETE_COMMAND = re.compile(r'\\[a-zA-Z]+(?![a-zA-Z{])')
 
 
 def validate_latex_delimiters(text: str) -> List[str]:
     """
     Check for common LaTeX delimiter issues.
-    
+
+    See ``latex_lint`` for diagnostics with positions and incremental
+    re-checking.
+
     Returns:
         List of warning messages about potential issues.
     """
     warnings = []
-    
-    # Check for unmatched dollar signs
-    single_dollars = re.findall(r'(?<!\$)\$(?!\$)', text)
-    if len(single_dollars) % 2 != 0:
+    stray_dollars = 0
+    unmatched_display = False
+    incomplete_command = False
+
+    for token in iter_math_tokens(text):
+        if token.kind == "unmatched":
+            if token.delimiter == "$":
+                stray_dollars += 1
+            else:
+                unmatched_display = True
+        elif token.kind in ("display", "inline") and not incomplete_command:
+            incomplete_command = _INCOMPLETE_COMMAND.search(text, token.content_start, token.content_end) is not None
+
+    # A lone "$5" is fine, but an odd number of stray dollars usually means
+    # an inline expression lost one of its delimiters.
+    if stray_dollars % 2 != 0:
         warnings.append("Unmatched single $ delimiters detected - math may not render correctly")
-    
-    # Check for unmatched double dollars
-    double_dollars = re.findall(r'\$\$', text)
-    if len(double_dollars) % 2 != 0:
+
+    if unmatched_display:
         warnings.append("Unmatched $$ delimiters detected - display math may not render correctly")
-    
+
     # Check for common LaTeX command typos
-    if re.search(r'\\[a-zA-Z]+(?![a-zA-Z{])', text):
+    if incomplete_command:
         warnings.append("Possible incomplete LaTeX commands detected")
-    
+
     return warnings
 
 
+# ---------------------------------------------------------------------------
+# Server-side math rendering for PDF export
+#
+# WeasyPrint cannot run KaTeX, so expressions are translated to plain HTML and
+# CSS (italic variables, <sup>/<sub>, inline-block fractions, CSS tables for
+# matrices) that it can lay out. The translator is pure Python and never
+# touches the network.
+# ---------------------------------------------------------------------------
+
+# Bump when the generated markup changes so persistent caches are refreshed.
+MATH_RENDERER_VERSION = "1"
+
+_MATH_SYMBOLS: Dict[str, str] = {name[1:]: char for name, char in LATEX_TO_UNICODE.items()}
+_MATH_SYMBOLS.update({
+    # Greek
+    'iota': 'ι', 'kappa': 'κ', 'nu': 'ν', 'xi': 'ξ', 'omicron': 'ο', 'upsilon': 'υ',
+    'psi': 'ψ', 'zeta': 'ζ', 'varepsilon': 'ε', 'vartheta': 'ϑ', 'varphi': 'ϕ',
+    'varrho': 'ϱ', 'varsigma': 'ς', 'varpi': 'ϖ',
+    'Gamma': 'Γ', 'Theta': 'Θ', 'Lambda': 'Λ', 'Xi': 'Ξ', 'Pi': 'Π', 'Sigma': 'Σ',
+    'Upsilon': 'Υ', 'Phi': 'Φ', 'Psi': 'Ψ', 'Omega': 'Ω',
+    # Relations and operators
+    'ne': '≠', 'le': '≤', 'ge': '≥', 'leqslant': '⩽', 'geqslant': '⩾', 'equiv': '≡',
+    'sim': '∼', 'simeq': '≃', 'cong': '≅', 'propto': '∝', 'll': '≪', 'gg': '≫',
+    'mp': '∓', 'ast': '∗', 'star': '⋆', 'circ': '∘', 'bullet': '•', 'oplus': '⊕',
+    'otimes': '⊗', 'setminus': '∖', 'wedge': '∧', 'vee': '∨', 'land': '∧', 'lor': '∨',
+    'neg': '¬', 'lnot': '¬', 'mid': '∣', 'parallel': '∥', 'perp': '⊥', 'dagger': '†',
+    # Arrows
+    'Rightarrow': '⇒', 'Leftarrow': '⇐', 'Leftrightarrow': '⇔', 'leftrightarrow': '↔',
+    'implies': '⟹', 'iff': '⟺', 'mapsto': '↦', 'uparrow': '↑', 'downarrow': '↓',
+    'longrightarrow': '⟶', 'longleftarrow': '⟵', 'gets': '←',
+    # Sets and logic
+    'notin': '∉', 'ni': '∋', 'supset': '⊃', 'supseteq': '⊇', 'emptyset': '∅',
+    'varnothing': '∅', 'forall': '∀', 'exists': '∃', 'nexists': '∄',
+    # Big operators
+    'oint': '∮', 'iint': '∬', 'iiint': '∭', 'bigcup': '⋃', 'bigcap': '⋂',
+    'coprod': '∐', 'bigoplus': '⨁', 'bigotimes': '⨂',
+    # Miscellaneous
+    'ldots': '…', 'cdots': '⋯', 'dots': '…', 'vdots': '⋮', 'ddots': '⋱',
+    'prime': '′', 'hbar': 'ℏ', 'ell': 'ℓ', 'Re': 'ℜ', 'Im': 'ℑ', 'aleph': 'ℵ',
+    'angle': '∠', 'triangle': '△', 'surd': '√', 'degree': '°',
+    'langle': '⟨', 'rangle': '⟩', 'lfloor': '⌊', 'rfloor': '⌋', 'lceil': '⌈',
+    'rceil': '⌉', 'lbrace': '{', 'rbrace': '}', 'vert': '|', 'Vert': '‖',
+    'backslash': '\\',
+})
+
+# Characters that get operator spacing.
+_MATH_OPERATORS = set('+−=<>±∓×÷·≠≤≥≈≡∼≃≅∝≪≫∈∉∋⊂⊆⊃⊇∪∩→←↔⇒⇐⇔⟹⟺↦∘∗⋆⊕⊗∖∧∨∣')
+
+_MATH_FUNCTIONS = {
+    'sin', 'cos', 'tan', 'cot', 'sec', 'csc', 'arcsin', 'arccos', 'arctan', 'sinh',
+    'cosh', 'tanh', 'log', 'ln', 'lg', 'exp', 'lim', 'limsup', 'liminf', 'max', 'min',
+    'sup', 'inf', 'det', 'dim', 'ker', 'deg', 'gcd', 'arg', 'Pr', 'mod', 'bmod',
+}
+
+_MATH_SPACES = {',': '\u2009', ':': '\u205f', ';': '\u2002', '!': '', ' ': ' ',
+                'quad': '\u2003', 'qquad': '\u2003\u2003', 'enspace': '\u2002'}
+
+_MATH_ACCENTS = {'hat': '\u0302', 'widehat': '\u0302', 'tilde': '\u0303', 'widetilde': '\u0303',
+                 'bar': '\u0304', 'vec': '\u20d7', 'dot': '\u0307', 'ddot': '\u0308',
+                 'check': '\u030c', 'breve': '\u0306', 'acute': '\u0301', 'grave': '\u0300'}
+
+_MATH_TEXT_COMMANDS = {'text', 'textrm', 'textnormal', 'mbox', 'textit', 'textbf', 'operatorname'}
+_MATH_STYLE_COMMANDS = {'mathrm': 'mrm', 'mathbf': 'mbf', 'boldsymbol': 'mbf', 'bm': 'mbf',
+                        'mathit': 'mit', 'mathsf': 'msf', 'mathtt': 'mtt'}
+_MATH_IGNORED = {'left', 'right', 'big', 'Big', 'bigg', 'Bigg', 'bigl', 'bigr', 'Bigl',
+                 'Bigr', 'displaystyle', 'textstyle', 'scriptstyle', 'limits', 'nolimits',
+                 'middle'}
+_MATH_FRACTIONS = {'frac', 'dfrac', 'tfrac', 'cfrac'}
+
+_DOUBLE_STRUCK = {'C': 'ℂ', 'H': 'ℍ', 'N': 'ℕ', 'P': 'ℙ', 'Q': 'ℚ', 'R': 'ℝ', 'Z': 'ℤ'}
+_CALLIGRAPHIC = {'B': 'ℬ', 'E': 'ℰ', 'F': 'ℱ', 'H': 'ℋ', 'I': 'ℐ', 'L': 'ℒ', 'M': 'ℳ', 'R': 'ℛ'}
+
+_ENVIRONMENT_FENCES = {'pmatrix': ('(', ')'), 'bmatrix': ('[', ']'), 'Bmatrix': ('{', '}'),
+                       'vmatrix': ('|', '|'), 'Vmatrix': ('‖', '‖'), 'cases': ('{', '')}
+
+# Every command _LatexToHTML renders; anything else comes out as an error box.
+SUPPORTED_COMMANDS = frozenset(
+    set(_MATH_SYMBOLS) | set(_MATH_SPACES) | _MATH_IGNORED | _MATH_FUNCTIONS | set(_MATH_ACCENTS)
+    | _MATH_TEXT_COMMANDS | set(_MATH_STYLE_COMMANDS) | _MATH_FRACTIONS
+    | {'binom', 'sqrt', 'overline', 'underline', 'mathbb', 'mathcal', 'begin', 'end'}
+    | set('{}$%&#_|\\')
+)
+
+_LATEX_TOKEN = re.compile(r"\\([A-Za-z]+|.)|(\s+)|(.)", re.DOTALL)
+
+
+def _letter_map(text: str, exceptions: Dict[str, str], upper_base: int, lower_base: int) -> str:
+    out = []
+    for ch in text:
+        if ch in exceptions:
+            out.append(exceptions[ch])
+        elif 'A' <= ch <= 'Z':
+            out.append(chr(upper_base + ord(ch) - ord('A')))
+        elif 'a' <= ch <= 'z' and lower_base:
+            out.append(chr(lower_base + ord(ch) - ord('a')))
+        else:
+            out.append(ch)
+    return ''.join(out)
+
+
+# Groups nested deeper than this are not rendered: each level takes a few
+# stack frames, and the expression must not exhaust the recursion limit.
+_MAX_NESTING = 100
+
+
+class _TooDeep(Exception):
+    """Raised by the LaTeX translators for groups nested beyond ``_MAX_NESTING``."""
+
+
+class _LatexToHTML:
+    """Recursive-descent translator from a LaTeX math string to HTML."""
+
+    def __init__(self, tokens: List[Tuple[str, str]], depth: int = 0) -> None:
+        if depth > _MAX_NESTING:
+            raise _TooDeep()
+        self.tokens = tokens
+        self.pos = 0
+        self.depth = depth
+
+    @classmethod
+    def from_latex(cls, latex: str) -> "_LatexToHTML":
+        tokens = []
+        for match in _LATEX_TOKEN.finditer(latex):
+            command, space, char = match.groups()
+            if command is not None:
+                tokens.append(('cmd', command))
+            elif space is not None:
+                tokens.append(('space', space))
+            else:
+                tokens.append(('char', char))
+        return cls(tokens)
+
+    # -- token helpers ---------------------------------------------------
+
+    def _peek(self) -> Optional[Tuple[str, str]]:
+        while self.pos < len(self.tokens) and self.tokens[self.pos][0] == 'space':
+            self.pos += 1
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _raw_group(self) -> List[Tuple[str, str]]:
+        """Consume a ``{...}`` group (or a single token) and return its tokens."""
+        token = self._peek()
+        if token is None:
+            return []
+        self.pos += 1
+        if token != ('char', '{'):
+            return [token]
+        depth, start = 1, self.pos
+        while self.pos < len(self.tokens):
+            kind, value = self.tokens[self.pos]
+            if kind == 'char' and value == '{':
+                depth += 1
+            elif kind == 'char' and value == '}':
+                depth -= 1
+                if depth == 0:
+                    self.pos += 1
+                    return self.tokens[start:self.pos - 1]
+            self.pos += 1
+        return self.tokens[start:]
+
+    def _optional_argument(self) -> Optional[List[Tuple[str, str]]]:
+        if self._peek() != ('char', '['):
+            return None
+        self.pos += 1
+        start = self.pos
+        while self.pos < len(self.tokens) and self.tokens[self.pos] != ('char', ']'):
+            self.pos += 1
+        argument = self.tokens[start:self.pos]
+        self.pos += 1
+        return argument
+
+    def _group_html(self) -> str:
+        return self._nested(self._raw_group())
+
+    def _nested(self, tokens: List[Tuple[str, str]]) -> str:
+        return _LatexToHTML(tokens, self.depth + 1).render()
+
+    @staticmethod
+    def _raw_text(tokens: List[Tuple[str, str]]) -> str:
+        parts = []
+        for kind, value in tokens:
+            if kind == 'cmd':
+                parts.append(_MATH_SPACES.get(value, _MATH_SYMBOLS.get(value, value if len(value) == 1 else '')))
+            elif value not in '{}':
+                parts.append(value)
+        return ''.join(parts)
+
+    # -- rendering -------------------------------------------------------
+
+    def render(self) -> str:
+        out = []
+        while self._peek() is not None:
+            out.append(self._atom(with_scripts=True))
+        return ''.join(out)
+
+    def _atom(self, with_scripts: bool = False) -> str:
+        token = self._peek()
+        if token is None:
+            return ''
+        kind, value = token
+        self.pos += 1
+
+        if kind == 'char' and value == '{':
+            self.pos -= 1
+            base = self._group_html()
+        elif kind == 'char' and value in '^_':
+            # A script with no base (e.g. "^2" at the start) attaches to nothing.
+            base = ''
+            self.pos -= 1
+        elif kind == 'char' and value == '}':
+            base = ''
+        elif kind == 'cmd':
+            base = self._command(value)
+        else:
+            base = self._char(value)
+
+        if not with_scripts:
+            return base
+        sup = sub = None
+        while True:
+            token = self._peek()
+            if token == ('char', '^') and sup is None:
+                self.pos += 1
+                sup = self._atom()
+            elif token == ('char', '_') and sub is None:
+                self.pos += 1
+                sub = self._atom()
+            elif token == ('char', "'"):
+                self.pos += 1
+                base += '′'
+            else:
+                break
+        if sub is not None:
+            base += f'<sub>{sub}</sub>'
+        if sup is not None:
+            base += f'<sup>{sup}</sup>'
+        return base
+
+    @staticmethod
+    def _char(ch: str) -> str:
+        if ch.isalpha():
+            return f'<i>{html.escape(ch)}</i>'
+        if ch == '-':
+            ch = '−'
+        if ch in _MATH_OPERATORS:
+            return f'<span class="mo">{html.escape(ch)}</span>'
+        if ch == '~':
+            return '\u00a0'
+        return html.escape(ch)
+
+    def _command(self, name: str) -> str:
+        if name in _MATH_SPACES:
+            return _MATH_SPACES[name]
+        if name in _MATH_SYMBOLS:
+            symbol = _MATH_SYMBOLS[name]
+            if symbol in _MATH_OPERATORS:
+                return f'<span class="mo">{symbol}</span>'
+            return f'<span class="ms">{html.escape(symbol)}</span>'
+        if name in '{}$%&#_|':
+            return html.escape(name if name != '|' else '‖')
+        if name == '\\':
+            return '<br>'
+        if name in _MATH_IGNORED:
+            return ''
+        if name in _MATH_FUNCTIONS:
+            return f'<span class="mop">{name}</span>'
+        if name in _MATH_FRACTIONS or name == 'binom':
+            numerator = self._group_html()
+            denominator = self._group_html()
+            den_class = 'den plain' if name == 'binom' else 'den'
+            fraction = (f'<span class="frac"><span class="num">{numerator}</span>'
+                        f'<span class="{den_class}">{denominator}</span></span>')
+            return f'({fraction})' if name == 'binom' else fraction
+        if name == 'sqrt':
+            index = self._optional_argument()
+            radicand = self._group_html()
+            root = f'<sup class="root-index">{self._nested(index)}</sup>' if index else ''
+            return f'<span class="sqrt">{root}√<span class="radicand">{radicand}</span></span>'
+        if name in _MATH_ACCENTS:
+            inner = self._raw_group()
+            if len(inner) == 1 and inner[0][0] == 'char':
+                return f'<i>{html.escape(inner[0][1])}{_MATH_ACCENTS[name]}</i>'
+            return f'<span class="overline">{self._nested(inner)}</span>'
+        if name in {'overline', 'underline'}:
+            return f'<span class="{name}">{self._group_html()}</span>'
+        if name in _MATH_TEXT_COMMANDS:
+            text = html.escape(self._raw_text(self._raw_group()))
+            css = {'textit': 'mtext mit', 'textbf': 'mtext mbf', 'operatorname': 'mop'}.get(name, 'mtext')
+            return f'<span class="{css}">{text}</span>'
+        if name in _MATH_STYLE_COMMANDS:
+            return f'<span class="{_MATH_STYLE_COMMANDS[name]}">{self._group_html()}</span>'
+        if name == 'mathbb':
+            letters = _letter_map(self._raw_text(self._raw_group()), _DOUBLE_STRUCK, 0x1D538, 0x1D552)
+            return f'<span class="ms">{letters}</span>'
+        if name == 'mathcal':
+            letters = _letter_map(self._raw_text(self._raw_group()), _CALLIGRAPHIC, 0x1D49C, 0)
+            return f'<span class="ms">{letters}</span>'
+        if name == 'begin':
+            return self._environment(self._raw_text(self._raw_group()))
+        if name == 'end':
+            self._raw_group()
+            return ''
+        # Unknown command: show it verbatim rather than dropping content.
+        return f'<span class="merror">\\{html.escape(name)}</span>'
+
+    def _environment(self, env: str) -> str:
+        start, depth = self.pos, 1
+        while self.pos < len(self.tokens):
+            if self.tokens[self.pos] == ('cmd', 'begin'):
+                depth += 1
+            elif self.tokens[self.pos] == ('cmd', 'end'):
+                depth -= 1
+                if depth == 0:
+                    break
+            self.pos += 1
+        body = self.tokens[start:self.pos]
+        if self.pos < len(self.tokens):
+            self.pos += 1
+            self._raw_group()
+
+        rows: List[List[List[Tuple[str, str]]]] = [[[]]]
+        brace_depth = 0
+        for token in body:
+            if token == ('char', '{'):
+                brace_depth += 1
+            elif token == ('char', '}'):
+                brace_depth -= 1
+            if brace_depth == 0 and token == ('cmd', '\\'):
+                rows.append([[]])
+            elif brace_depth == 0 and token == ('char', '&'):
+                rows[-1].append([])
+            else:
+                rows[-1][-1].append(token)
+        if rows and all(not cell or all(kind == 'space' for kind, _ in cell) for cell in rows[-1]):
+            rows.pop()
+
+        env_name = env.rstrip('*')
+        aligned = env_name in {'align', 'aligned', 'alignat', 'eqnarray', 'split', 'gathered', 'gather'}
+        table = ['<span class="mtable">']
+        for row in rows:
+            table.append('<span class="mtr">')
+            for index, cell in enumerate(row):
+                align = ('right' if index % 2 == 0 else 'left') if aligned else ('left' if env_name == 'cases' else 'center')
+                table.append(f'<span class="mtd {align}">{self._nested(cell)}</span>')
+            table.append('</span>')
+        table.append('</span>')
+        opening, closing = _ENVIRONMENT_FENCES.get(env_name, ('', ''))
+        fence = '<span class="fence">{}</span>'
+        return (fence.format(html.escape(opening)) if opening else '') + ''.join(table) + (
+            fence.format(html.escape(closing)) if closing else '')
+
+
+def render_latex_html(latex: str, display: bool = False) -> str:
+    """
+    Render a LaTeX math expression to HTML that WeasyPrint can lay out.
+
+    The markup relies on ``MATH_CSS`` for fractions, roots and matrices.
+    Unsupported commands are kept verbatim (class ``merror``) instead of
+    being dropped, and so is an expression nested too deeply to render.
+    """
+    try:
+        body = _LatexToHTML.from_latex(latex).render()
+    except _TooDeep:
+        body = f'<span class="merror">{html.escape(latex)}</span>'
+    mode = 'display' if display else 'inline'
+    return f'<span class="math math-{mode}">{body}</span>'
+
+
+# ---------------------------------------------------------------------------
+# Plain-text (Unicode) fallback
+# ---------------------------------------------------------------------------
+
+_SUPERSCRIPTS = dict(zip(
+    '0123456789+-−=()abcdefghijklmnoprstuvwxyzTni′*',
+    '⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻⁻⁼⁽⁾ᵃᵇᶜᵈᵉᶠᵍʰⁱʲᵏˡᵐⁿᵒᵖʳˢᵗᵘᵛʷˣʸᶻᵀⁿⁱ′*',
+))
+_SUBSCRIPTS = dict(zip('0123456789+-−=()aehijklmnoprstuvx', '₀₁₂₃₄₅₆₇₈₉₊₋₋₌₍₎ₐₑₕᵢⱼₖₗₘₙₒₚᵣₛₜᵤᵥₓ'))
+# Already-raised characters stay raised inside nested scripts (e^{-x^2}).
+_SUPERSCRIPTS.update({char: char for char in list(_SUPERSCRIPTS.values())})
+_SUBSCRIPTS.update({char: char for char in list(_SUBSCRIPTS.values())})
+_ROOT_SIGNS = {'': '√', '2': '√', '3': '∛', '4': '∜'}
+
+# Plain runs are consumed whole; only the characters below change state.
+_UNICODE_PLAIN = re.compile(r"[^\\{}^_]+")
+# ``\\name`` takes every following letter, so the lookup is always on the
+# longest possible command name.
+_UNICODE_COMMAND = re.compile(r"\\([A-Za-z]+|.?)", re.DOTALL)
+_UNICODE_CACHE_SIZE = 4096
+
+
+class _LatexToUnicode:
+    """Single-pass translator from a LaTeX math string to plain Unicode text."""
+
+    def __init__(self, latex: str, depth: int = 0) -> None:
+        self.text = latex
+        self.pos = 0
+        self.depth = depth
+
+    def render(self, closing: bool = False) -> str:
+        text, parts = self.text, []
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if ch == '{':
+                self.pos += 1
+                parts.append(self._group())
+            elif ch == '}':
+                self.pos += 1
+                if closing:
+                    break
+            elif ch in '^_':
+                self.pos += 1
+                parts.append(self._script(ch, self._argument()))
+            elif ch == '\\':
+                parts.append(self._command())
+            else:
+                match = _UNICODE_PLAIN.match(text, self.pos)
+                parts.append(match.group())
+                self.pos = match.end()
+        return ''.join(parts)
+
+    def _argument(self) -> str:
+        """Translate one macro argument: a ``{...}`` group or a single token."""
+        text = self.text
+        while self.pos < len(text) and text[self.pos].isspace():
+            self.pos += 1
+        if self.pos >= len(text):
+            return ''
+        ch = text[self.pos]
+        if ch == '{':
+            self.pos += 1
+            return self._group()
+        if ch == '\\':
+            # A command argument can take arguments of its own (``\bar\bar x``).
+            self._descend()
+            try:
+                return self._command()
+            finally:
+                self.depth -= 1
+        self.pos += 1
+        return ch
+
+    def _group(self) -> str:
+        """Translate a ``{...}`` group whose opening brace was just consumed."""
+        self._descend()
+        try:
+            return self.render(closing=True)
+        finally:
+            self.depth -= 1
+
+    def _descend(self) -> None:
+        self.depth += 1
+        if self.depth > _MAX_NESTING:
+            raise _TooDeep()
+
+    def _optional_argument(self) -> str:
+        if not self.text.startswith('[', self.pos):
+            return ''
+        end = self.text.find(']', self.pos)
+        if end < 0:
+            return ''
+        argument = _LatexToUnicode(self.text[self.pos + 1:end], self.depth + 1).render()
+        self.pos = end + 1
+        return argument
+
+    @staticmethod
+    def _script(mark: str, body: str) -> str:
+        table = _SUPERSCRIPTS if mark == '^' else _SUBSCRIPTS
+        if body and all(ch in table for ch in body):
+            return ''.join(table[ch] for ch in body)
+        return mark + _wrap(body)
+
+    def _command(self) -> str:
+        match = _UNICODE_COMMAND.match(self.text, self.pos)
+        self.pos = match.end()
+        name = match.group(1)
+        if name in _MATH_SYMBOLS:
+            return _MATH_SYMBOLS[name]
+        if name in _MATH_SPACES:
+            return _MATH_SPACES[name]
+        if name in _MATH_FUNCTIONS:
+            return name
+        if name in _MATH_IGNORED:
+            return ''
+        if len(name) == 1 and name in '{}$%&#_|':
+            return name if name != '|' else '‖'
+        if name == '\\':
+            return '; '
+        if name in _MATH_TEXT_COMMANDS or name in _MATH_STYLE_COMMANDS or name in {'overline', 'underline'}:
+            return self._argument()
+        if name in _MATH_FRACTIONS:
+            numerator = self._argument()
+            return f'{_wrap(numerator)}/{_wrap(self._argument())}'
+        if name == 'binom':
+            top = self._argument()
+            return f'C({top}, {self._argument()})'
+        if name == 'sqrt':
+            index = self._optional_argument()
+            radicand = self._argument()
+            if index in _ROOT_SIGNS:
+                return _ROOT_SIGNS[index] + _wrap(radicand)
+            return self._script('^', index) + '√' + _wrap(radicand)
+        if name in _MATH_ACCENTS:
+            inner = self._argument()
+            return inner + _MATH_ACCENTS[name] if len(inner) == 1 else f'{inner}\u0305'
+        if name == 'mathbb':
+            return _letter_map(self._argument(), _DOUBLE_STRUCK, 0x1D538, 0x1D552)
+        if name == 'mathcal':
+            return _letter_map(self._argument(), _CALLIGRAPHIC, 0x1D49C, 0)
+        if name in {'begin', 'end'}:
+            self._argument()
+            return ''
+        # Unknown command: keep it verbatim rather than dropping content.
+        return '\\' + name
+
+
+def _wrap(text: str) -> str:
+    """Parenthesize ``text`` unless it already reads as a single term."""
+    return text if len(text) <= 1 or text.isalnum() else f'({text})'
+
+
+@functools.lru_cache(maxsize=_UNICODE_CACHE_SIZE)
+def _latex_to_unicode_cached(latex: str) -> str:
+    try:
+        return _LatexToUnicode(latex).render()
+    except _TooDeep:
+        return latex
+
+
+MATH_CSS = """
+.math { font-family: "Latin Modern Math", "STIX Two Math", "Cambria Math", "Times New Roman", serif;
+        font-style: normal; white-space: nowrap; }
+.math-display { display: block; text-align: center; margin: 0.8em 0; }
+.math i { font-style: italic; }
+.math .mo { padding: 0 0.2em; }
+.math .mop, .math .mtext, .math .mrm { font-style: normal; }
+.math .mop { padding-right: 0.15em; }
+.math .mbf { font-weight: bold; font-style: normal; }
+.math .mbf i { font-style: normal; }
+.math .mit { font-style: italic; }
+.math .msf { font-family: sans-serif; }
+.math .mtt { font-family: monospace; }
+.math sup, .math sub { font-size: 72%; line-height: 0; }
+.math .frac { display: inline-block; vertical-align: middle; text-align: center; margin: 0 0.1em; }
+.math .frac > .num, .math .frac > .den { display: block; padding: 0 0.15em; }
+.math .frac > .den { border-top: 0.06em solid currentColor; }
+.math .frac > .den.plain { border-top: none; }
+.math .sqrt > .radicand { border-top: 0.06em solid currentColor; padding: 0 0.1em; }
+.math .root-index { font-size: 60%; }
+.math .overline { border-top: 0.06em solid currentColor; }
+.math .underline { border-bottom: 0.06em solid currentColor; }
+.math .mtable { display: inline-table; vertical-align: middle; }
+.math .mtr { display: table-row; }
+.math .mtd { display: table-cell; padding: 0.15em 0.4em; }
+.math .mtd.left { text-align: left; }
+.math .mtd.right { text-align: right; }
+.math .mtd.center { text-align: center; }
+.math .fence { font-size: 180%; vertical-align: middle; font-weight: 300; }
+.math .merror { color: #b00020; font-family: monospace; font-style: normal; }
+"""
+
+
+def _default_math_cache_path() -> Optional[Path]:
+    configured = os.environ.get("PYMARK_MATH_CACHE")
+    if configured is not None:
+        return Path(configured) if configured else None
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "pymark" / "math-cache.sqlite3"
+
+
+DEFAULT_MEMORY_ENTRIES = 10_000
+
+
+class MathCache:
+    """
+    Persistent memo of rendered math keyed by (latex, display mode).
+
+    A bounded in-memory LRU (``max_entries`` expressions) fronts an optional
+    SQLite file, so expressions rendered by any earlier export, in any process
+    sharing the file, are never rendered again. If the file cannot be opened
+    the cache degrades to memory only.
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_entries: int = DEFAULT_MEMORY_ENTRIES) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[Tuple[str, bool], str]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.rendered = 0
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=5)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS math "
+                    "(latex TEXT, display INTEGER, version TEXT, html TEXT, "
+                    "PRIMARY KEY (latex, display, version))"
+                )
+                self._db.commit()
+            except (OSError, sqlite3.Error):
+                self._db = None
+
+    def render_many(self, expressions: Iterable[Tuple[str, bool]]) -> Dict[Tuple[str, bool], str]:
+        """Return HTML for every expression, rendering only the uncached ones."""
+        wanted = set(expressions)
+        with self._lock:
+            result = {}
+            for key in wanted:
+                markup = self._memory.get(key)
+                if markup is not None:
+                    self._memory.move_to_end(key)
+                    result[key] = markup
+            missing = [key for key in wanted if key not in result]
+            if missing and self._db is not None:
+                loaded = self._load(missing)
+                result.update(loaded)
+                self._remember(loaded)
+                missing = [key for key in missing if key not in result]
+            self.hits += len(wanted) - len(missing)
+
+        if not missing:
+            return result
+        fresh = {key: render_latex_html(key[0], key[1]) for key in missing}
+        with self._lock:
+            self.rendered += len(fresh)
+            self._remember(fresh)
+            if self._db is not None:
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO math VALUES (?, ?, ?, ?)",
+                        [(latex, int(display), MATH_RENDERER_VERSION, markup)
+                         for (latex, display), markup in fresh.items()],
+                    )
+                    self._db.commit()
+                except sqlite3.Error:
+                    pass
+        result.update(fresh)
+        return result
+
+    def _remember(self, entries: Dict[Tuple[str, bool], str]) -> None:
+        self._memory.update(entries)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self, keys: List[Tuple[str, bool]]) -> Dict[Tuple[str, bool], str]:
+        found = {}
+        try:
+            for latex, display in keys:
+                row = self._db.execute(
+                    "SELECT html FROM math WHERE latex = ? AND display = ? AND version = ?",
+                    (latex, int(display), MATH_RENDERER_VERSION),
+                ).fetchone()
+                if row is not None:
+                    found[(latex, display)] = row[0]
+        except sqlite3.Error:
+            pass
+        return found
+
+
+_default_math_cache: Optional[MathCache] = None
+_default_math_cache_lock = threading.Lock()
+
+
+def default_math_cache() -> MathCache:
+    """Return the process-wide math cache (see ``PYMARK_MATH_CACHE``)."""
+    global _default_math_cache
+    with _default_math_cache_lock:
+        if _default_math_cache is None:
+            _default_math_cache = MathCache(_default_math_cache_path())
+        return _default_math_cache
+
+
+_MATH_PLACEHOLDER = re.compile(r"PYMARKMATH([0-9a-f]+)N(\d+)Z")
+
+
+class MathFragments(NamedTuple):
+    """Rendered math from ``prerender_math``, for ``restore_math``."""
+
+    nonce: str  # Marks this call's placeholders; document text cannot guess it.
+    html: List[str]
+
+
+def prerender_math(markdown_text: str, cache: Optional[MathCache] = None) -> Tuple[str, Optional[MathFragments]]:
+    """
+    Replace every math expression with a placeholder and render it to HTML.
+
+    Returns the protected Markdown (safe to run through the Markdown
+    converter, which would otherwise mangle ``_`` and ``*``) and the rendered
+    fragments to pass to ``restore_math`` afterwards (``None`` without math).
+    """
+    spans = list(iter_math_spans(markdown_text))
+    if not spans:
+        return markdown_text, None
+    keys = [
+        (markdown_text[span.content_start:span.content_end].strip(), span.kind == "display")
+        for span in spans
+    ]
+    rendered = (cache or default_math_cache()).render_many(keys)
+
+    nonce = secrets.token_hex(8)
+    parts = []
+    pos = 0
+    for index, span in enumerate(spans):
+        parts.append(markdown_text[pos:span.start])
+        parts.append(f"PYMARKMATH{nonce}N{index}Z")
+        pos = span.end
+    parts.append(markdown_text[pos:])
+    return "".join(parts), MathFragments(nonce, [rendered[key] for key in keys])
+
+
+def restore_math(html_text: str, fragments: Optional[MathFragments]) -> str:
+    """Swap the placeholders left by ``prerender_math`` for rendered math.
+
+    Text that only looks like a placeholder is left alone.
+    """
+    if not fragments:
+        return html_text
+
+    def replace(match: "re.Match[str]") -> str:
+        index = int(match.group(2))
+        if match.group(1) != fragments.nonce or index >= len(fragments.html):
+            return match.group(0)
+        return fragments.html[index]
+
+    return _MATH_PLACEHOLDER.sub(replace, html_text)
+
+
 if __name__ == "__main__":
     # Test the utilities
     sample = """
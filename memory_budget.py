@@ -0,0 +1,252 @@
+"""
+Per-request memory ceilings for the web server.
+
+A render holds the request body, the Markdown, the HTML built from it and
+WeasyPrint's box tree at the same time, so one oversized post can push a
+container past its memory limit. With a budget (``--memory-budget-mb`` or
+``PYMARK_MEMORY_BUDGET_MB``):
+
+* every export is first priced by ``estimate_render_bytes`` (input size,
+  images, tables) and refused with ``413`` if it cannot fit, before its
+  body is parsed when the ``Content-Length`` already says it is too big;
+* renders run on pool workers under an address-space limit of the same
+  size, so one that outgrows it fails with ``MemoryError`` in the worker
+  (which is then replaced) instead of pulling in the OOM killer, and is
+  answered with ``413``. Workers report their exact per-render peak.
+
+Renders are never interrupted in the server process itself: an exception
+injected into a thread can land anywhere, including in the middle of shared
+WeasyPrint or font state, or hit a thread that is only waiting for the
+layout lock. ``MemoryGuard.track`` therefore only observes: a sampler thread
+reads the resident set size while such renders run and records their peak
+growth. Those peaks are growth of the whole process, so renders that
+overlap share the blame.
+
+Peaks are observed into the ``pymark_render_peak_bytes`` histogram, counted
+in ``stats()`` and logged on the ``pymark.memory`` logger.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import metrics
+from render_pool import current_rss
+
+DEFAULT_SAMPLE_INTERVAL = 0.01
+# Cost model for a WeasyPrint render, from measurements on typical notes:
+# resident memory per byte of Markdown (HTML, tree and boxes), per image
+# (decoded at up to page size) and per table (cells are laid out twice).
+BASE_BYTES = 16 * 1024 * 1024
+BYTES_PER_INPUT_BYTE = 60
+BYTES_PER_IMAGE = 8 * 1024 * 1024
+BYTES_PER_TABLE = 512 * 1024
+# A JSON body is at most about twice the Markdown it carries (escaping).
+JSON_OVERHEAD = 2
+
+_IMAGE = re.compile(r"!\[[^\]\n]*\]\(|<img\b", re.IGNORECASE)
+_TABLE_RULE = re.compile(r"^ {0,3}\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)+\|?[ \t]*$|<table\b", re.MULTILINE)
+
+PEAK_BYTES = metrics.REGISTRY.register(metrics.Histogram(
+    "pymark_render_peak_bytes", "Peak memory growth of each render.", buckets=metrics.SIZE_BUCKETS
+))
+logger = logging.getLogger("pymark.memory")
+
+
+class MemoryBudgetExceeded(Exception):
+    """A render was refused or aborted because it needs more memory than its budget."""
+
+
+def budget_from_env() -> Optional[int]:
+    """``PYMARK_MEMORY_BUDGET_MB`` in bytes, or ``None`` when unset."""
+    value = os.environ.get("PYMARK_MEMORY_BUDGET_MB")
+    return int(float(value) * 1024 * 1024) if value else None
+
+
+def estimate_render_bytes(markdown_text: str) -> int:
+    """Rough peak memory of rendering ``markdown_text`` to PDF."""
+    images = len(_IMAGE.findall(markdown_text))
+    tables = len(_TABLE_RULE.findall(markdown_text))
+    return (
+        BASE_BYTES
+        + len(markdown_text) * BYTES_PER_INPUT_BYTE
+        + images * BYTES_PER_IMAGE
+        + tables * BYTES_PER_TABLE
+    )
+
+
+def max_body_bytes(budget: int) -> int:
+    """Largest request body worth parsing under ``budget``."""
+    return max(0, budget - BASE_BYTES) // BYTES_PER_INPUT_BYTE * JSON_OVERHEAD
+
+
+def _mib(value: int) -> str:
+    return f"{value / (1024 * 1024):.1f} MiB"
+
+
+class _Render:
+    def __init__(self, label: str, baseline: int) -> None:
+        self.label = label
+        self.baseline = baseline
+        self.peak = 0  # Growth over the baseline.
+
+
+class MemoryGuard:
+    """Check renders against a memory budget and record their peaks.
+
+    The budget itself is enforced by the render pool (see the module
+    docstring); the guard refuses inputs that cannot fit and accounts peaks.
+
+    Args:
+        budget: Bytes a single render may use.
+        interval: Seconds between resident-memory samples while renders run.
+    """
+
+    def __init__(self, budget: int, interval: float = DEFAULT_SAMPLE_INTERVAL) -> None:
+        self.budget = budget
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active: Dict[int, _Render] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._max_peak = 0
+        self._counters = {"renders": 0, "rejected": 0, "aborted": 0}
+
+    def check(self, markdown_text: str) -> int:
+        """Raise ``MemoryBudgetExceeded`` unless a render of this input fits; return the estimate."""
+        estimate = estimate_render_bytes(markdown_text)
+        if estimate > self.budget:
+            self._count("rejected")
+            raise MemoryBudgetExceeded(
+                f"document needs about {_mib(estimate)} to render, over the {_mib(self.budget)} memory budget"
+            )
+        return estimate
+
+    def check_body(self, body_bytes: Optional[int]) -> None:
+        """Refuse a request body too large to be worth parsing."""
+        if body_bytes is not None and body_bytes > max_body_bytes(self.budget):
+            self._count("rejected")
+            raise MemoryBudgetExceeded(f"request body of {_mib(body_bytes)} exceeds the memory budget")
+
+    @contextmanager
+    def track(self, label: str) -> Iterator[None]:
+        """Record the peak memory growth of the enclosed in-process render."""
+        ident = threading.get_ident()
+        render = _Render(label, current_rss())
+        with self._lock:
+            self._active[ident] = render
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pymark-memory", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active.pop(ident, None)
+            render.peak = max(render.peak, current_rss() - render.baseline)
+            self.record(render.peak, label)
+
+    def record(self, peak: int, label: str, aborted: bool = False) -> None:
+        """Account one render's peak growth (also used for pool renders).
+
+        An ``aborted`` render was stopped at the budget; its ``peak`` is not
+        known and is ignored.
+        """
+        with self._lock:
+            self._counters["renders"] += 1
+            if aborted:
+                self._counters["aborted"] += 1
+            else:
+                self._max_peak = max(self._max_peak, peak)
+        if aborted:
+            logger.warning("%s: stopped at the %s budget", label, _mib(self.budget))
+            return
+        if metrics.enabled():
+            PEAK_BYTES.observe(peak)
+        logger.info("%s: peak %s (budget %s)", label, _mib(peak), _mib(self.budget))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["budget_bytes"] = self.budget
+            stats["max_peak_bytes"] = self._max_peak
+            stats["active"] = len(self._active)
+        return stats
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                idle = not self._active
+                if idle:
+                    self._wake.clear()
+            if idle:
+                self._wake.wait()
+                continue
+            rss = current_rss()
+            with self._lock:
+                for render in self._active.values():
+                    render.peak = max(render.peak, rss - render.baseline)
+            time.sleep(self.interval)
+
+
+# -- render workers ---------------------------------------------------
+
+
+def reset_peak_rss() -> bool:
+    """Reset this process's peak RSS (Linux); ``False`` where unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> int:
+    """Peak RSS of this process since start or the last ``reset_peak_rss``."""
+    try:
+        with open("/proc/self/status", "rb") as fh:
+            for line in fh:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _address_space() -> int:
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            return int(fh.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+@contextmanager
+def address_space_limit(budget: Optional[int]) -> Iterator[None]:
+    """Let the enclosed code map at most ``budget`` more bytes (``MemoryError`` past it)."""
+    if not budget or not hasattr(resource, "RLIMIT_AS"):
+        yield
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = _address_space() + budget
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
@@ -0,0 +1,353 @@
+"""
+Hot-path timing and Prometheus metrics.
+
+Code on the render path wraps its work in ``stage("name")``. Each stage's
+duration is added to a process-wide histogram and, during a web request,
+to that request's timings, which the server returns in a ``Server-Timing``
+header so a slow export shows where its time went (Markdown, math, CSS,
+layout, PDF write, remote fetch).
+
+``REGISTRY.render()`` produces the Prometheus text exposition format for
+``/metrics``. The metric types are deliberately small: a stage costs two
+``perf_counter`` calls and one locked bucket update.
+
+``SlowRequestProfiler`` is an optional sampling profiler: while a request
+runs, a background thread samples its stack every few milliseconds, and
+requests that end up slower than a threshold have their samples written
+out as collapsed stacks (the input format of flamegraph tools).
+"""
+from __future__ import annotations
+
+import bisect
+import contextvars
+import functools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as _StackCounter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(float(1024 * 4 ** power) for power in range(9))  # 1 KiB .. 64 MiB
+PAGE_BUCKETS = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0)
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+_F = TypeVar("_F", bound=Callable[..., Any])
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{self._labels(key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (last is +Inf), sum].
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """A set of metrics rendered together for ``/metrics``."""
+
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "pymark_stage_seconds", "Time spent in each rendering stage.", ["stage"]
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "pymark_request_seconds", "HTTP request latency by route.", ["method", "route", "status"]
+))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "pymark_requests_in_flight", "HTTP requests currently being handled.", ["route"]
+))
+DOCUMENT_BYTES = REGISTRY.register(Histogram(
+    "pymark_document_bytes", "Size of Markdown inputs and PDF outputs.", ["kind"], buckets=SIZE_BUCKETS
+))
+PDF_PAGES = REGISTRY.register(Histogram(
+    "pymark_pdf_pages", "Pages per rendered PDF.", buckets=PAGE_BUCKETS
+))
+SLOW_PROFILES = REGISTRY.register(Counter(
+    "pymark_slow_request_profiles_total", "Slow requests whose profile was written."
+))
+
+_enabled = os.environ.get("PYMARK_METRICS", "1").lower() not in ("0", "false", "no", "off")
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(value: bool) -> None:
+    """Turn stage timing on or off process-wide."""
+    global _enabled
+    _enabled = value
+
+
+# -- per-request timings ----------------------------------------------
+
+
+class RequestTimings:
+    """Stage durations of one request, for its ``Server-Timing`` header."""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._token: Optional[contextvars.Token] = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: "contextvars.ContextVar[Optional[RequestTimings]]" = contextvars.ContextVar("pymark_timings", default=None)
+
+
+def start_request() -> RequestTimings:
+    """Collect the stages that run in this context into a new ``RequestTimings``."""
+    timings = RequestTimings()
+    timings._token = _current.set(timings)
+    return timings
+
+
+def finish_request(timings: RequestTimings) -> float:
+    """Stop collecting into ``timings``; return the request's duration."""
+    if timings._token is not None:
+        _current.reset(timings._token)
+        timings._token = None
+    return timings.elapsed()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as rendering stage ``name``."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=name)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(name, seconds)
+
+
+def timed(name: str) -> Callable[[_F], _F]:
+    """Decorator form of ``stage``."""
+
+    def decorate(fn: _F) -> _F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage(name):
+                return fn(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def render_stats(name: str, help_text: str, stats: Dict[str, Any]) -> str:
+    """Expose the numeric entries of a component's ``stats()`` as one gauge."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for key, value in sorted(stats.items()):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f'{name}{{stat="{_escape(key)}"}} {_format_value(value)}')
+    return "\n".join(lines) + "\n"
+
+
+def observe_document(kind: str, size: int) -> None:
+    if _enabled:
+        DOCUMENT_BYTES.observe(size, kind=kind)
+
+
+def observe_pages(pages: int) -> None:
+    if _enabled:
+        PDF_PAGES.observe(pages)
+
+
+# -- sampling profiler ------------------------------------------------
+
+
+class SlowRequestProfiler:
+    """Sample the stacks of in-flight requests; keep those of slow ones.
+
+    Args:
+        threshold: Requests taking at least this many seconds are written out.
+        directory: Where ``<time>-<route>.folded`` files go.
+        interval: Seconds between samples.
+
+    The sampler thread only runs while requests are in flight, and samples
+    with ``sys._current_frames()``, so handlers are never interrupted.
+    """
+
+    def __init__(self, threshold: float, directory: Path, interval: float = DEFAULT_SAMPLE_INTERVAL) -> None:
+        self.threshold = threshold
+        self.directory = Path(directory)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active: Dict[int, _StackCounter] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Begin sampling the calling thread."""
+        with self._lock:
+            self._active[threading.get_ident()] = _StackCounter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pymark-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self, seconds: float, label: str) -> Optional[Path]:
+        """Stop sampling the calling thread; write its profile if it was slow."""
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if samples is None or seconds < self.threshold or not samples:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_") or "request"
+        path = self.directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{int(seconds * 1000)}ms-{name}.folded"
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in samples.most_common()), encoding="utf-8")
+        SLOW_PROFILES.inc()
+        return path
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                idle = not self._active
+                if idle:
+                    # Cleared under the lock, so a start() after the check
+                    # still wakes us.
+                    self._wake.clear()
+            if idle:
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None and ident != own:
+                        samples[_collapse(frame)] += 1
+            time.sleep(self.interval)
+
+
+def _collapse(frame: Any) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
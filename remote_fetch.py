@@ -0,0 +1,205 @@
+"""
+Shared HTTP client for importing remote Markdown.
+
+One ``requests.Session`` with pooled keep-alive connections serves every
+``/fetch-url`` call. Responses are requested compressed (gzip, deflate and,
+when a Brotli decoder is installed, br) and kept in a small HTTP cache:
+fresh entries are served without touching the network, stale ones are
+revalidated with ``If-None-Match``/``If-Modified-Since`` so an unchanged
+document costs a 304 instead of a download. The size limit applies to the
+decompressed body, so a small compressed payload cannot expand past it.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+DEFAULT_TTL = 300.0
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+DEFAULT_POOL_CONNECTIONS = 16
+DEFAULT_POOL_MAXSIZE = 32
+_CHUNK = 16 * 1024
+_MAX_AGE = re.compile(r"(?:^|,)\s*max-age\s*=\s*(\d+)", re.IGNORECASE)
+_NOT_SHARED = re.compile(r"(?:^|,)\s*(?:no-store|private)\b", re.IGNORECASE)
+
+
+class FetchTooLarge(ValueError):
+    """The decompressed response body exceeded the size limit."""
+
+
+@dataclass
+class _Entry:
+    body: bytes
+    encoding: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires: float
+
+
+def _varies(vary: str) -> bool:
+    """Whether a ``Vary`` header names request headers besides ``Accept-Encoding``."""
+    return any(name.strip() and name.strip().lower() != "accept-encoding" for name in vary.split(","))
+
+
+class RemoteFetcher:
+    """Fetch URLs through a pooled session and a revalidating cache.
+
+    Args:
+        max_fetch_bytes: Largest decompressed body accepted.
+        ttl: Seconds a response is fresh when the server sends no
+            ``Cache-Control: max-age``.
+        max_cache_bytes: Budget for cached bodies; least recently used
+            entries are evicted first.
+        pool_connections: Number of hosts with pooled connections.
+        pool_maxsize: Keep-alive connections kept per host.
+    """
+
+    def __init__(
+        self,
+        max_fetch_bytes: int,
+        ttl: float = DEFAULT_TTL,
+        max_cache_bytes: int = DEFAULT_CACHE_BYTES,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+    ) -> None:
+        self.max_fetch_bytes = max_fetch_bytes
+        self.ttl = ttl
+        self.max_cache_bytes = max_cache_bytes
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # urllib3 lists br (and zstd) only when it can decode them.
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._size = 0
+        self._counters = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+
+    def fetch(self, url: str, timeout: float) -> Tuple[bytes, Optional[str]]:
+        """Return ``(body, encoding)`` for ``url``, from cache when possible."""
+        entry, fresh = self.lookup(url)
+        if fresh:
+            return entry.body, entry.encoding
+
+        with self.session.get(url, headers=self.validators(entry), stream=True, timeout=timeout) as resp:
+            if resp.status_code == 304 and entry is not None:
+                return self.revalidated(entry, resp.headers)
+            resp.raise_for_status()
+            body = self._read(resp)
+            encoding = resp.encoding
+            self.remember(url, body, encoding, resp.headers)
+        return body, encoding
+
+    # The cache half of ``fetch``; ``lookup`` also lets the asyncio fetcher
+    # answer fresh hits without a thread.
+
+    def lookup(self, url: str) -> Tuple[Optional[_Entry], bool]:
+        """Return the cached entry for ``url`` (or ``None``) and whether it is fresh."""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(url)
+            fresh = entry.expires > time.monotonic()
+            if fresh:
+                self._counters["hits"] += 1
+        return entry, fresh
+
+    def validators(self, entry: Optional[_Entry]) -> Dict[str, str]:
+        """Conditional request headers revalidating a stale ``entry``."""
+        headers: Dict[str, str] = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def revalidated(self, entry: _Entry, headers: Mapping[str, str]) -> Tuple[bytes, Optional[str]]:
+        """Record a ``304`` for ``entry``; return its body and encoding."""
+        entry.expires = time.monotonic() + self._lifetime(headers)
+        with self._lock:
+            self._counters["revalidated"] += 1
+        return entry.body, entry.encoding
+
+    def remember(self, url: str, body: bytes, encoding: Optional[str], headers: Mapping[str, str]) -> None:
+        """Record a downloaded response, caching it if a shared cache may.
+
+        The cache is shared by every client of the server and keyed by URL
+        alone, so responses marked ``no-store`` or ``private``, and responses
+        that ``Vary`` with the request, are not kept. ``Vary: Accept-Encoding``
+        is the exception: every request sends the same one, and bodies are
+        kept decoded.
+        """
+        with self._lock:
+            self._counters["misses"] += 1
+        if _NOT_SHARED.search(headers.get("Cache-Control", "")) or _varies(headers.get("Vary", "")):
+            self._forget(url)
+            return
+        self._store(url, _Entry(
+            body=body,
+            encoding=encoding,
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+            expires=time.monotonic() + self._lifetime(headers),
+        ))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        return stats
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _read(self, resp: requests.Response) -> bytes:
+        # iter_content yields decoded bytes, so the limit is on what we keep.
+        total = 0
+        chunks = []
+        for chunk in resp.iter_content(chunk_size=_CHUNK):
+            if chunk:
+                total += len(chunk)
+                if total > self.max_fetch_bytes:
+                    raise FetchTooLarge(f"Remote file is too large (limit {self.max_fetch_bytes // 1_000_000} MB)")
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _lifetime(self, headers: Mapping[str, str]) -> float:
+        cache_control = headers.get("Cache-Control", "")
+        if "no-cache" in cache_control.lower():
+            return 0.0
+        match = _MAX_AGE.search(cache_control)
+        return min(float(match.group(1)), self.ttl) if match else self.ttl
+
+    def _forget(self, url: str) -> None:
+        with self._lock:
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self._size -= len(old.body)
+
+    def _store(self, url: str, entry: _Entry) -> None:
+        if len(entry.body) > self.max_cache_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self._size -= len(old.body)
+            self._entries[url] = entry
+            self._size += len(entry.body)
+            while self._size > self.max_cache_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+                self._counters["evictions"] += 1
@@ -0,0 +1,457 @@
+"""
+Content-addressed cache for rendered PDFs.
+
+Entries are keyed by a hash of everything that influences the output
+(markdown, CSS, title and renderer version) and live in two tiers:
+a byte-budgeted in-memory LRU and an optional directory on disk that
+survives restarts and can be shared by several server processes.
+Concurrent requests for the same key are collapsed into a single render.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+# Rendered output larger than this spills from memory to a temporary file.
+DEFAULT_SPOOL_BYTES = 8 * 1024 * 1024
+_COPY_CHUNK = 256 * 1024
+
+
+def render_key(markdown_text: str, css_text: str, title: str, version: str) -> str:
+    """Return a stable hex digest identifying one render."""
+    digest = hashlib.sha256()
+    for part in (version, title, css_text, markdown_text):
+        data = part.encode("utf-8")
+        # Length-prefix each field so ("ab", "c") and ("a", "bc") differ.
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class _Flight:
+    """A render in progress that other threads may wait on."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[bytes] = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class RenderCache:
+    """Two-tier LRU cache of rendered documents with single-flight renders.
+
+    Args:
+        max_bytes: Budget for the in-memory tier.
+        disk_dir: Optional directory for the persistent tier.
+        max_disk_bytes: Optional budget for the disk tier; the least
+            recently used files are pruned when it is exceeded. The sizes
+            and use order of the files are read from the directory once, at
+            startup, and kept up to date in memory. Files another process
+            adds later count once this one reads them.
+        max_item_bytes: Largest entry kept in memory (defaults to a
+            quarter of ``max_bytes``). Bigger entries only go to disk.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MEMORY_BYTES,
+        disk_dir: Optional[Path] = None,
+        max_disk_bytes: Optional[int] = None,
+        max_item_bytes: Optional[int] = None,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes if max_item_bytes is not None else max_bytes // 4
+        self.disk_dir = Path(disk_dir) if disk_dir is not None else None
+        self.max_disk_bytes = max_disk_bytes
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._inflight: Dict[str, _Flight] = {}
+        # Disk files by key with their sizes, least recently used first;
+        # only kept when the disk tier has a budget.
+        self._disk_entries: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_size = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "collapsed": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+            "disk_errors": 0,
+        }
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            if self.max_disk_bytes is not None:
+                self._scan_disk()
+
+    # -- public API -----------------------------------------------------
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached bytes for ``key`` or ``None``."""
+        with self._lock:
+            data = self._memory_get(key)
+            if data is not None:
+                self._counters["memory_hits"] += 1
+                return data
+
+        data = self._disk_get(key)
+        with self._lock:
+            if data is None:
+                self._counters["misses"] += 1
+            else:
+                self._counters["disk_hits"] += 1
+                self._memory_put(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store ``data`` in both tiers."""
+        with self._lock:
+            self._memory_put(key, data)
+        self._disk_put(key, data)
+
+    def get_or_render(self, key: str, render: Callable[[], bytes]) -> bytes:
+        """Return the cached value for ``key``, calling ``render`` on a miss.
+
+        Only one thread renders a given key at a time; others asking for the
+        same key while it is in flight wait for and share its result.
+        """
+        data, flight = self._join(key)
+        if data is not None:
+            return data
+        if flight is None:
+            # Another thread rendered this key; reuse its result if it could
+            # be cached, otherwise render independently.
+            data = self.get(key)
+            return data if data is not None else render()
+
+        try:
+            data = self._disk_get(key)
+            if data is not None:
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                    self._memory_put(key, data)
+            else:
+                with self._lock:
+                    self._counters["misses"] += 1
+                data = render()
+                self.put(key, data)
+            flight.result = data
+            return data
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            self._land(key, flight)
+
+    def open_or_render(
+        self,
+        key: str,
+        render_to: Callable[[BinaryIO], None],
+        spool_bytes: int = DEFAULT_SPOOL_BYTES,
+    ) -> BinaryIO:
+        """Return a readable binary stream for ``key``, rendering on a miss.
+
+        Unlike ``get_or_render`` the output is never materialized as an extra
+        ``bytes`` copy: hits are served from memory without copying or
+        streamed from the disk tier, and misses are rendered by
+        ``render_to(target)`` into a temporary file that spills to disk above
+        ``spool_bytes``. The caller owns (and must close) the returned stream.
+        Threads that ask for ``key`` during the render share its output, even
+        when it is too big for either tier.
+        """
+        stream, flight = self._join_stream(key)
+        if stream is not None:
+            return stream
+        if flight is None:
+            stream = self._open_cached(key)
+            if stream is not None:
+                return stream
+            spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+            render_to(spool)
+            spool.seek(0)
+            return spool
+
+        spool = None
+        try:
+            stream = self._open_disk(key)
+            if stream is not None:
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                return stream
+            with self._lock:
+                self._counters["misses"] += 1
+            spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+            render_to(spool)
+            data = self._store_stream(key, spool, spool.tell())
+            if data is None and not self._on_disk(key) and self._close_flight(key, flight):
+                # Too big to cache and nowhere to reopen it from: hand the
+                # waiting threads the bytes rather than have each render again.
+                spool.seek(0)
+                data = spool.read()
+            if data is not None:
+                # Serve the bytes (shared with any waiters) and free the spool.
+                flight.result = data
+                spool.close()
+                return io.BytesIO(data)
+            spool.seek(0)
+            return spool
+        except BaseException as exc:
+            if spool is not None:
+                spool.close()
+            flight.error = exc
+            raise
+        finally:
+            self._land(key, flight)
+
+    def clear(self) -> None:
+        """Drop the in-memory tier (the disk tier is left untouched)."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and current tier sizes."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+            stats["max_bytes"] = self.max_bytes
+            stats["disk_bytes"] = self._disk_size
+            stats["in_flight"] = len(self._inflight)
+        return stats
+
+    # -- single flight --------------------------------------------------
+
+    def _join(self, key: str) -> Tuple[Optional[bytes], Optional[_Flight]]:
+        """Return ``(data, None)`` on a memory hit, ``(None, flight)`` when the
+        caller must render, or ``(result, None)`` after waiting on another
+        thread's render (``result`` may be ``None`` if it was not cacheable).
+        """
+        with self._lock:
+            data = self._memory_get(key)
+            if data is not None:
+                self._counters["memory_hits"] += 1
+                return data, None
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._inflight[key] = _Flight()
+                return None, flight
+            self._counters["collapsed"] += 1
+            flight.waiters += 1
+
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, None
+
+    def _join_stream(self, key: str) -> Tuple[Optional[BinaryIO], Optional[_Flight]]:
+        data, flight = self._join(key)
+        return (io.BytesIO(data) if data is not None else None), flight
+
+    def _close_flight(self, key: str, flight: _Flight) -> int:
+        """Stop ``flight`` taking new waiters; return how many are waiting."""
+        with self._lock:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+            return flight.waiters
+
+    def _land(self, key: str, flight: _Flight) -> None:
+        with self._lock:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        flight.done.set()
+
+    def _open_cached(self, key: str) -> Optional[BinaryIO]:
+        with self._lock:
+            data = self._memory_get(key)
+            if data is not None:
+                self._counters["memory_hits"] += 1
+                return io.BytesIO(data)
+        stream = self._open_disk(key)
+        if stream is not None:
+            with self._lock:
+                self._counters["disk_hits"] += 1
+        return stream
+
+    def _store_stream(self, key: str, stream: BinaryIO, size: int) -> Optional[bytes]:
+        """Copy a rendered stream into the cache tiers.
+
+        Returns the cached bytes when the entry is small enough for the memory
+        tier; larger entries are copied to disk in chunks and ``None`` is
+        returned so the stream itself can be served.
+        """
+        if size <= self.max_item_bytes:
+            stream.seek(0)
+            data = stream.read()
+            self.put(key, data)
+            return data
+        if self.disk_dir is not None:
+            stream.seek(0)
+            self._disk_write(key, lambda fh: shutil.copyfileobj(stream, fh, _COPY_CHUNK))
+        return None
+
+    # -- memory tier (caller holds the lock) ----------------------------
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def _memory_put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_item_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._counters["evictions"] += 1
+
+    # -- disk tier ------------------------------------------------------
+
+    def _disk_path(self, key: str) -> Path:
+        assert self.disk_dir is not None
+        return self.disk_dir / key[:2] / f"{key}.pdf"
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            self._disk_forget(key)
+            return None
+        except OSError:
+            with self._lock:
+                self._counters["disk_errors"] += 1
+            return None
+        try:
+            # Keeps the use order for the next scan and for other processes.
+            os.utime(path)
+        except OSError:
+            pass
+        self._disk_used(key, len(data))
+        return data
+
+    def _open_disk(self, key: str) -> Optional[BinaryIO]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            stream = path.open("rb")
+        except FileNotFoundError:
+            self._disk_forget(key)
+            return None
+        except OSError:
+            with self._lock:
+                self._counters["disk_errors"] += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._disk_used(key, os.fstat(stream.fileno()).st_size)
+        return stream
+
+    def _disk_put(self, key: str, data: bytes) -> None:
+        if self.disk_dir is None:
+            return
+        self._disk_write(key, lambda fh: fh.write(data))
+
+    def _disk_write(self, key: str, write: Callable[[BinaryIO], object]) -> None:
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temp file and rename so readers in other processes
+            # never observe a partially written PDF.
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    write(fh)
+                    size = fh.tell()
+                os.replace(tmp_name, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_name)
+                except OSError:
+                    pass
+                raise
+        except OSError:
+            with self._lock:
+                self._counters["disk_errors"] += 1
+            return
+        self._disk_used(key, size)
+
+    def _scan_disk(self) -> None:
+        """Index the files already in the disk tier, oldest first, and prune."""
+        assert self.disk_dir is not None
+        files = []
+        for path in self.disk_dir.glob("*/*.pdf"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, path.stem, st.st_size))
+        files.sort()
+        with self._lock:
+            for _, key, size in files:
+                self._disk_entries[key] = size
+                self._disk_size += size
+        self._prune_disk()
+
+    def _disk_used(self, key: str, size: int) -> None:
+        """Record that ``key`` (``size`` bytes) was written or read."""
+        if self.max_disk_bytes is None:
+            return
+        with self._lock:
+            self._disk_size += size - self._disk_entries.pop(key, 0)
+            self._disk_entries[key] = size
+            over = self._disk_size > self.max_disk_bytes
+        if over:
+            self._prune_disk()
+
+    def _on_disk(self, key: str) -> bool:
+        return self.disk_dir is not None and self._disk_path(key).exists()
+
+    def _disk_forget(self, key: str) -> None:
+        """Drop ``key`` from the index (its file was removed by someone else)."""
+        with self._lock:
+            self._disk_size -= self._disk_entries.pop(key, 0)
+
+    def _prune_disk(self) -> None:
+        assert self.max_disk_bytes is not None
+        evicted = []
+        with self._lock:
+            while self._disk_size > self.max_disk_bytes and self._disk_entries:
+                key, size = self._disk_entries.popitem(last=False)
+                self._disk_size -= size
+                evicted.append(key)
+        for key in evicted:
+            try:
+                self._disk_path(key).unlink()
+            except FileNotFoundError:
+                continue
+            except OSError:
+                with self._lock:
+                    self._counters["disk_errors"] += 1
+                continue
+            with self._lock:
+                self._counters["disk_evictions"] += 1
@@ -0,0 +1,165 @@
+"""
+Warm render daemon for converting one file at a time.
+
+``python main.py --daemon`` imports WeasyPrint once, warms a render context
+and listens on a Unix socket. A plain ``python main.py doc.md`` first tries
+that socket: when a daemon answers, the render runs there and the CLI
+process never imports WeasyPrint, so editor integrations and scripts that
+convert single files get the result in a fraction of the cold start time.
+When nothing is listening the CLI renders in-process as before.
+
+Each connection carries one request and one reply, both single JSON lines.
+Paths are sent absolute because the daemon's working directory is not the
+client's. The socket is only usable by the user who started the daemon.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+_MAX_REQUEST_BYTES = 64 * 1024
+
+
+def default_socket_path() -> Path:
+    """``PYMARK_SOCKET``, else a per-user socket in the runtime or temp dir."""
+    configured = os.environ.get("PYMARK_SOCKET")
+    if configured:
+        return Path(configured)
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "pymark.sock"
+    return Path(tempfile.gettempdir()) / f"pymark-{os.getuid()}.sock"
+
+
+def request_render(socket_path: Path, job: Dict[str, Any], version: str) -> Optional[Dict[str, Any]]:
+    """Send ``job`` to the daemon and wait for its reply.
+
+    Returns ``None`` when no usable daemon is listening (no socket, a socket
+    owned by someone else, a daemon of another version, or a daemon that
+    went away mid-request); the caller then renders in-process.
+    """
+    if not hasattr(socket, "AF_UNIX"):  # pragma: no cover - Windows
+        return None
+    try:
+        if os.stat(socket_path).st_uid != os.getuid():
+            return None
+    except OSError:
+        return None
+
+    request = dict(job, pymark=version)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(socket_path))
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+    except OSError:
+        return None
+    if not line:
+        return None
+    reply = json.loads(line)
+    if reply.get("pymark") != version:
+        return None
+    return reply
+
+
+class RenderDaemon:
+    """Serve render requests on a Unix socket.
+
+    Args:
+        socket_path: Where to listen. A stale socket left by a daemon that
+            died is replaced; a live one raises ``RuntimeError``.
+        render: Called with each request's JSON object; an exception it
+            raises is returned to the client as the error message.
+        version: Sent with every reply. Clients ignore a daemon whose
+            version differs from their own and render in-process.
+    """
+
+    def __init__(self, socket_path: Path, render: Callable[[Dict[str, Any]], None], version: str) -> None:
+        import socketserver
+
+        self.socket_path = Path(socket_path)
+        self.render = render
+        self.version = version
+        self._lock = threading.Lock()
+        self._counters = {"renders": 0, "failed": 0}
+        self._claim_socket()
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                daemon._handle(self.rfile, self.wfile)
+
+        previous = os.umask(0o177)  # The socket is created 0600.
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), Handler)
+        finally:
+            os.umask(previous)
+        self._server.daemon_threads = True
+
+    def serve_forever(self) -> None:
+        try:
+            self._server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self) -> None:
+        """Stop ``serve_forever`` (from another thread)."""
+        self._server.shutdown()
+
+    def close(self) -> None:
+        self._server.server_close()
+        try:
+            self.socket_path.unlink()
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def _claim_socket(self) -> None:
+        if not self.socket_path.exists():
+            self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(str(self.socket_path))
+            except OSError:
+                self.socket_path.unlink()  # Left behind by a daemon that died.
+                return
+        raise RuntimeError(f"A render daemon is already listening on {self.socket_path}")
+
+    def _handle(self, rfile: Any, wfile: Any) -> None:
+        reply: Dict[str, Any] = {"pymark": self.version}
+        start = time.perf_counter()
+        try:
+            line = rfile.readline(_MAX_REQUEST_BYTES)
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError("request must be a JSON object")
+            if job.get("pymark") != self.version:
+                # The client ignores this reply and renders by itself.
+                raise ValueError(f"daemon runs pymark {self.version}")
+            self.render(job)
+            with self._lock:
+                self._counters["renders"] += 1
+            reply["ok"] = True
+        except Exception as exc:
+            with self._lock:
+                self._counters["failed"] += 1
+            reply["ok"] = False
+            reply["error"] = str(exc) or type(exc).__name__
+        reply["seconds"] = round(time.perf_counter() - start, 4)
+        try:
+            wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+        except OSError:
+            pass  # The client gave up waiting.
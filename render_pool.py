@@ -0,0 +1,289 @@
+"""
+Pre-forked pool of warm PDF render workers for the web server.
+
+A single render context serializes WeasyPrint layout, so under ``--serve``
+every export would otherwise queue behind the others on one core. The pool
+keeps ``size`` worker processes, forked from a server that has already
+imported WeasyPrint and Markdown, that parse the default stylesheets before
+taking work; each render is handed to an
+idle worker over a pipe and written to a scratch file the server streams
+from. Workers are replaced after a number of renders or when their resident
+memory passes a ceiling, and callers are turned away with ``PoolBusy`` once
+too many are already waiting.
+"""
+from __future__ import annotations
+
+import math
+import multiprocessing
+import os
+import queue
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional
+
+DEFAULT_MAX_RENDERS = 200
+DEFAULT_MAX_RSS_BYTES = 1024 * 1024 * 1024
+DEFAULT_QUEUE_DEPTH = 64
+DEFAULT_TIMEOUT = 300.0
+
+
+class PoolBusy(Exception):
+    """Raised when the render queue is full; ``retry_after`` is in seconds."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"render pool is busy, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (peak RSS if unavailable)."""
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _worker_main(conn: Any, memory_budget: Optional[int] = None) -> None:
+    """Render requests from ``conn`` until told to stop."""
+    import main
+    from memory_budget import address_space_limit, peak_rss, reset_peak_rss
+
+    # Warm everything a render touches before accepting work.
+    context = main.warm_render_context()
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        markdown_text, css_text, title, path = message
+        del message
+        start_rss = current_rss()
+        exact_peak = reset_peak_rss()
+        status, error = "ok", None
+        try:
+            # Daemonic workers cannot start section workers of their own.
+            with address_space_limit(memory_budget):
+                main.write_markdown_pdf(markdown_text, css_text, title, path, context=context, sections=False)
+        except MemoryError:
+            budget_mib = (memory_budget or 0) / (1024 * 1024)
+            status, error = "memory", f"render needs more than the {budget_mib:.0f} MiB memory budget"
+        except Exception as exc:
+            status, error = "error", f"{type(exc).__name__}: {exc}"
+        del markdown_text, css_text
+        rss = current_rss()
+        peak = (peak_rss() if exact_peak else rss) - start_rss
+        conn.send((status, error, rss, max(0, peak)))
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, ctx: Any, memory_budget: Optional[int] = None) -> None:
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child, memory_budget), daemon=True, name="pymark-render"
+        )
+        self.process.start()
+        child.close()
+        self.renders = 0
+        self.rss = 0
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=2)
+        self.conn.close()
+
+
+class RenderPool:
+    """Dispatch renders to a fixed number of warm worker processes.
+
+    Args:
+        size: Number of worker processes (defaults to the CPU count).
+        max_renders: Renders after which a worker is replaced.
+        max_rss_bytes: Resident memory after which a worker is replaced
+            (``None`` disables the check).
+        queue_depth: Most callers allowed to wait for a free worker; more
+            raise ``PoolBusy``.
+        timeout: Seconds a single render may take before its worker is
+            killed and the render fails.
+        memory_budget: Bytes a single render may allocate; past it the
+            render fails with ``MemoryBudgetExceeded`` and its worker is
+            replaced (see ``memory_budget``).
+    """
+
+    def __init__(
+        self,
+        size: Optional[int] = None,
+        max_renders: int = DEFAULT_MAX_RENDERS,
+        max_rss_bytes: Optional[int] = DEFAULT_MAX_RSS_BYTES,
+        queue_depth: int = DEFAULT_QUEUE_DEPTH,
+        timeout: float = DEFAULT_TIMEOUT,
+        memory_budget: Optional[int] = None,
+    ) -> None:
+        self.size = size or os.cpu_count() or 1
+        self.memory_budget = memory_budget
+        self.max_renders = max_renders
+        self.max_rss_bytes = max_rss_bytes
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        # Workers are forked from a single-threaded fork server that has
+        # already imported the renderer, so replacements start warm and never
+        # inherit locks held by the web server's threads.
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._ctx = multiprocessing.get_context("forkserver")
+            # main imports the render modules lazily; preload them too.
+            self._ctx.set_forkserver_preload(["main", "weasyprint", "math_renderer", "section_render"])
+        else:
+            self._ctx = multiprocessing.get_context("spawn")
+        self._scratch = Path(tempfile.mkdtemp(prefix="pymark-render-"))
+
+        self._lock = threading.Lock()
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers: list[_Worker] = []
+        self._waiting = 0
+        self._closed = False
+        self._render_seconds = 0.0
+        self._counters = {"renders": 0, "failed": 0, "rejected": 0, "recycled": 0, "crashed": 0, "over_budget": 0}
+        for _ in range(self.size):
+            self._add_worker()
+
+    # -- public API -----------------------------------------------------
+
+    def render_to(self, markdown_text: str, css_text: Optional[str], title: str, target: BinaryIO) -> int:
+        """Render on a worker and copy the PDF into ``target``.
+
+        Returns the render's peak memory growth in bytes. Raises ``PoolBusy``
+        without waiting when the queue is full, and ``MemoryBudgetExceeded``
+        when the render outgrew the memory budget.
+        """
+        worker = self._acquire()
+        path = self._scratch / f"{uuid.uuid4().hex}.pdf"
+        start = time.perf_counter()
+        status, error, peak = "crashed", "render worker exited unexpectedly", 0
+        try:
+            worker.conn.send((markdown_text, css_text, title, str(path)))
+            if worker.conn.poll(self.timeout):
+                status, error, worker.rss, peak = worker.conn.recv()
+            else:
+                status, error = "crashed", f"render timed out after {self.timeout:.0f}s"
+        except (EOFError, OSError):
+            pass
+        finally:
+            self._release(worker, time.perf_counter() - start, status)
+
+        try:
+            if status == "memory":
+                from memory_budget import MemoryBudgetExceeded
+
+                raise MemoryBudgetExceeded(error)
+            if status != "ok":
+                raise RuntimeError(error)
+            with path.open("rb") as fh:
+                shutil.copyfileobj(fh, target, 256 * 1024)
+            return peak
+        finally:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["size"] = self.size
+            stats["idle"] = self._idle.qsize()
+            stats["waiting"] = self._waiting
+            stats["queue_depth"] = self.queue_depth
+            stats["mean_render_seconds"] = round(self._mean_render_seconds(), 4)
+            stats["worker_rss_bytes"] = [worker.rss for worker in self._workers]
+        return stats
+
+    def close(self) -> None:
+        """Stop every worker and remove the scratch directory."""
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+        shutil.rmtree(self._scratch, ignore_errors=True)
+
+    # -- dispatch -------------------------------------------------------
+
+    def _acquire(self) -> _Worker:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("render pool is closed")
+            if self._idle.empty() and self._waiting >= self.queue_depth:
+                self._counters["rejected"] += 1
+                raise PoolBusy(self._retry_after())
+            self._waiting += 1
+        try:
+            return self._idle.get()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def _release(self, worker: _Worker, seconds: float, status: str) -> None:
+        worker.renders += 1
+        crashed = status == "crashed"
+        with self._lock:
+            self._render_seconds += seconds
+            self._counters["renders"] += 1
+            if status == "memory":
+                self._counters["over_budget"] += 1
+            elif status != "ok":
+                self._counters["crashed" if crashed else "failed"] += 1
+            closed = self._closed
+        # A worker that hit its memory budget is left fragmented: replace it.
+        exhausted = worker.renders >= self.max_renders or status == "memory" or (
+            self.max_rss_bytes is not None and worker.rss > self.max_rss_bytes
+        )
+        if crashed or exhausted or closed:
+            self._retire(worker, recycled=exhausted and not crashed, kill=crashed)
+            if not closed:
+                self._add_worker()
+            return
+        self._idle.put(worker)
+
+    def _add_worker(self) -> None:
+        worker = _Worker(self._ctx, self.memory_budget)
+        with self._lock:
+            self._workers.append(worker)
+        self._idle.put(worker)
+
+    def _retire(self, worker: _Worker, recycled: bool, kill: bool) -> None:
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            if recycled:
+                self._counters["recycled"] += 1
+        if kill and worker.process.is_alive():
+            # A timed-out worker may be stuck in layout; don't wait for it.
+            worker.process.kill()
+        worker.stop()
+
+    def _mean_render_seconds(self) -> float:
+        renders = self._counters["renders"]
+        return self._render_seconds / renders if renders else 1.0
+
+    def _retry_after(self) -> int:
+        # Time for the workers to drain the current queue, at least a second.
+        backlog = self._waiting + self.size
+        return max(1, math.ceil(backlog * self._mean_render_seconds() / self.size))
@@ -0,0 +1,311 @@
+"""
+Parallel layout of very large documents.
+
+WeasyPrint lays out a document on one core and keeps every page of it in
+memory. Past a size threshold the HTML of a document is cut at its
+top-level headings, the sections are laid out concurrently in worker
+processes and the resulting PDFs are merged (with pypdf) into one file:
+
+* bookmarks come from each section's outline, appended in order;
+* internal links are rewritten to ``pymark-anchor:`` URIs before layout
+  and turned back into page destinations once every anchor's final page
+  is known, so links across sections keep working;
+* page margin boxes (page numbers, "page X of Y") are blanked in the
+  sections and stamped afterwards from a layout of the merged page count,
+  so counters run across the whole document.
+
+Each section starts on a new page. pypdf is optional (and only imported
+when a document is split); without it large documents are laid out in one
+piece as before.
+"""
+from __future__ import annotations
+
+import importlib.util
+import io
+import math
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+LARGE_DOCUMENT_CHARS = 300_000
+MIN_SECTION_CHARS = 20_000
+ANCHOR_SCHEME = "pymark-anchor:"
+# One CSS pixel is 0.75 PDF points.
+_PX_TO_PT = 0.75
+
+_HEADING = re.compile(r"^<h([1-6])[\s>]", re.MULTILINE)
+_CONTAINER_OPEN = re.compile(r"<(?:div|table|blockquote|details|section|ol|ul|dl)\b", re.IGNORECASE)
+_CONTAINER_CLOSE = re.compile(r"</(?:div|table|blockquote|details|section|ol|ul|dl)\s*>", re.IGNORECASE)
+_LOCAL_HREF = re.compile(r'href="#([^"]*)"')
+_MARGIN_BOX = re.compile(r"@(?:top|bottom|left|right)-")
+
+_MARGIN_BOXES = [
+    f"{edge}-{part}"
+    for edge, parts in (
+        ("top", ("left-corner", "left", "center", "right", "right-corner")),
+        ("bottom", ("left-corner", "left", "center", "right", "right-corner")),
+        ("left", ("top", "middle", "bottom")),
+        ("right", ("top", "middle", "bottom")),
+    )
+    for part in parts
+]
+# Sections are laid out without margin boxes; they are stamped on the merged
+# document so page counters are global.
+NO_MARGIN_BOXES_CSS = "@page { %s }" % " ".join(f"@{box} {{ content: none !important }}" for box in _MARGIN_BOXES)
+# The stamp layout must not paint over the page content beneath it.
+STAMP_CSS = "@page { background: none !important } html, body { background: none !important }"
+
+
+def sections_available() -> bool:
+    # pypdf is optional and slow to import, so only look for it here.
+    return importlib.util.find_spec("pypdf") is not None
+
+
+def section_threshold() -> int:
+    """Character count above which documents are laid out in sections."""
+    value = os.environ.get("PYMARK_SECTION_THRESHOLD")
+    return int(value) if value else LARGE_DOCUMENT_CHARS
+
+
+def should_split(markdown_text: str) -> bool:
+    """Whether ``auto`` mode lays ``markdown_text`` out in parallel sections."""
+    return sections_available() and (os.cpu_count() or 1) > 1 and len(markdown_text) >= section_threshold()
+
+
+def split_html_sections(body: str) -> List[str]:
+    """Cut rendered HTML before each top-level heading.
+
+    The top level is the highest heading level used more than once (so a
+    single title heading stays with the first section). Headings nested in
+    raw HTML containers (a ``<div>``, a table, a list) are never cut at.
+    """
+    headings = list(_HEADING.finditer(body))
+    if not headings:
+        return [body]
+    counts: Dict[int, int] = {}
+    for match in headings:
+        counts[int(match.group(1))] = counts.get(int(match.group(1)), 0) + 1
+    # A lone title heading does not make sections; cut at the highest level
+    # that repeats.
+    level = min((lvl for lvl, count in counts.items() if count > 1), default=min(counts))
+    cuts = [0]
+    depth = 0
+    last = 0
+    for match in headings:
+        if int(match.group(1)) != level or match.start() == 0:
+            continue
+        segment = body[last:match.start()]
+        depth += len(_CONTAINER_OPEN.findall(segment)) - len(_CONTAINER_CLOSE.findall(segment))
+        last = match.start()
+        if depth <= 0:
+            cuts.append(match.start())
+    cuts.append(len(body))
+    return [body[start:end] for start, end in zip(cuts, cuts[1:]) if body[start:end].strip()]
+
+
+def pack_sections(sections: List[str], parts: int, min_chars: int = MIN_SECTION_CHARS) -> List[str]:
+    """Join consecutive sections into about ``parts`` chunks of similar size."""
+    total = sum(len(section) for section in sections)
+    target = max(min_chars, math.ceil(total / max(parts, 1)))
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for section in sections:
+        if current and size + len(section) > target:
+            chunks.append("".join(current))
+            current, size = [], 0
+        current.append(section)
+        size += len(section)
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _link_anchors(html: str) -> str:
+    return _LOCAL_HREF.sub(lambda match: f'href="{ANCHOR_SCHEME}{match.group(1)}"', html)
+
+
+def _layout_section(
+    html: str,
+    css_text: Optional[str],
+    css_path: Optional[str],
+    base_url: Optional[str],
+    out_path: str,
+    blank_margins: bool,
+) -> Tuple[int, Dict[str, Tuple[int, float, float]]]:
+    """Lay out one section into ``out_path``; return its page count and anchors.
+
+    Anchors map each element id to ``(page, x, y)`` in PDF points with the
+    origin at the bottom left, as a PDF ``/XYZ`` destination expects.
+    """
+    import main
+
+    context = main.default_render_context()
+    document = context.render_document(
+        html,
+        css_text=css_text,
+        css_path=Path(css_path) if css_path else None,
+        base_url=base_url,
+        extra_css=NO_MARGIN_BOXES_CSS if blank_margins else None,
+    )
+    anchors: Dict[str, Tuple[int, float, float]] = {}
+    for index, page in enumerate(document.pages):
+        for name, (x, y) in page.anchors.items():
+            anchors.setdefault(name, (index, x * _PX_TO_PT, (page.height - y) * _PX_TO_PT))
+    document.write_pdf(out_path)
+    return len(document.pages), anchors
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_jobs = 0
+_executor_lock = threading.Lock()
+
+
+def _section_executor(jobs: int) -> ProcessPoolExecutor:
+    """Return a process pool of warm render workers, kept for later documents."""
+    global _executor, _executor_jobs
+    from batch import _init_worker
+
+    with _executor_lock:
+        if _executor is None or _executor_jobs != jobs:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _executor = ProcessPoolExecutor(max_workers=jobs, mp_context=ctx, initializer=_init_worker)
+            _executor_jobs = jobs
+        return _executor
+
+
+def render_sections(
+    body_html: str,
+    wrap: Callable[[str], str],
+    target: Any,
+    context: Any,
+    title: str,
+    css_text: Optional[str] = None,
+    css_path: Optional[Path] = None,
+    base_url: Optional[str] = None,
+    jobs: Optional[int] = None,
+) -> int:
+    """Lay ``body_html`` out in parallel sections and write the merged PDF.
+
+    ``wrap`` turns a section's body into a full HTML page and ``context`` is
+    the ``RenderContext`` used for the page-number stamp. ``target`` is a
+    path or a writable binary file. Returns the number of sections.
+    """
+    try:
+        from pypdf import PdfWriter
+    except ImportError:  # pragma: no cover
+        raise RuntimeError("Sectioned rendering needs pypdf. Install with `pip install pypdf`.") from None
+
+    jobs = jobs or os.cpu_count() or 1
+    chunks = pack_sections(split_html_sections(body_html), jobs)
+    stylesheet_text = css_path.read_text(encoding="utf-8") if css_path is not None else (css_text or "")
+    if css_path is None and not css_text:
+        from main import DEFAULT_CSS
+
+        stylesheet_text = DEFAULT_CSS
+    stamp = _MARGIN_BOX.search(stylesheet_text) is not None
+
+    with tempfile.TemporaryDirectory(prefix="pymark-sections-") as scratch:
+        paths = [os.path.join(scratch, f"section-{index:04d}.pdf") for index in range(len(chunks))]
+        executor = _section_executor(jobs)
+        futures = [
+            executor.submit(
+                _layout_section,
+                _link_anchors(wrap(chunk)),
+                css_text,
+                str(css_path) if css_path is not None else None,
+                base_url,
+                path,
+                stamp,
+            )
+            for chunk, path in zip(chunks, paths)
+        ]
+        results = [future.result() for future in futures]
+
+        writer = PdfWriter()
+        anchors: Dict[str, Tuple[int, float, float]] = {}
+        for path, (_, section_anchors) in zip(paths, results):
+            offset = len(writer.pages)
+            writer.append(path, import_outline=True)
+            for name, (page, x, y) in section_anchors.items():
+                anchors.setdefault(name, (offset + page, x, y))
+
+    _resolve_links(writer, anchors)
+    if stamp:
+        _stamp_margin_boxes(writer, context, css_text, css_path, base_url)
+    writer.add_metadata({"/Title": title})
+
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, "wb") as fh:
+            writer.write(fh)
+    else:
+        writer.write(target)
+    return len(chunks)
+
+
+def _resolve_links(writer: Any, anchors: Dict[str, Tuple[int, float, float]]) -> None:
+    """Point ``pymark-anchor:`` links at their target's final page."""
+    from pypdf.generic import ArrayObject, FloatObject, NameObject, NumberObject
+
+    for page in writer.pages:
+        annotations = page.get("/Annots")
+        if annotations is None:
+            continue
+        for reference in annotations.get_object():
+            annotation = reference.get_object()
+            action = annotation.get("/A")
+            if action is None:
+                continue
+            uri = action.get_object().get("/URI")
+            if isinstance(uri, bytes):
+                uri = uri.decode("latin-1")
+            if not isinstance(uri, str) or not uri.startswith(ANCHOR_SCHEME):
+                continue
+            del annotation["/A"]
+            destination = anchors.get(unquote(uri[len(ANCHOR_SCHEME):]))
+            if destination is None:
+                continue  # Dangling link: leave it inert, as a single layout would.
+            index, x, y = destination
+            annotation[NameObject("/Dest")] = ArrayObject([
+                writer.pages[index].indirect_reference,
+                NameObject("/XYZ"),
+                FloatObject(x),
+                FloatObject(y),
+                NumberObject(0),
+            ])
+
+
+def _stamp_margin_boxes(
+    writer: Any,
+    context: Any,
+    css_text: Optional[str],
+    css_path: Optional[Path],
+    base_url: Optional[str],
+) -> None:
+    """Overlay the stylesheet's margin boxes, laid out for the merged page count."""
+    from pypdf import PdfReader
+
+    count = len(writer.pages)
+    pages = '<div style="height: 1px"></div>' + '<div style="break-before: page; height: 1px"></div>' * (count - 1)
+    document = context.render_document(
+        f"<!doctype html><html><body>{pages}</body></html>",
+        css_text=css_text,
+        css_path=css_path,
+        base_url=base_url,
+        extra_css=STAMP_CSS,
+    )
+    buffer = io.BytesIO()
+    document.write_pdf(buffer)
+    buffer.seek(0)
+    overlay = PdfReader(buffer)
+    for page, stamp in zip(writer.pages, overlay.pages):
+        page.merge_page(stamp)
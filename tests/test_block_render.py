@@ -0,0 +1,32 @@
+"""Block-by-block rendering must match a whole-document render."""
+import sys
+from pathlib import Path
+
+import markdown
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from block_render import BlockRenderer  # noqa: E402
+from markdown_pool import DEFAULT_EXTENSIONS  # noqa: E402
+
+
+def render(text: str) -> str:
+    return markdown.Markdown(extensions=list(DEFAULT_EXTENSIONS)).convert(text)
+
+
+@pytest.mark.parametrize("text", [
+    "Intro\n\n<!-- a\n\nb -->\n\nafter",
+    "<!--\nfirst\n\nsecond\n-->\n\nText",
+    "para\n<!-- x\n\ny -->\n\nz",
+    "<!-- a -->\n<!-- b\n\nc -->\n\nd",
+    "- item\n\n  <!-- c\n\n  d -->\n\ne",
+    "<!-- one --> text\n\nmore",
+    '<div markdown="1">\nA\n\nB\n</div>\n\nC',
+    '<div markdown="1">\n# Head\n\nbody\n\n<div>\ninner\n</div>\n\ntail *em*\n</div>\n\nafter',
+    '<div markdown="1">\n```\n</div>\n\n```\n</div>\n\nafter',
+    "<div>\n<div>\nx\n</div>\n\ny\n</div>\n\nz",
+    "<p>raw</p>\n[r]: http://x\n\nsee [r]",
+])
+def test_blocks_match_whole_document(text):
+    assert BlockRenderer(render).render(text).html == render(text)
@@ -0,0 +1,35 @@
+"""Incremental linting must agree with linting the whole text."""
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from latex_lint import LintDocument, lint_latex  # noqa: E402
+
+PIECES = ["$$", "\\[", "\\]", "\\(", "\\)", "{", "}", "x", "\\frac", "\\nope", "$a$", "$", "```", "~~~", "text", " "]
+
+
+def random_line(rng: random.Random) -> str:
+    return "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 4)))
+
+
+def random_text(rng: random.Random, lines: int) -> str:
+    return "\n".join(random_line(rng) for _ in range(lines))
+
+
+def test_edits_match_full_lint():
+    rng = random.Random(20240601)
+    for _ in range(3000):
+        document = LintDocument(random_text(rng, rng.randint(1, 12)))
+        for _ in range(rng.randint(1, 4)):
+            lines = document.text.split("\n")
+            start_line = rng.randrange(len(lines))
+            end_line = rng.randint(start_line, min(len(lines) - 1, start_line + 3))
+            start_column = rng.randint(0, len(lines[start_line]))
+            end_column = rng.randint(0, len(lines[end_line]))
+            if end_line == start_line and end_column < start_column:
+                start_column, end_column = end_column, start_column
+            text = random_text(rng, rng.randint(1, 3)) if rng.random() < 0.5 else random_line(rng)
+            document.edit((start_line, start_column), (end_line, end_column), text)
+            assert document.diagnostics() == lint_latex(document.text), document.text